@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+"""
+End-to-end benchmark of BrewThermometerApp's read cycle against a simulated 1-Wire device tree (see simulated_w1).
+
+The app is built from a generated configuration pointing devices_root at the simulated tree, then driven through
+run_once() with every thermometer due on each cycle, so a cycle is one read of every sensor followed by handing the
+readings to the publisher. Readings go through the reading queue and the outbox as usual, but are acknowledged by a
+stand-in reporter instead of an MQTT broker, so only the daemon's own work is measured.
+
+Reported: cycles per second, per-read latency percentiles, CPU time per cycle, peak RSS and per-bus read stats. Samples
+come from a seeded generator and the parameters are printed with the results (or emitted as JSON with --json, alongside
+the commit being measured), so runs are comparable across commits.
+
+Usage: python -m benchmarks.app_cycle_benchmark [--sensors N] [--buses N] [--read-mode MODE] [--conversion-ms MS] ...
+"""
+import argparse
+import json
+import logging
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from time import monotonic
+from unittest.mock import patch
+from benchmarks.simulated_w1 import SimulatedW1Tree
+from brew_thermometer.brew_thermometer_app import BrewThermometerApp
+from brew_thermometer.configuration import BREW_THERMOMETER_CONFIG_ENV_VAR, BREW_THERMOMETER_DEV_FLAG, READ_MODES, \
+    DEFAULT_READ_MODE, DEFAULT_READ_WORKER_COUNT
+from brew_thermometer.outbox import IN_MEMORY_PATH
+from brew_thermometer.thermometer_reader import ThermometerReader
+
+
+DEFAULT_CYCLES = 200
+DEFAULT_SENSORS = 8
+READ_INTERVAL_SECONDS = 30
+PERCENTILES = (50, 90, 99)
+
+
+class AcknowledgingReporter:
+    """
+    Stands in for AwsIotReporter, acknowledging everything in the outbox as soon as it is drained.
+    """
+
+    def __init__(self, outbox):
+        self._outbox = outbox
+
+    def drain(self, force=False):
+        rows = self._outbox.peek(len(self._outbox))
+        self._outbox.remove([reading_id for reading_id, _ in rows])
+        return [payload for _, payload in rows]
+
+    def seconds_until_flush(self):
+        return None
+
+    def get_connection_stats(self):
+        return {'state': 'connected', 'connected': True}
+
+
+class VirtualClock:
+    """
+    A scheduler clock advanced by a whole read interval per cycle, so every thermometer is due on every cycle.
+    """
+
+    def __init__(self):
+        self.now = monotonic()
+
+    def __call__(self):
+        return self.now
+
+
+def build_config(tree, args):
+    return {
+        'log_level': 'error',
+        'read_interval_seconds': READ_INTERVAL_SECONDS,
+        'read_mode': args.read_mode,
+        'read_worker_count': args.workers,
+        'devices_root': tree.root,
+        'outbox_path': IN_MEMORY_PATH,
+        'instrumentation': args.instrumentation,
+        'discovery': args.discovery,
+        'thermometers': [{'id': sensor_id, 'description': sensor_id} for sensor_id in tree.sensor_ids],
+        'aws_iot_configuration': {
+            'host': 'localhost',
+            'port': 8883,
+            'certificate_authority_cert_file_path': '',
+            'cert_file_path': '',
+            'private_key_path': '',
+            'topic_name': 'temperature',
+        },
+    }
+
+
+def percentile(sorted_values, percent):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(percent / 100.0 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def get_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmark(args):
+    # simulated CRC failures and outliers are expected; keep the warnings they cause out of the results
+    logging.getLogger('brew_thermometer').setLevel(logging.ERROR)
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        tree = SimulatedW1Tree(
+            os.path.join(work_dir, 'devices'), args.sensors, args.buses, args.conversion_ms / 1000.0,
+            args.bus_transaction_ms / 1000.0, args.crc_failure_rate, args.outlier_rate, args.negative_fraction,
+            args.seed
+        )
+        config_path = os.path.join(work_dir, 'config.json')
+        with open(config_path, 'w') as config_file:
+            json.dump(build_config(tree, args), config_file)
+
+        read_latencies = []
+        timed_read = ThermometerReader._timed_read
+
+        def recording_timed_read(reader, thermometer_id):
+            result = timed_read(reader, thermometer_id)
+            read_latencies.append(result[1])
+            return result
+
+        environment = {BREW_THERMOMETER_CONFIG_ENV_VAR: config_path, BREW_THERMOMETER_DEV_FLAG: '1'}
+        with patch.dict(os.environ, environment), tree.install(), \
+                patch.object(ThermometerReader, '_timed_read', recording_timed_read):
+            app = BrewThermometerApp()
+            clock = VirtualClock()
+            app._read_scheduler._clock = clock
+            reporter = AcknowledgingReporter(app._outbox)
+            app._temperature_reporter = reporter
+            app._publisher._reporter = reporter
+            app._publisher.start()
+
+            for _ in range(args.warmup):
+                app.run_once()
+                clock.now += READ_INTERVAL_SECONDS
+            del read_latencies[:]
+
+            usage_before = resource.getrusage(resource.RUSAGE_SELF)
+            started = time.perf_counter()
+            for _ in range(args.cycles):
+                app.run_once()
+                clock.now += READ_INTERVAL_SECONDS
+            elapsed_seconds = time.perf_counter() - started
+            usage_after = resource.getrusage(resource.RUSAGE_SELF)
+            bus_stats = app._thermometer_reader.get_bus_stats()
+
+            app._publisher.stop()
+            app._outbox.close()
+        tree.close()
+
+    cpu_seconds = (usage_after.ru_utime - usage_before.ru_utime) + (usage_after.ru_stime - usage_before.ru_stime)
+    read_latencies.sort()
+    return {
+        'commit': get_commit(),
+        'parameters': {key: value for key, value in sorted(vars(args).items()) if key != 'json'},
+        'cycles_per_second': args.cycles / elapsed_seconds,
+        'reads_per_second': len(read_latencies) / elapsed_seconds,
+        'read_latency_ms': {
+            'p{}'.format(percent): percentile(read_latencies, percent) * 1000 if read_latencies else None
+            for percent in PERCENTILES
+        },
+        'cpu_ms_per_cycle': cpu_seconds / args.cycles * 1000,
+        'cpu_utilization': cpu_seconds / elapsed_seconds,
+        'peak_rss_kb': usage_after.ru_maxrss,
+        'buses': bus_stats,
+    }
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Benchmark the daemon's read cycle against simulated sensors")
+    parser.add_argument('--cycles', type=int, default=DEFAULT_CYCLES)
+    parser.add_argument('--warmup', type=int, default=5)
+    parser.add_argument('--sensors', type=int, default=DEFAULT_SENSORS)
+    parser.add_argument('--buses', type=int, default=1)
+    parser.add_argument('--read-mode', choices=READ_MODES, default=DEFAULT_READ_MODE)
+    parser.add_argument('--workers', type=int, default=DEFAULT_READ_WORKER_COUNT)
+    parser.add_argument('--conversion-ms', type=float, default=0.0,
+                        help="simulated conversion time; 750 matches a DS18B20 at 12 bits")
+    parser.add_argument('--bus-transaction-ms', type=float, default=0.0,
+                        help="time each read holds its bus, serializing reads on the same bus")
+    parser.add_argument('--crc-failure-rate', type=float, default=0.0)
+    parser.add_argument('--outlier-rate', type=float, default=0.0)
+    parser.add_argument('--negative-fraction', type=float, default=0.0)
+    parser.add_argument('--instrumentation', action='store_true')
+    parser.add_argument('--discovery', action='store_true', help="find the sensors by discovery rather than config")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', action='store_true', help="print the results as JSON")
+    return parser.parse_args(argv)
+
+
+def main(argv):
+    args = parse_args(argv)
+    results = run_benchmark(args)
+    if args.json:
+        print(json.dumps(results, sort_keys=True))
+        return
+
+    print("commit: {}".format(results['commit']))
+    print("parameters: {}".format(", ".join("{}={}".format(k, v) for k, v in results['parameters'].items())))
+    print("cycles/s:          {:10.2f}".format(results['cycles_per_second']))
+    print("reads/s:           {:10.2f}".format(results['reads_per_second']))
+    for name, latency_ms in iter(results['read_latency_ms'].items()):
+        print("read latency {}:  {:10.3f} ms".format(name, latency_ms))
+    print("CPU per cycle:     {:10.3f} ms ({:.0%} of one core)".format(results['cpu_ms_per_cycle'],
+                                                                       results['cpu_utilization']))
+    print("peak RSS:          {:10d} KB".format(results['peak_rss_kb']))
+    for master_name, stats in sorted(results['buses'].items()):
+        print("{}: {} thermometers, {} reads, {} failures, {:.1f} reads/s".format(
+            master_name, stats['thermometers'], stats['reads'], stats['failures'], stats['reads_per_second'] or 0.0))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
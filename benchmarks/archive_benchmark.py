@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Fills a ReadingArchive with simulated readings -- by default a dozen probes sampled every second for 30 days, with
+the archive's clock advanced in step so it flushes every simulated minute -- then times queries against it: a raw
+hour of one probe, and the whole period downsampled to hourly buckets, both from the segments' summary indexes and
+(with a bucket that is not a multiple of the index bucket) from the raw records.
+
+Reported: append throughput, bytes on disk per day, and the bytes the process wrote to storage per reading (from
+/proc/self/io, where available) as a measure of write amplification.
+
+Usage: python -m benchmarks.archive_benchmark [--days N] [--probes N] [--interval S] [--dir PATH]
+"""
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+from brew_thermometer.reading_archive import ReadingArchive, RECORD
+from tests.test_read_scheduler import FakeClock
+
+
+START = 1700000000
+SECONDS_PER_DAY = 24 * 60 * 60
+
+
+def read_write_bytes():
+    """
+    Returns the bytes this process has caused to be written to storage, or None where the kernel does not report it.
+    """
+    try:
+        with open('/proc/self/io') as io_file:
+            for line in io_file:
+                if line.startswith('write_bytes:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def directory_size(directory):
+    return sum(os.stat(os.path.join(directory, name)).st_blocks * 512 for name in os.listdir(directory))
+
+
+def time_call(function, repeat=5):
+    best = None
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = function()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Benchmark the reading archive")
+    parser.add_argument('--days', type=float, default=30)
+    parser.add_argument('--probes', type=int, default=12)
+    parser.add_argument('--interval', type=float, default=1.0, help="seconds between readings of each probe")
+    parser.add_argument('--dir', help="directory to build the archive in, e.g. on the SD card; defaults to a temp dir")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory(dir=args.dir) as archive_dir:
+        clock = FakeClock()
+        archive = ReadingArchive(archive_dir, logging.getLogger('brew_thermometer.archive_benchmark'), clock=clock)
+        probe_ids = ["28-0000075edd{:02x}".format(probe) for probe in range(args.probes)]
+        steps = int(args.days * SECONDS_PER_DAY / args.interval)
+        write_bytes_before = read_write_bytes()
+        started = time.perf_counter()
+        for step in range(steps):
+            clock.now = step * args.interval
+            archive.append({probe_id: 18.0 + probe * 0.5 + (step % 64) * 0.0625
+                            for probe, probe_id in enumerate(probe_ids)}, START + step * args.interval)
+        archive.flush()
+        os.sync()
+        append_seconds = time.perf_counter() - started
+        write_bytes_after = read_write_bytes()
+        readings = steps * args.probes
+
+        end = START + steps * args.interval
+        raw_seconds, raw = time_call(lambda: archive.query(probe_ids[0], end - 3600, end))
+        indexed_seconds, indexed = time_call(lambda: archive.query_downsampled(probe_ids[0], START, end, 3600), 3)
+        scan_seconds, scanned = time_call(lambda: archive.query_downsampled(probe_ids[0], START, end, 3601), 1)
+        stats = archive.get_stats()
+        disk_bytes = directory_size(archive_dir)
+        archive.close()
+
+    print("readings:                    {:>12d} ({} probes every {}s for {} days)".format(
+        readings, args.probes, args.interval, args.days))
+    print("appends/s:                   {:>12.0f}".format(readings / append_seconds))
+    print("segments:                    {:>12d}".format(stats['segments']))
+    print("bytes on disk per day:       {:>12.0f} ({} bytes per record)".format(
+        disk_bytes / args.days, RECORD.size))
+    if write_bytes_before is not None and write_bytes_after is not None:
+        print("bytes written per reading:   {:>12.2f}".format((write_bytes_after - write_bytes_before) / readings))
+    print("raw hour query:              {:>12.2f} ms ({} readings)".format(raw_seconds * 1000, len(raw)))
+    print("hourly query from indexes:   {:>12.2f} ms ({} buckets)".format(indexed_seconds * 1000, len(indexed)))
+    print("hourly query from records:   {:>12.2f} ms ({} buckets)".format(scan_seconds * 1000, len(scanned)))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
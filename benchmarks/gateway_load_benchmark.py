@@ -0,0 +1,285 @@
+#!/usr/bin/env python3
+"""
+Load test of gateway mode with several daemons on one machine: each client runs in its own process, with the
+publishing path of a daemon in gateway client mode (ReadingQueue -> Publisher -> Outbox -> GatewayReporter), and hands
+its readings to a GatewayServer in this process, which publishes them upstream over a single connection to an
+in-process MQTT broker stand-in (see mqtt_broker_stand_in). With --direct each client publishes to the broker itself
+instead, as without a gateway, for comparison.
+
+The gateway can be taken down for part of the run (--outage-at, --outage-seconds) or never started (--no-gateway) to
+see the clients fall back to publishing directly and return to the gateway once it is back.
+
+Reported: upstream connections (TLS handshakes with --tls), MQTT messages and readings per message at the broker,
+readings the clients had acknowledged and how many times they fell back, and readings still unacknowledged at the end.
+
+Usage: python -m benchmarks.gateway_load_benchmark [--clients N] [--rate N] [--duration S] [--transport unix|udp]
+       [--direct] [--no-gateway] [--outage-at S --outage-seconds S] [--tls] ...
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import tempfile
+import threading
+import time
+from benchmarks.app_cycle_benchmark import percentile, get_commit
+from benchmarks.mqtt_broker_stand_in import MqttBrokerStandIn, create_test_certificates, create_server_ssl_context
+from benchmarks.reporter_load_benchmark import RecordingPublisher
+from brew_thermometer.aws_iot_reporter import AwsIotReporter
+from brew_thermometer.gateway import GatewayServer, TRANSPORTS, TRANSPORT_UNIX, DEFAULT_GATEWAY_PORT
+from brew_thermometer.gateway_reporter import GatewayReporter
+from brew_thermometer.outbox import Outbox, IN_MEMORY_PATH
+from brew_thermometer.publisher import ReadingQueue, QUEUE_POLICY_DROP_OLDEST
+
+
+SENSORS_PER_CLIENT = 4
+OUTBOX_MAX_READINGS = 10 ** 7
+QUEUE_SIZE = 10 ** 5
+
+
+def build_upstream_config(port, certificates, batch_size, linger_seconds):
+    return {
+        'host': '127.0.0.1',
+        'port': port,
+        'topic_name': 'temperature',
+        'tls': certificates is not None,
+        'certificate_authority_cert_file_path': certificates['ca'] if certificates else '',
+        'cert_file_path': certificates['client_cert'] if certificates else '',
+        'private_key_path': certificates['client_key'] if certificates else '',
+        'max_batch_size': batch_size,
+        'max_linger_seconds': linger_seconds,
+        'drain_retry_seconds': 1.0,
+        'reconnect_min_delay_seconds': 0.2,
+        'reconnect_max_delay_seconds': 5,
+    }
+
+
+def build_gateway_config(args, work_dir):
+    return {
+        'transport': args.transport,
+        'socket_path': os.path.join(work_dir, 'gateway.sock'),
+        'host': '127.0.0.1',
+        'port': args.port,
+        'max_batch_size': args.client_batch_size,
+        'max_linger_seconds': args.client_linger,
+        'ack_timeout_seconds': args.ack_timeout,
+        'retry_seconds': args.retry,
+    }
+
+
+def run_client(client_number, args, gateway_config, upstream_config, results):
+    """
+    Runs one daemon's publishing path in a child process, offering readings at args.rate for args.duration and then
+    waiting up to args.settle seconds for them to be acknowledged.
+    """
+    logging.getLogger('brew_thermometer').setLevel(logging.CRITICAL)
+    logger = logging.getLogger('brew_thermometer.gateway_load_test.client{}'.format(client_number))
+    outbox = Outbox(IN_MEMORY_PATH, OUTBOX_MAX_READINGS, 0, logger)
+    if args.direct:
+        reporter = AwsIotReporter(upstream_config, logger, outbox)
+    else:
+        reporter = GatewayReporter(gateway_config, logger, outbox,
+                                   lambda: AwsIotReporter(upstream_config, logger, outbox))
+    reading_queue = ReadingQueue(QUEUE_SIZE, QUEUE_POLICY_DROP_OLDEST)
+    publisher = RecordingPublisher(reading_queue, outbox, reporter, None, logger)
+    publisher.start()
+
+    count = int(args.rate * args.duration)
+    started = time.monotonic()
+    for i in range(count):
+        wait_seconds = started + i / args.rate - time.monotonic()
+        if wait_seconds > 0:
+            time.sleep(wait_seconds)
+        sensor = i % SENSORS_PER_CLIENT
+        reading_queue.put({
+            "thermometer_id": "28-00000{:02x}edd{:02x}".format(client_number, sensor),
+            "description": "Chamber {} probe {}".format(client_number, sensor),
+            "temperature_degrees_celsius": 18.0 + sensor * 0.5 + (i // SENSORS_PER_CLIENT % 16) * 0.0625,
+            "timestamp": time.time(),
+        })
+
+    settle_deadline = time.monotonic() + args.settle
+    while (len(reading_queue) or len(outbox)) and time.monotonic() < settle_deadline:
+        time.sleep(0.05)
+
+    publisher.stop()
+    connection_stats = reporter.get_connection_stats()
+    reporter.stop(timeout=5)
+    latencies = sorted(publisher.latencies)
+    results.put({
+        'client': client_number,
+        'offered': count,
+        'acknowledged': len(latencies),
+        'unacknowledged': len(outbox) + len(reading_queue),
+        'p50_latency_ms': percentile(latencies, 50) * 1000 if latencies else None,
+        'p99_latency_ms': percentile(latencies, 99) * 1000 if latencies else None,
+        'connection': connection_stats,
+    })
+    outbox.close()
+
+
+class Gateway:
+    """
+    The gateway daemon's side of the test: a GatewayServer feeding the readings it receives to a publisher with a
+    single upstream connection. The server can be stopped and restarted to simulate an outage.
+    """
+
+    def __init__(self, gateway_config, upstream_config, logger):
+        self._gateway_config = gateway_config
+        self._logger = logger
+        self.outbox = Outbox(IN_MEMORY_PATH, OUTBOX_MAX_READINGS, 0, logger)
+        self.reporter = AwsIotReporter(upstream_config, logger, self.outbox)
+        self.reading_queue = ReadingQueue(QUEUE_SIZE, QUEUE_POLICY_DROP_OLDEST)
+        self.publisher = RecordingPublisher(self.reading_queue, self.outbox, self.reporter, None, logger)
+        self.server = None
+        self.received = 0
+
+    def start_server(self):
+        self.server = GatewayServer(self._gateway_config, self._logger, self._queue_payloads)
+        self.server.start()
+
+    def stop_server(self):
+        self.received += self.server.get_stats()['readings_received']
+        self.server.stop(timeout=5)
+        self.server = None
+
+    def _queue_payloads(self, payload_hashes):
+        for payload_hash in payload_hashes:
+            self.reading_queue.put(payload_hash)
+
+
+def run_outage(gateway, args):
+    time.sleep(args.outage_at)
+    gateway.stop_server()
+    time.sleep(args.outage_seconds)
+    gateway.start_server()
+
+
+def run_load_test(args, work_dir):
+    logger = logging.getLogger('brew_thermometer.gateway_load_test')
+    certificates = create_test_certificates(work_dir) if args.tls else None
+    broker = MqttBrokerStandIn(ssl_context=create_server_ssl_context(certificates) if certificates else None)
+    upstream_readings = [0]
+
+    def count_readings(topic, payload):
+        body = json.loads(payload)
+        upstream_readings[0] += len(body['readings']) if 'readings' in body else 1
+
+    broker.set_payload_listener(count_readings)
+    port = broker.start()
+    gateway_config = build_gateway_config(args, work_dir)
+    gateway = None
+    outage_thread = None
+    if not args.direct:
+        gateway = Gateway(gateway_config,
+                          build_upstream_config(port, certificates, args.upstream_batch_size, args.upstream_linger),
+                          logger)
+        gateway.publisher.start()
+        if not args.no_gateway:
+            gateway.start_server()
+            if args.outage_seconds:
+                outage_thread = threading.Thread(target=run_outage, args=(gateway, args), daemon=True)
+
+    context = multiprocessing.get_context('spawn')
+    results = context.Queue()
+    client_upstream_config = build_upstream_config(port, certificates, args.client_batch_size, args.client_linger)
+    clients = [context.Process(target=run_client, args=(number, args, gateway_config, client_upstream_config, results))
+               for number in range(args.clients)]
+    started = time.monotonic()
+    for client in clients:
+        client.start()
+    if outage_thread is not None:
+        outage_thread.start()
+    client_results = sorted((results.get() for _ in clients), key=lambda result: result['client'])
+    for client in clients:
+        client.join()
+
+    if outage_thread is not None:
+        outage_thread.join()
+    gateway_stats = None
+    if gateway is not None:
+        settle_deadline = time.monotonic() + args.settle
+        while (len(gateway.reading_queue) or len(gateway.outbox)) and time.monotonic() < settle_deadline:
+            time.sleep(0.05)
+        gateway.publisher.stop()
+        gateway.reporter.stop(timeout=5)
+        if gateway.server is not None:
+            gateway.stop_server()
+        gateway_stats = {
+            'readings_received': gateway.received,
+            'unacknowledged_at_end': len(gateway.outbox) + len(gateway.reading_queue),
+        }
+        gateway.outbox.close()
+    elapsed_seconds = time.monotonic() - started
+
+    broker.stop()
+    broker_stats = broker.get_stats()
+    return {
+        'commit': get_commit(),
+        'parameters': {key: value for key, value in sorted(vars(args).items()) if key != 'json'},
+        'elapsed_seconds': elapsed_seconds,
+        'offered_readings': sum(result['offered'] for result in client_results),
+        'client_acknowledged_readings': sum(result['acknowledged'] for result in client_results),
+        'client_unacknowledged_at_end': sum(result['unacknowledged'] for result in client_results),
+        'client_fallbacks': sum(result['connection'].get('gateway_fallbacks', 0) for result in client_results),
+        'upstream_connections': broker_stats['connections'],
+        'upstream_messages': broker_stats['messages'],
+        'upstream_readings': upstream_readings[0],
+        'readings_per_message': upstream_readings[0] / broker_stats['messages'] if broker_stats['messages'] else None,
+        'gateway': gateway_stats,
+        'clients': client_results,
+    }
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Load test gateway mode with several client processes")
+    parser.add_argument('--clients', type=int, default=4, help="client daemons, each run in its own process")
+    parser.add_argument('--rate', type=float, default=10.0, help="readings offered per second by each client")
+    parser.add_argument('--duration', type=float, default=10.0, help="seconds to offer readings for")
+    parser.add_argument('--settle', type=float, default=30.0, help="seconds allowed to publish what is left")
+    parser.add_argument('--transport', choices=TRANSPORTS, default=TRANSPORT_UNIX)
+    parser.add_argument('--port', type=int, default=DEFAULT_GATEWAY_PORT, help="UDP port of the gateway")
+    parser.add_argument('--direct', action='store_true', help="publish from each client directly, without a gateway")
+    parser.add_argument('--no-gateway', action='store_true', help="never start the gateway, so clients fall back")
+    parser.add_argument('--outage-at', type=float, default=3.0, help="seconds into the run to stop the gateway")
+    parser.add_argument('--outage-seconds', type=float, default=0.0, help="how long the gateway stays down")
+    parser.add_argument('--client-batch-size', type=int, default=50)
+    parser.add_argument('--client-linger', type=float, default=0.5)
+    parser.add_argument('--upstream-batch-size', type=int, default=100)
+    parser.add_argument('--upstream-linger', type=float, default=1.0)
+    parser.add_argument('--ack-timeout', type=float, default=0.5)
+    parser.add_argument('--retry', type=float, default=2.0, help="seconds before a client tries the gateway again")
+    parser.add_argument('--tls', action='store_true', help="connect upstream over TLS with throwaway certificates")
+    parser.add_argument('--json', action='store_true', help="print the results as JSON")
+    return parser.parse_args(argv)
+
+
+def main(argv):
+    args = parse_args(argv)
+    logging.getLogger('brew_thermometer').setLevel(logging.CRITICAL)
+    with tempfile.TemporaryDirectory() as work_dir:
+        results = run_load_test(args, work_dir)
+
+    if args.json:
+        print(json.dumps(results, sort_keys=True))
+        return
+
+    print("commit: {}".format(results['commit']))
+    print("parameters: {}".format(", ".join("{}={}".format(k, v) for k, v in results['parameters'].items())))
+    print("client acknowledged:   {:10d} of {} readings in {:.1f}s".format(
+        results['client_acknowledged_readings'], results['offered_readings'], results['elapsed_seconds']))
+    print("client unacknowledged: {:10d}".format(results['client_unacknowledged_at_end']))
+    print("client fallbacks:      {:10d}".format(results['client_fallbacks']))
+    print("upstream connections:  {:10d}".format(results['upstream_connections']))
+    print("upstream messages:     {:10d}".format(results['upstream_messages']))
+    print("upstream readings:     {:10d}".format(results['upstream_readings']))
+    print("readings/message:      {:10.1f}".format(results['readings_per_message'] or float('nan')))
+    print("gateway: {}".format(results['gateway']))
+    for result in results['clients']:
+        print("client {}: {}".format(result['client'], result))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
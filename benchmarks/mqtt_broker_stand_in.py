@@ -0,0 +1,250 @@
+"""
+An in-process stand-in for an MQTT broker, for load testing the reporter offline.
+
+It speaks just enough MQTT 3.1.1 for a publishing client: CONNECT, PUBLISH at QoS 0 or 1, PINGREQ and DISCONNECT,
+over plain TCP or TLS. Messages are counted and thrown away. Faults can be injected:
+  ack_delay_seconds / ack_jitter_seconds - how long each PUBACK is held back
+  drop_ack_rate - the share of QoS 1 messages that are never acknowledged
+  disconnect_every - the connection is dropped (without acknowledging) on every Nth message received
+"""
+import heapq
+import random
+import select
+import socketserver
+import ssl
+import subprocess
+import threading
+import time
+from os import path
+
+
+CONNECT = 1
+CONNACK = 2
+PUBLISH = 3
+PUBACK = 4
+PINGREQ = 12
+PINGRESP = 13
+DISCONNECT = 14
+CONNACK_ACCEPTED = bytes((CONNACK << 4, 2, 0, 0))
+PINGRESP_PACKET = bytes((PINGRESP << 4, 0))
+PUBLISH_FLAG_DUP = 0x08
+RECEIVE_BUFFER_SIZE = 65536
+
+
+class MqttBrokerStandIn:
+    def __init__(self, ack_delay_seconds=0.0, ack_jitter_seconds=0.0, drop_ack_rate=0.0, disconnect_every=0,
+                 ssl_context=None, seed=0):
+        self.ack_delay_seconds = ack_delay_seconds
+        self.ack_jitter_seconds = ack_jitter_seconds
+        self.drop_ack_rate = drop_ack_rate
+        self.disconnect_every = disconnect_every
+        self._ssl_context = ssl_context
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+        self._payload_listener = None
+        self._ack_sequence = 0
+
+        self.connections = 0
+        self.messages = 0
+        self.duplicate_messages = 0
+        self.payload_bytes = 0
+        self.acks_sent = 0
+        self.acks_dropped = 0
+        self.forced_disconnects = 0
+
+    def start(self, host='127.0.0.1', port=0):
+        broker = self
+
+        class Handler(socketserver.BaseRequestHandler):
+            def handle(self):
+                broker._handle_connection(self.request)
+
+        self._server = socketserver.ThreadingTCPServer((host, port), Handler, bind_and_activate=False)
+        self._server.daemon_threads = True
+        self._server.allow_reuse_address = True
+        self._server.server_bind()
+        self._server.server_activate()
+        self._thread = threading.Thread(target=self._server.serve_forever, name="MqttBrokerStandIn", daemon=True)
+        self._thread.start()
+        return self._server.server_address[1]
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+
+    def set_payload_listener(self, listener):
+        """
+        Calls listener with the topic and payload of every message received.
+        """
+        self._payload_listener = listener
+
+    def get_stats(self):
+        with self._lock:
+            return {
+                'connections': self.connections,
+                'messages': self.messages,
+                'duplicate_messages': self.duplicate_messages,
+                'payload_bytes': self.payload_bytes,
+                'acks_sent': self.acks_sent,
+                'acks_dropped': self.acks_dropped,
+                'forced_disconnects': self.forced_disconnects,
+            }
+
+    def _handle_connection(self, sock):
+        if self._ssl_context is not None:
+            try:
+                sock = self._ssl_context.wrap_socket(sock, server_side=True)
+            except (ssl.SSLError, OSError):
+                return
+
+        try:
+            self._serve(sock)
+        except (OSError, ConnectionError):
+            pass
+        finally:
+            try:
+                sock.close()
+            except OSError:
+                pass
+
+    def _serve(self, sock):
+        """
+        Serves one connection on a single thread, reading packets and sending delayed acknowledgements as they fall
+        due, so an SSL socket is never used from two threads at once.
+        """
+        buffer = bytearray()
+        pending_acks = []
+        while True:
+            timeout = max(0.0, pending_acks[0][0] - time.monotonic()) if pending_acks else None
+            pending_tls_data = isinstance(sock, ssl.SSLSocket) and sock.pending()
+            if pending_tls_data or select.select([sock], [], [], timeout)[0]:
+                try:
+                    data = sock.recv(RECEIVE_BUFFER_SIZE)
+                except ssl.SSLWantReadError:
+                    data = None
+                if data == b'':
+                    return
+                if data:
+                    buffer += data
+
+                packet = self._take_packet(buffer)
+                while packet is not None:
+                    packet_type, flags, body = packet
+                    if packet_type == CONNECT:
+                        with self._lock:
+                            self.connections += 1
+                        sock.sendall(CONNACK_ACCEPTED)
+                    elif packet_type == PUBLISH:
+                        if not self._receive_publish(flags, body, pending_acks):
+                            return
+                    elif packet_type == PINGREQ:
+                        sock.sendall(PINGRESP_PACKET)
+                    elif packet_type == DISCONNECT:
+                        return
+                    packet = self._take_packet(buffer)
+
+            now = time.monotonic()
+            while pending_acks and pending_acks[0][0] <= now:
+                sock.sendall(heapq.heappop(pending_acks)[2])
+                with self._lock:
+                    self.acks_sent += 1
+
+    def _receive_publish(self, flags, body, pending_acks):
+        """
+        Counts a published message and schedules its acknowledgement. Returns False if the connection should be dropped.
+        """
+        qos = (flags >> 1) & 0x03
+        topic_length = int.from_bytes(body[:2], 'big')
+        topic = body[2:2 + topic_length].decode('utf-8')
+        position = 2 + topic_length
+        packet_id = None
+        if qos:
+            packet_id = body[position:position + 2]
+            position += 2
+        payload = body[position:]
+
+        with self._lock:
+            self.messages += 1
+            self.payload_bytes += len(payload)
+            if flags & PUBLISH_FLAG_DUP:
+                self.duplicate_messages += 1
+            disconnect = self.disconnect_every and self.messages % self.disconnect_every == 0
+            drop_ack = not disconnect and qos and self._random.random() < self.drop_ack_rate
+            delay_seconds = self.ack_delay_seconds + self._random.uniform(0, self.ack_jitter_seconds)
+            if disconnect:
+                self.forced_disconnects += 1
+            elif drop_ack:
+                self.acks_dropped += 1
+            self._ack_sequence += 1
+            sequence = self._ack_sequence
+
+        if self._payload_listener is not None:
+            self._payload_listener(topic, payload)
+        if disconnect:
+            return False
+        if qos and not drop_ack:
+            heapq.heappush(pending_acks,
+                           (time.monotonic() + delay_seconds, sequence, bytes((PUBACK << 4, 2)) + packet_id))
+        return True
+
+    @staticmethod
+    def _take_packet(buffer):
+        """
+        Removes and returns the first complete packet in buffer as a tuple of (packet type, flags, body), or returns
+        None if the buffer does not hold a complete packet yet.
+        """
+        length = 0
+        shift = 0
+        position = 1
+        while True:
+            if position >= len(buffer):
+                return None
+            byte = buffer[position]
+            position += 1
+            length |= (byte & 0x7f) << shift
+            if not byte & 0x80:
+                break
+            shift += 7
+
+        if len(buffer) < position + length:
+            return None
+        packet = (buffer[0] >> 4, buffer[0] & 0x0f, bytes(buffer[position:position + length]))
+        del buffer[:position + length]
+        return packet
+
+
+def create_test_certificates(directory):
+    """
+    Creates a throwaway CA plus server and client certificates signed by it with the openssl command line tool, returning
+    a dict of their paths: ca, server_cert, server_key, client_cert, client_key.
+    """
+    paths = {name: path.join(directory, name + '.pem')
+             for name in ('ca', 'ca_key', 'server_cert', 'server_key', 'client_cert', 'client_key')}
+
+    def openssl(*args):
+        subprocess.run(('openssl',) + args, check=True, capture_output=True)
+
+    openssl('req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '1', '-subj', '/CN=stand-in CA',
+            '-keyout', paths['ca_key'], '-out', paths['ca'])
+    for name, subject in (('server', '/CN=localhost'), ('client', '/CN=brew-thermometer')):
+        csr_path = path.join(directory, name + '.csr')
+        openssl('req', '-newkey', 'rsa:2048', '-nodes', '-subj', subject, '-keyout', paths[name + '_key'],
+                '-out', csr_path)
+        extensions_path = path.join(directory, name + '.ext')
+        with open(extensions_path, 'w') as extensions:
+            extensions.write('subjectAltName=DNS:localhost,IP:127.0.0.1\n')
+        openssl('x509', '-req', '-in', csr_path, '-CA', paths['ca'], '-CAkey', paths['ca_key'], '-CAcreateserial',
+                '-days', '1', '-extfile', extensions_path, '-out', paths[name + '_cert'])
+
+    return paths
+
+
+def create_server_ssl_context(certificates):
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(certificates['server_cert'], keyfile=certificates['server_key'])
+    context.load_verify_locations(cafile=certificates['ca'])
+    context.verify_mode = ssl.CERT_REQUIRED
+    return context
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+Compares the bytes per reading and encode cost of the JSON payload encoding against the compact encoding, with and
+without delta encoding, for a range of batch sizes. Readings simulate a 12 probe rig sampled every 30 seconds.
+
+Usage: python -m benchmarks.payload_encoding_benchmark [iterations]
+"""
+import sys
+import timeit
+from brew_thermometer.payload_encoding import JsonPayloadEncoder, CompactPayloadEncoder
+
+
+DEFAULT_ITERATIONS = 2000
+PROBE_COUNT = 12
+BATCH_SIZES = (1, 12, 100)
+
+
+def make_payloads(count):
+    payloads = []
+    for i in range(count):
+        probe = i % PROBE_COUNT
+        payloads.append({
+            "thermometer_id": "28-0000075edd{:02x}".format(probe),
+            "description": "Fermenter {} (Internal)".format(probe),
+            "temperature_degrees_celsius": 18.0 + probe * 0.5 + (i // PROBE_COUNT) * 0.0625,
+            "timestamp": 1500000000.0 + 30 * (i // PROBE_COUNT),
+        })
+    return payloads
+
+
+def main(iterations):
+    encoders = [
+        ("json (unbatched)", lambda batch_size: JsonPayloadEncoder(1)),
+        ("json", lambda batch_size: JsonPayloadEncoder(batch_size)),
+        ("compact", lambda batch_size: CompactPayloadEncoder(False)),
+        ("compact + delta", lambda batch_size: CompactPayloadEncoder(True)),
+    ]
+
+    print("{:<18} {:>10} {:>16} {:>18}".format("encoding", "batch size", "bytes/reading", "encode us/reading"))
+    for batch_size in BATCH_SIZES:
+        payloads = make_payloads(batch_size)
+        for name, make_encoder in encoders:
+            encoder = make_encoder(batch_size)
+            if name == "json (unbatched)":
+                # one message per reading, as published before batching
+                size = sum(len(encoder.encode([payload])) for payload in payloads)
+                seconds = timeit.timeit(lambda: [encoder.encode([payload]) for payload in payloads],
+                                        number=iterations)
+            else:
+                size = len(encoder.encode(payloads))
+                seconds = timeit.timeit(lambda: encoder.encode(payloads), number=iterations)
+
+            print("{:<18} {:>10} {:>16.1f} {:>18.2f}".format(
+                name, batch_size, size / batch_size, seconds / iterations / batch_size * 1e6))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_ITERATIONS)
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+Load test of the publishing path (ReadingQueue -> Publisher -> Outbox -> AwsIotReporter) against an in-process MQTT
+broker stand-in (see mqtt_broker_stand_in), over plain TCP or local TLS with throwaway certificates.
+
+Readings are offered at a fixed rate for a fixed time, then the publisher is given a settling period to drain what is
+left. The broker can delay, drop or disconnect instead of acknowledging, to see how batching, inflight limits and ack
+timeouts hold up. Messages are always published at QoS 1, which the outbox relies on to know what was delivered.
+
+Reported: acknowledged readings and MQTT messages per second, read-to-acknowledgement latency percentiles, and losses:
+readings dropped from the publish queue, readings still unacknowledged at the end, and messages the broker received
+more than once.
+
+Usage: python -m benchmarks.reporter_load_benchmark [--rate N] [--duration S] [--batch-size N] [--inflight N] [--tls]
+       [--ack-delay-ms MS] [--drop-ack-rate R] [--disconnect-every N] ...
+"""
+import argparse
+import json
+import logging
+import sys
+import tempfile
+import time
+from benchmarks.app_cycle_benchmark import percentile, get_commit, PERCENTILES
+from benchmarks.mqtt_broker_stand_in import MqttBrokerStandIn, create_test_certificates, create_server_ssl_context
+from brew_thermometer.aws_iot_reporter import AwsIotReporter
+from brew_thermometer.outbox import Outbox, IN_MEMORY_PATH
+from brew_thermometer.payload_encoding import PAYLOAD_ENCODINGS, PAYLOAD_ENCODING_JSON
+from brew_thermometer.publisher import Publisher, ReadingQueue, QUEUE_POLICY_DROP_OLDEST
+
+
+SENSOR_COUNT = 12
+OUTBOX_MAX_READINGS = 10 ** 7
+
+
+class RecordingPublisher(Publisher):
+    """
+    A Publisher that also keeps every read-to-acknowledgement latency, for exact percentiles.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.latencies = []
+
+    def _record_latencies(self, published):
+        super()._record_latencies(published)
+        now = time.time()
+        self.latencies.extend(now - payload["timestamp"] for payload in published)
+
+
+def build_reporter_config(port, args, certificates):
+    return {
+        'host': '127.0.0.1',
+        'port': port,
+        'topic_name': 'temperature',
+        'tls': certificates is not None,
+        'certificate_authority_cert_file_path': certificates['ca'] if certificates else '',
+        'cert_file_path': certificates['client_cert'] if certificates else '',
+        'private_key_path': certificates['client_key'] if certificates else '',
+        'max_batch_size': args.batch_size,
+        'max_linger_seconds': args.linger,
+        'drain_batch_size': args.drain_batch_size,
+        'max_inflight_batches': args.inflight,
+        'max_queued_messages': args.max_queued_messages,
+        'ack_timeout_seconds': args.ack_timeout,
+        'drain_retry_seconds': args.drain_retry,
+        'reconnect_min_delay_seconds': args.reconnect_min_delay,
+        'reconnect_max_delay_seconds': max(args.reconnect_min_delay, 5),
+        'payload_encoding': args.encoding,
+    }
+
+
+def offer_readings(reading_queue, rate, duration_seconds):
+    count = int(rate * duration_seconds)
+    started = time.monotonic()
+    for i in range(count):
+        wait_seconds = started + i / rate - time.monotonic()
+        if wait_seconds > 0:
+            time.sleep(wait_seconds)
+        sensor = i % SENSOR_COUNT
+        reading_queue.put({
+            "thermometer_id": "28-0000075edd{:02x}".format(sensor),
+            "description": "Fermenter {}".format(sensor),
+            "temperature_degrees_celsius": 18.0 + sensor * 0.5 + (i // SENSOR_COUNT % 16) * 0.0625,
+            "timestamp": time.time(),
+        })
+    return count
+
+
+def run_load_test(args, work_dir):
+    logger = logging.getLogger('brew_thermometer.load_test')
+    certificates = create_test_certificates(work_dir) if args.tls else None
+    broker = MqttBrokerStandIn(args.ack_delay_ms / 1000.0, args.ack_jitter_ms / 1000.0, args.drop_ack_rate,
+                               args.disconnect_every,
+                               create_server_ssl_context(certificates) if certificates else None, args.seed)
+    port = broker.start()
+
+    outbox = Outbox(IN_MEMORY_PATH, OUTBOX_MAX_READINGS, 0, logger)
+    reporter = AwsIotReporter(build_reporter_config(port, args, certificates), logger, outbox)
+    reading_queue = ReadingQueue(args.queue_size, QUEUE_POLICY_DROP_OLDEST)
+    publisher = RecordingPublisher(reading_queue, outbox, reporter, None, logger)
+    publisher.start()
+
+    started = time.monotonic()
+    offered = offer_readings(reading_queue, args.rate, args.duration)
+    settle_deadline = time.monotonic() + args.settle
+    while (len(reading_queue) or len(outbox)) and time.monotonic() < settle_deadline:
+        time.sleep(0.05)
+    elapsed_seconds = time.monotonic() - started
+
+    publisher.stop()
+    reporter.stop(timeout=5)
+    broker.stop()
+    broker_stats = broker.get_stats()
+    latencies = sorted(publisher.latencies)
+    results = {
+        'commit': get_commit(),
+        'parameters': {key: value for key, value in sorted(vars(args).items()) if key != 'json'},
+        'elapsed_seconds': elapsed_seconds,
+        'offered_readings': offered,
+        'acknowledged_readings': len(latencies),
+        'acknowledged_readings_per_second': len(latencies) / elapsed_seconds,
+        'messages_per_second': broker_stats['messages'] / elapsed_seconds,
+        'latency_ms': {'p{}'.format(percent): percentile(latencies, percent) * 1000 if latencies else None
+                       for percent in PERCENTILES},
+        'max_latency_ms': latencies[-1] * 1000 if latencies else None,
+        'dropped_from_queue': reading_queue.dropped,
+        'unacknowledged_at_end': len(outbox) + len(reading_queue),
+        'broker': broker_stats,
+        'connection': reporter.get_connection_stats(),
+    }
+    outbox.close()
+    return results
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Load test the reporter against an MQTT broker stand-in")
+    parser.add_argument('--rate', type=float, default=50.0, help="readings offered per second")
+    parser.add_argument('--duration', type=float, default=10.0, help="seconds to offer readings for")
+    parser.add_argument('--settle', type=float, default=30.0, help="seconds allowed to publish what is left")
+    parser.add_argument('--queue-size', type=int, default=1000)
+    parser.add_argument('--batch-size', type=int, default=1)
+    parser.add_argument('--linger', type=float, default=0.0)
+    parser.add_argument('--drain-batch-size', type=int, default=100)
+    parser.add_argument('--inflight', type=int, default=10)
+    parser.add_argument('--max-queued-messages', type=int, default=100)
+    parser.add_argument('--ack-timeout', type=float, default=10.0)
+    parser.add_argument('--drain-retry', type=float, default=1.0)
+    parser.add_argument('--reconnect-min-delay', type=float, default=0.2)
+    parser.add_argument('--encoding', choices=PAYLOAD_ENCODINGS, default=PAYLOAD_ENCODING_JSON)
+    parser.add_argument('--tls', action='store_true', help="connect over TLS with throwaway certificates")
+    parser.add_argument('--ack-delay-ms', type=float, default=0.0)
+    parser.add_argument('--ack-jitter-ms', type=float, default=0.0)
+    parser.add_argument('--drop-ack-rate', type=float, default=0.0)
+    parser.add_argument('--disconnect-every', type=int, default=0, help="drop the connection every N messages")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', action='store_true', help="print the results as JSON")
+    return parser.parse_args(argv)
+
+
+def main(argv):
+    args = parse_args(argv)
+    logging.getLogger('brew_thermometer').setLevel(logging.CRITICAL)
+    with tempfile.TemporaryDirectory() as work_dir:
+        results = run_load_test(args, work_dir)
+
+    if args.json:
+        print(json.dumps(results, sort_keys=True))
+        return
+
+    print("commit: {}".format(results['commit']))
+    print("parameters: {}".format(", ".join("{}={}".format(k, v) for k, v in results['parameters'].items())))
+    print("acknowledged:      {:10d} of {} readings in {:.1f}s".format(
+        results['acknowledged_readings'], results['offered_readings'], results['elapsed_seconds']))
+    print("readings/s:        {:10.1f}".format(results['acknowledged_readings_per_second']))
+    print("messages/s:        {:10.1f}".format(results['messages_per_second']))
+    for name, latency_ms in iter(results['latency_ms'].items()):
+        print("latency {}:       {:10.2f} ms".format(name, latency_ms if latency_ms is not None else float('nan')))
+    print("latency max:       {:10.2f} ms".format(results['max_latency_ms'] or float('nan')))
+    print("dropped (queue):   {:10d}".format(results['dropped_from_queue']))
+    print("unacknowledged:    {:10d}".format(results['unacknowledged_at_end']))
+    print("broker: {}".format(results['broker']))
+    print("connection: {}".format(results['connection']))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,154 @@
+"""
+A simulated 1-Wire sysfs device tree, for running the daemon's real read path without probes.
+
+The tree mirrors /sys/bus/w1/devices: bus master directories holding therm_bulk_read and w1_master_slaves attributes
+and one directory per DS18B20, each with w1_slave, temperature and resolution attributes, plus a symlink per sensor at
+the top level. Point Thermometer (or the devices_root config key) at it and, while install() is active, every device
+read behaves like the kernel driver's:
+  - it blocks for the conversion time, unless a bulk conversion triggered on its bus has already covered it
+  - only the bus transaction itself (bus_transaction_seconds) is serialized per bus, as the driver releases the bus
+    while an externally powered sensor converts
+  - the attribute holds a fresh sample: a random walk per sensor, a failed CRC check (a NO line) at crc_failure_rate,
+    and the DS18B20's 85 C power-on value at outlier_rate
+Samples are generated from a seeded random number generator, so runs with the same parameters are comparable.
+"""
+import os
+import random
+import threading
+from contextlib import contextmanager
+from time import monotonic, sleep
+from unittest.mock import patch
+from brew_thermometer.bus_master import BusMaster
+from brew_thermometer.thermometer import Thermometer, READ_ATTRIBUTE_TEMPERATURE
+
+
+# the DS18B20 reports 85 C until its first conversion after power-up, a classic glitch on flaky power
+POWER_ON_RESET_MILLI_C = 85000
+SCRATCHPAD_TAIL = 'ff 0c 10'
+
+
+class SimulatedW1Tree:
+    def __init__(self, root, sensor_count, bus_count=1, conversion_seconds=0.0, bus_transaction_seconds=0.0,
+                 crc_failure_rate=0.0, outlier_rate=0.0, negative_fraction=0.0, seed=0):
+        """
+        Creates the tree under root with sensor_count sensors spread round-robin over bus_count bus masters. A
+        negative_fraction of the sensors sit below freezing, like a probe in a freezer or a glycol bath.
+        """
+        self.root = root
+        self.conversion_seconds = conversion_seconds
+        self.bus_transaction_seconds = bus_transaction_seconds
+        self.crc_failure_rate = crc_failure_rate
+        self.outlier_rate = outlier_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._bus_locks = {}
+        self._bulk_ready_at = {}
+        self._sensors = {}
+
+        for bus_index in range(bus_count):
+            bus_name = 'w1_bus_master{}'.format(bus_index + 1)
+            os.makedirs(os.path.join(root, bus_name))
+            open(os.path.join(root, bus_name, 'therm_bulk_read'), 'w').close()
+            self._bus_locks[bus_name] = threading.Lock()
+        bus_slaves = {}
+
+        negative_count = int(round(sensor_count * negative_fraction))
+        for index in range(sensor_count):
+            sensor_id = '28-{:012x}'.format(0x0000075e0000 + index)
+            bus_name = 'w1_bus_master{}'.format(index % bus_count + 1)
+            sensor_dir = os.path.join(root, bus_name, sensor_id)
+            os.makedirs(sensor_dir)
+            for attribute in ('w1_slave', 'temperature', 'resolution'):
+                open(os.path.join(sensor_dir, attribute), 'w').close()
+            os.symlink(sensor_dir, os.path.join(root, sensor_id))
+            bus_slaves.setdefault(bus_name, []).append(sensor_id)
+
+            self._sensors[sensor_id] = {
+                'bus_name': bus_name,
+                'milli_c': -18000 if index < negative_count else 18000 + index * 100,
+                'fds': {
+                    'w1_slave': os.open(os.path.join(sensor_dir, 'w1_slave'), os.O_WRONLY),
+                    'temperature': os.open(os.path.join(sensor_dir, 'temperature'), os.O_WRONLY),
+                },
+            }
+
+        for bus_name in self._bus_locks:
+            with open(os.path.join(root, bus_name, 'w1_master_slaves'), 'w') as slaves_file:
+                slaves_file.write(''.join(sensor_id + '\n' for sensor_id in bus_slaves.get(bus_name, [])) or
+                                  'not found.\n')
+
+    @property
+    def sensor_ids(self):
+        return list(self._sensors)
+
+    def close(self):
+        for sensor in self._sensors.values():
+            for fd in sensor['fds'].values():
+                os.close(fd)
+
+    @contextmanager
+    def install(self):
+        """
+        Makes Thermometer and BusMaster reads of devices in this tree behave like the kernel driver's while active.
+        """
+        read_device_data = Thermometer._read_device_data
+        trigger_bulk_read = BusMaster.trigger_bulk_read
+        tree = self
+
+        def simulated_read_device_data(thermometer):
+            if thermometer.device_id in tree._sensors:
+                tree._convert(thermometer.device_id, thermometer.read_attribute)
+            return read_device_data(thermometer)
+
+        def simulated_trigger_bulk_read(bus_master):
+            triggered = trigger_bulk_read(bus_master)
+            if triggered and bus_master.name in tree._bus_locks:
+                tree._start_bulk_conversion(bus_master.name)
+            return triggered
+
+        with patch.object(Thermometer, '_read_device_data', simulated_read_device_data), \
+                patch.object(BusMaster, 'trigger_bulk_read', simulated_trigger_bulk_read):
+            yield self
+
+    def _start_bulk_conversion(self, bus_name):
+        ready_at = monotonic() + self.conversion_seconds
+        with self._lock:
+            for sensor_id, sensor in iter(self._sensors.items()):
+                if sensor['bus_name'] == bus_name:
+                    self._bulk_ready_at[sensor_id] = ready_at
+
+    def _convert(self, sensor_id, read_attribute):
+        sensor = self._sensors[sensor_id]
+        with self._lock:
+            ready_at = self._bulk_ready_at.pop(sensor_id, None)
+            crc_failed = self._random.random() < self.crc_failure_rate
+            outlier = self._random.random() < self.outlier_rate
+            sensor['milli_c'] += self._random.randint(-62, 62)
+
+        if ready_at is None:
+            sleep(self.conversion_seconds)
+        elif ready_at > monotonic():
+            sleep(ready_at - monotonic())
+        if self.bus_transaction_seconds:
+            with self._bus_locks[sensor['bus_name']]:
+                sleep(self.bus_transaction_seconds)
+
+        milli_c = POWER_ON_RESET_MILLI_C if outlier else sensor['milli_c']
+        if read_attribute == READ_ATTRIBUTE_TEMPERATURE:
+            self._write(sensor['fds']['temperature'], '{}\n'.format(milli_c))
+        else:
+            self._write(sensor['fds']['w1_slave'], self._format_w1_slave(milli_c, crc_failed))
+
+    @staticmethod
+    def _format_w1_slave(milli_c, crc_failed):
+        raw = int(round(milli_c / 62.5)) & 0xffff
+        scratchpad = '{:02x} {:02x} 4b 46 7f {}'.format(raw & 0xff, raw >> 8, SCRATCHPAD_TAIL)
+        crc = '00' if crc_failed else '1e'
+        return '{} {} : crc={} {}\n{} {} t={}\n'.format(scratchpad, crc, crc, 'NO' if crc_failed else 'YES',
+                                                       scratchpad, crc, milli_c)
+
+    @staticmethod
+    def _write(fd, data):
+        data = data.encode('ascii')
+        os.pwrite(fd, data, 0)
+        os.ftruncate(fd, len(data))
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark of the per-read cost of Thermometer's read and parse path against the original implementation, which
+opened the device in text mode on every read, read it twice per sample, and regex parsed the decoded lines.
+
+The device file is a regular file here, so this measures only syscall and parsing overhead; on a real bus the original
+path also paid a second ~750ms conversion per sample, which dwarfs everything measured below.
+
+Usage: python -m benchmarks.thermometer_read_benchmark [iterations]
+"""
+import os
+import re
+import sys
+import tempfile
+import timeit
+from logging import getLogger, NullHandler
+from brew_thermometer.thermometer import Thermometer
+
+
+W1_SLAVE_DATA = b"21 01 4b 46 7f ff 0c 10 1e : crc=1e YES\n21 01 4b 46 7f ff 0c 10 1e t=18062\n"
+DEFAULT_ITERATIONS = 100000
+LEGACY_TEMP_LINE_REGEX = re.compile(r't=(\d+)')
+
+
+def legacy_get_temperature(device_path):
+    def read_device_data():
+        with open(device_path, 'r') as d:
+            return d.read()
+
+    read_data = read_device_data()
+    if read_data:
+        data_lines = read_device_data().strip().splitlines()
+        if len(data_lines) == 2 and data_lines[0].strip().endswith('YES'):
+            m = LEGACY_TEMP_LINE_REGEX.search(data_lines[1].strip())
+            if m is not None:
+                return int(m.group(1))
+
+    return None
+
+
+def main(iterations):
+    logger = getLogger('benchmark')
+    logger.addHandler(NullHandler())
+
+    with tempfile.TemporaryDirectory() as device_dir:
+        device_path = os.path.join(device_dir, 'w1_slave')
+        with open(device_path, 'wb') as d:
+            d.write(W1_SLAVE_DATA)
+
+        thermometer = Thermometer('28-0000075eddab', logger)
+        thermometer._device_path = device_path
+
+        legacy_seconds = timeit.timeit(lambda: legacy_get_temperature(device_path), number=iterations)
+        current_seconds = timeit.timeit(thermometer.get_temperature, number=iterations)
+        parse_seconds = timeit.timeit(lambda: thermometer._parse_temperature(W1_SLAVE_DATA), number=iterations)
+        thermometer.close()
+
+    print("iterations: {}".format(iterations))
+    print("original read + parse (open per read, 2 reads, regex): {:8.2f} us/read".format(
+        legacy_seconds / iterations * 1e6))
+    print("persistent descriptor pread + byte parse:                {:8.2f} us/read".format(
+        current_seconds / iterations * 1e6))
+    print("  of which byte parse:                                   {:8.2f} us/read".format(
+        parse_seconds / iterations * 1e6))
+    print("speedup: {:.1f}x".format(legacy_seconds / current_seconds))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_ITERATIONS)
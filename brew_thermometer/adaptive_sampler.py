@@ -0,0 +1,149 @@
+import math
+
+
+DEFAULT_SLOPE_THRESHOLD_DEGREES_C_PER_HOUR = 0.5
+DEFAULT_NOISE_THRESHOLD_DEGREES_C = 0.1
+# the quantization step of a DS18B20 at its default 12 bit resolution
+DEFAULT_RESOLUTION_DEGREES_C = 0.0625
+# how far back a thermometer's readings are judged from; widened to cover at least MIN_WINDOW_READINGS reads at the
+# current interval
+DEFAULT_WINDOW_SECONDS = 600
+MIN_WINDOW_READINGS = 5
+# how many standard errors a fitted slope must be from zero to count, roughly a 95% significance test
+SLOPE_SIGNIFICANCE = 2.0
+# the interval is divided by this on each read while the temperature is active, and multiplied by RELAX_FACTOR while
+# it is quiet -- tightening fast enough to catch a fermentation kicking off, relaxing slowly enough not to miss the next
+TIGHTEN_FACTOR = 4.0
+RELAX_FACTOR = 1.5
+# the temperature is only quiet once both measures are at most this share of their thresholds, so the interval does
+# not flap around a threshold
+QUIET_SHARE = 0.5
+SECONDS_PER_HOUR = 3600.0
+
+
+class AdaptiveSampler:
+    """
+    Adapts each thermometer's read interval to how much its temperature is doing, between a configured minimum and
+    maximum. After every read the thermometer's readings over the last window_seconds are fitted with a least squares
+    line: while the slope of the line or the noise around it (the standard deviation of the residuals, e.g. a glycol
+    valve hunting around its set point) exceeds its threshold, the interval is tightened towards the minimum; once both
+    are well below their thresholds it is relaxed back towards the maximum. Thermometers without bounds configured
+    keep their fixed interval. Counts of tightened and relaxed intervals are kept per thermometer.
+
+    A stable probe still flickers between two adjacent quantization steps, which over a short window fits a steep
+    slope. So a slope only counts if it is significant (SLOPE_SIGNIFICANCE standard errors from zero) and the line it
+    fits moves by at least the thermometer's resolution across the window, and noise only counts once it reaches the
+    resolution.
+    """
+
+    def __init__(self, window_seconds=DEFAULT_WINDOW_SECONDS):
+        self._window_seconds = window_seconds
+        self._settings = {}
+        self._tightened_counts = {}
+        self._relaxed_counts = {}
+
+    def configure(self, thermometer_id, min_interval_seconds, max_interval_seconds,
+                  slope_threshold_degrees_c_per_hour=DEFAULT_SLOPE_THRESHOLD_DEGREES_C_PER_HOUR,
+                  noise_threshold_degrees_c=DEFAULT_NOISE_THRESHOLD_DEGREES_C,
+                  resolution_degrees_c=DEFAULT_RESOLUTION_DEGREES_C):
+        """
+        Sets the bounds of a thermometer's read interval (None for a fixed interval), the thresholds past which its
+        temperature counts as active, and the quantization step of its readings.
+        """
+        if min_interval_seconds is None or max_interval_seconds is None:
+            self._settings.pop(thermometer_id, None)
+            return
+
+        self._settings[thermometer_id] = (min_interval_seconds, max_interval_seconds,
+                                          slope_threshold_degrees_c_per_hour,
+                                          max(noise_threshold_degrees_c, resolution_degrees_c), resolution_degrees_c)
+        self._tightened_counts.setdefault(thermometer_id, 0)
+        self._relaxed_counts.setdefault(thermometer_id, 0)
+
+    def remove(self, thermometer_id):
+        self._settings.pop(thermometer_id, None)
+        self._tightened_counts.pop(thermometer_id, None)
+        self._relaxed_counts.pop(thermometer_id, None)
+
+    def is_adaptive(self, thermometer_id):
+        return thermometer_id in self._settings
+
+    def get_initial_interval(self, thermometer_id, read_interval_seconds):
+        """
+        Returns the interval a thermometer is first read at: its configured read interval, within its bounds.
+        """
+        if thermometer_id not in self._settings:
+            return read_interval_seconds
+
+        min_interval_seconds, max_interval_seconds = self._settings[thermometer_id][:2]
+        return min(max(read_interval_seconds, min_interval_seconds), max_interval_seconds)
+
+    def get_next_interval(self, thermometer_id, history, interval_seconds):
+        """
+        Returns the interval to read a thermometer at next, given its ReadingHistory and its current interval.
+        """
+        latest = history.get_latest()
+        if thermometer_id not in self._settings or latest is None:
+            return interval_seconds
+
+        min_interval_seconds, max_interval_seconds, slope_threshold, noise_threshold, resolution = \
+            self._settings[thermometer_id]
+        window_seconds = max(self._window_seconds, MIN_WINDOW_READINGS * interval_seconds)
+        fit = _fit_line(history.get_readings(since=latest[0] - window_seconds))
+        if fit is None:
+            return interval_seconds
+
+        slope_degrees_c_per_hour, slope_standard_error, noise_degrees_c, span_seconds = fit
+        if abs(slope_degrees_c_per_hour) < SLOPE_SIGNIFICANCE * slope_standard_error or \
+                abs(slope_degrees_c_per_hour) * span_seconds / SECONDS_PER_HOUR < resolution:
+            # indistinguishable from flicker, or moving by less than one quantization step across the window
+            slope_degrees_c_per_hour = 0.0
+
+        if abs(slope_degrees_c_per_hour) >= slope_threshold or noise_degrees_c >= noise_threshold:
+            next_interval_seconds = max(min_interval_seconds, interval_seconds / TIGHTEN_FACTOR)
+            if next_interval_seconds < interval_seconds:
+                self._tightened_counts[thermometer_id] += 1
+        elif abs(slope_degrees_c_per_hour) <= slope_threshold * QUIET_SHARE and \
+                noise_degrees_c <= noise_threshold * QUIET_SHARE:
+            next_interval_seconds = min(max_interval_seconds, interval_seconds * RELAX_FACTOR)
+            if next_interval_seconds > interval_seconds:
+                self._relaxed_counts[thermometer_id] += 1
+        else:
+            next_interval_seconds = interval_seconds
+
+        return next_interval_seconds
+
+    def get_stats(self):
+        """
+        Returns a dict of thermometer ID to a dict of how many times its interval was tightened and relaxed.
+        """
+        return {
+            thermometer_id: {
+                'interval_tightened': self._tightened_counts[thermometer_id],
+                'interval_relaxed': self._relaxed_counts[thermometer_id],
+            }
+            for thermometer_id in self._tightened_counts
+        }
+
+
+def _fit_line(readings):
+    """
+    Fits a least squares line to (timestamp, degrees Celsius) readings, returning its slope and the slope's standard
+    error in degrees Celsius per hour, the standard deviation of the readings around the line and the seconds the
+    readings span, or None if there are too few readings to tell.
+    """
+    count = len(readings)
+    if count < MIN_WINDOW_READINGS:
+        return None
+
+    mean_t = sum(timestamp for timestamp, _ in readings) / count
+    mean_v = sum(value for _, value in readings) / count
+    sum_tt = sum((timestamp - mean_t) ** 2 for timestamp, _ in readings)
+    if sum_tt <= 0:
+        return None
+
+    slope = sum((timestamp - mean_t) * (value - mean_v) for timestamp, value in readings) / sum_tt
+    sum_squared_residuals = sum((value - mean_v - slope * (timestamp - mean_t)) ** 2 for timestamp, value in readings)
+    noise = math.sqrt(sum_squared_residuals / count)
+    standard_error = math.sqrt(sum_squared_residuals / (count - 2) / sum_tt)
+    return slope * SECONDS_PER_HOUR, standard_error * SECONDS_PER_HOUR, noise, readings[-1][0] - readings[0][0]
@@ -1,52 +1,359 @@
 from paho.mqtt import client as mqtt
+import random
 import ssl
-from brew_thermometer.errors import ReporterError
-import json
+import threading
+import time
+from time import monotonic
+from brew_thermometer.payload_encoding import create_payload_encoder, PAYLOAD_ENCODING_JSON
+from brew_thermometer.instrumentation import NULL_INSTRUMENTATION, STAGE_PUBLISH, STAGE_PUBACK, FAILURE_PUBLISH
+from brew_thermometer.reporter import Reporter
 
 
-class AwsIotReporter:
-    def __init__(self, config_hash, logger):
+DEFAULT_MAX_BATCH_SIZE = 50
+DEFAULT_MAX_LINGER_SECONDS = 0
+DEFAULT_DRAIN_BATCH_SIZE = 100
+DEFAULT_MAX_INFLIGHT_BATCHES = 10
+DEFAULT_ACK_TIMEOUT_SECONDS = 10
+DEFAULT_DRAIN_RETRY_SECONDS = 5
+DEFAULT_CONNECT_TIMEOUT_SECONDS = 10
+DEFAULT_MAX_QUEUED_MESSAGES = 100
+DEFAULT_RECONNECT_MIN_DELAY_SECONDS = 1
+DEFAULT_RECONNECT_MAX_DELAY_SECONDS = 120
+DEFAULT_PAYLOAD_ENCODING = PAYLOAD_ENCODING_JSON
+DEFAULT_DELTA_ENCODING = True
+SCHEMA_TOPIC_SUFFIX = '/schema'
+KEEPALIVE_SECONDS = 60
+NETWORK_LOOP_TIMEOUT_SECONDS = 1.0
+
+STATE_DISCONNECTED = 'disconnected'
+STATE_CONNECTING = 'connecting'
+STATE_CONNECTED = 'connected'
+STATE_BACKOFF = 'backoff'
+
+
+class AwsIotReporter(Reporter):
+    """
+    Publishes readings from the outbox to AWS IoT over MQTT. Readings are packed into batch messages and only removed
+    from the outbox once the broker has acknowledged them. After a failure the reporter switches to draining the
+    backlog in large batches (drain_batch_size) with at most max_inflight_batches unacknowledged messages at once,
+    until the outbox is empty again.
+
+    The connection is owned by a network thread running a small state machine:
+      disconnected -> connecting -> connected
+      connecting/connected -> backoff (on a refused connection or a disconnect) -> connecting
+    Reconnect attempts are spaced by exponential backoff with jitter, so a fleet of thermometers does not reconnect in
+    lockstep after a broker hiccup. The SSL context is built once and reused for every connection.
+
+    With tls set to false it connects over plain TCP instead, e.g. to a broker on the LAN, and the certificate paths
+    are not needed.
+    """
+
+    def __init__(self, config_hash, logger, outbox, instrumentation=NULL_INSTRUMENTATION):
         self._logger = logger.getChild("AwsIotReporter")
+        self._outbox = outbox
+        self._instrumentation = instrumentation
         self._broker_host = config_hash["host"]
         self._broker_port = config_hash["port"]
         self._topic = config_hash["topic_name"]
-        self._ca_cert_path = config_hash["certificate_authority_cert_file_path"]
-        self._cert_file_path = config_hash["cert_file_path"]
-        self._private_key_path = config_hash["private_key_path"]
+        self._use_tls = bool(config_hash.get("tls", True))
+        if self._use_tls:
+            self._ca_cert_path = config_hash["certificate_authority_cert_file_path"]
+            self._cert_file_path = config_hash["cert_file_path"]
+            self._private_key_path = config_hash["private_key_path"]
+        self._max_batch_size = max(1, int(config_hash.get("max_batch_size", DEFAULT_MAX_BATCH_SIZE)))
+        self._max_linger_seconds = float(config_hash.get("max_linger_seconds", DEFAULT_MAX_LINGER_SECONDS))
+        self._drain_batch_size = max(1, int(config_hash.get("drain_batch_size", DEFAULT_DRAIN_BATCH_SIZE)))
+        self._max_inflight_batches = max(1, int(config_hash.get("max_inflight_batches",
+                                                                DEFAULT_MAX_INFLIGHT_BATCHES)))
+        self._ack_timeout_seconds = float(config_hash.get("ack_timeout_seconds", DEFAULT_ACK_TIMEOUT_SECONDS))
+        self._drain_retry_seconds = float(config_hash.get("drain_retry_seconds", DEFAULT_DRAIN_RETRY_SECONDS))
+        self._connect_timeout_seconds = float(config_hash.get("connect_timeout_seconds",
+                                                              DEFAULT_CONNECT_TIMEOUT_SECONDS))
+        self._reconnect_min_delay_seconds = float(config_hash.get("reconnect_min_delay_seconds",
+                                                                  DEFAULT_RECONNECT_MIN_DELAY_SECONDS))
+        self._reconnect_max_delay_seconds = float(config_hash.get("reconnect_max_delay_seconds",
+                                                                  DEFAULT_RECONNECT_MAX_DELAY_SECONDS))
+
+        self._encoder = create_payload_encoder(config_hash.get("payload_encoding", DEFAULT_PAYLOAD_ENCODING),
+                                               self._max_batch_size,
+                                               config_hash.get("delta_encoding", DEFAULT_DELTA_ENCODING))
+        self._published_schema_version = None
+
+        # readings left over from a previous run are a backlog to be replayed
+        self._draining_backlog = len(outbox) > 0
+        self._next_drain_attempt = 0
 
         self._client = mqtt.Client()
         self._client.on_connect = self._on_connect
         self._client.on_disconnect = self._on_disconnect
+        self._client.max_inflight_messages_set(self._max_inflight_batches)
+        # bounds paho's own queue; publishes past it fail and the readings simply stay in the outbox
+        self._client.max_queued_messages_set(int(config_hash.get("max_queued_messages", DEFAULT_MAX_QUEUED_MESSAGES)))
+        # without TLS there is nothing to configure
+        self._tls_configured = not self._use_tls
+
+        self._state = STATE_DISCONNECTED
+        self._state_lock = threading.Lock()
+        self._connected = threading.Event()
+        self._stopped = threading.Event()
+        self._network_thread = None
+        self._reconnect_attempts = 0
+        self._next_connect_attempt = 0
+        self._connection_count = 0
+        self._disconnection_count = 0
 
-        self._connected = False
+    def drain(self, force=False):
+        """
+        Publishes readings from the outbox, packing up to max_batch_size of them into each message (drain_batch_size
+        while replaying a backlog). A partial batch is held back until its oldest reading has waited max_linger_seconds,
+        unless force is True. Returns the list of payloads the broker acknowledged.
+        """
+        if not len(self._outbox) or (self._draining_backlog and monotonic() < self._next_drain_attempt):
+            return []
 
-    def publish_payload(self, payload_hash):
-        payload_str = json.dumps(payload_hash)
-        self._ensure_connection()
-        res, _ = self._client.publish(self._topic, payload=payload_str, qos=1)
-        if res == mqtt.MQTT_ERR_SUCCESS:
-            return True
+        try:
+            connected = self._ensure_connection()
+        except Exception as e:
+            self._logger.error("Error connecting to AWS IOT service: %s", e)
+            connected = False
+        if not connected:
+            self._defer_drain()
+            return []
+
+        published = []
+        while len(self._outbox):
+            batch_size = self._drain_batch_size if self._draining_backlog else self._max_batch_size
+            rows = self._outbox.peek(batch_size * self._max_inflight_batches)
+            if not (self._draining_backlog or force or self._linger_expired()):
+                rows = rows[:len(rows) - len(rows) % batch_size]
+            if not rows:
+                break
+
+            acked_ids, acked_payloads, all_acked = self._publish_batches(
+                [rows[i:i + batch_size] for i in range(0, len(rows), batch_size)]
+            )
+            self._outbox.remove(acked_ids)
+            published.extend(acked_payloads)
+            if not all_acked:
+                self._defer_drain()
+                break
+
+        if not len(self._outbox):
+            if self._draining_backlog:
+                self._logger.info("Outbox backlog drained")
+            self._draining_backlog = False
+
+        return published
+
+    def seconds_until_flush(self):
+        """
+        Returns the number of seconds until drain should next be called (0 if it is already due), or None if there is
+        nothing to publish.
+        """
+        if not len(self._outbox):
+            return None
+        elif self._draining_backlog:
+            return max(0.0, self._next_drain_attempt - monotonic())
+        elif len(self._outbox) >= self._max_batch_size:
+            return 0.0
         else:
-            self._logger.error("Error publishing message '%s': %s", payload_str, str(res))
+            return max(0.0, self._outbox.oldest_created() + self._max_linger_seconds - time.time())
+
+    def _linger_expired(self):
+        oldest_created = self._outbox.oldest_created()
+        return oldest_created is not None and oldest_created + self._max_linger_seconds <= time.time()
+
+    def _defer_drain(self):
+        if not self._draining_backlog:
+            self._logger.warning("Could not publish readings; keeping them in the outbox (%d readings) to replay",
+                                 len(self._outbox))
+        self._draining_backlog = True
+        self._next_drain_attempt = monotonic() + self._drain_retry_seconds
+
+    def _publish_batches(self, batches):
+        """
+        Publishes each batch of outbox rows as one message, then waits for the broker to acknowledge them. Returns a
+        tuple of the acknowledged reading IDs, the acknowledged payloads, and whether every batch was acknowledged.
+        """
+        batch_payloads = [[payload_hash for _, payload_hash in batch] for batch in batches]
+        # every batch must refer to the schema version that is published, so new sensors are added to it up front
+        for payloads in batch_payloads:
+            self._encoder.register_sensors(payloads)
+        self._publish_schema()
+        encoded_batches = [(batch, payloads, self._encoder.encode(payloads))
+                           for batch, payloads in zip(batches, batch_payloads)]
+        inflight = []
+        for batch, payloads, encoded in encoded_batches:
+            started = self._instrumentation.start_stage()
+            message_info = self._client.publish(self._topic, payload=encoded, qos=1)
+            self._instrumentation.end_stage(STAGE_PUBLISH, started)
+            inflight.append((batch, payloads, message_info, self._instrumentation.start_stage()))
+
+        ack_deadline = monotonic() + self._ack_timeout_seconds
+        acked_ids = []
+        acked_payloads = []
+        all_acked = True
+        for batch, payloads, message_info, published in inflight:
+            if self._wait_for_ack(message_info, ack_deadline):
+                self._instrumentation.end_stage(STAGE_PUBACK, published)
+                acked_ids.extend(reading_id for reading_id, _ in batch)
+                acked_payloads.extend(payloads)
+            else:
+                all_acked = False
+                for payload_hash in payloads:
+                    self._instrumentation.count_failure(payload_hash["thermometer_id"], FAILURE_PUBLISH)
+
+        if not all_acked:
+            self._drop_connection("messages were not acknowledged")
+        return acked_ids, acked_payloads, all_acked
+
+    def _publish_schema(self):
+        """
+        Publishes the encoder's schema message (as a retained message, so consumers that connect later still get it)
+        whenever it has changed or the connection was re-established.
+        """
+        schema_version = self._encoder.get_schema_version()
+        if schema_version is not None and schema_version != self._published_schema_version:
+            self._client.publish(self._topic + SCHEMA_TOPIC_SUFFIX, payload=self._encoder.get_schema_message(), qos=1,
+                                 retain=True)
+            self._published_schema_version = schema_version
+
+    def _wait_for_ack(self, message_info, ack_deadline):
+        try:
+            message_info.wait_for_publish(max(0.0, ack_deadline - monotonic()))
+        except (ValueError, RuntimeError) as e:
+            self._logger.error("Error publishing message %s: %s", message_info.mid, e)
+            return False
+
+        if not message_info.is_published():
+            self._logger.error("Timed out waiting for the broker to acknowledge message %s", message_info.mid)
             return False
 
+        return True
+
+    def get_connection_stats(self):
+        """
+        Returns a dict describing the state of the connection to the broker.
+        """
+        return {
+            'state': self._state,
+            'connected': self._state == STATE_CONNECTED,
+            'connections': self._connection_count,
+            'disconnections': self._disconnection_count,
+            'reconnect_attempts': self._reconnect_attempts,
+        }
+
+    def stop(self, timeout=None):
+        """
+        Disconnects from the broker and stops the network thread.
+        """
+        self._stopped.set()
+        if self._network_thread is not None:
+            self._client.disconnect()
+            self._network_thread.join(timeout)
+
     def _ensure_connection(self):
-        if self._connected is False:
-            self._client.tls_set(self._ca_cert_path, certfile=self._cert_file_path, keyfile=self._private_key_path,
-                                 cert_reqs=ssl.CERT_REQUIRED, tls_version=ssl.PROTOCOL_TLSv1_2, ciphers=None)
-            self._client.connect(self._broker_host, self._broker_port, keepalive=60)
-            self._client.loop_start()
-            self._connected = True
+        """
+        Starts the network thread on first use, waiting up to connect_timeout_seconds for the first connection; the
+        network thread reconnects on its own after that. Returns whether the client is currently connected.
+        """
+        if self._network_thread is None:
+            self._network_thread = threading.Thread(target=self._run_network_loop, name="AwsIotReporter", daemon=True)
+            self._network_thread.start()
+            return self._connected.wait(self._connect_timeout_seconds)
+
+        return self._connected.is_set()
+
+    def _run_network_loop(self):
+        while not self._stopped.is_set():
+            if self._state in (STATE_DISCONNECTED, STATE_BACKOFF):
+                wait_seconds = self._next_connect_attempt - monotonic()
+                if wait_seconds > 0:
+                    self._stopped.wait(wait_seconds)
+                    continue
+                self._connect()
+            else:
+                rc = self._client.loop(timeout=NETWORK_LOOP_TIMEOUT_SECONDS)
+                if rc != mqtt.MQTT_ERR_SUCCESS:
+                    self._connection_lost("network loop error: {}".format(mqtt.error_string(rc)))
+
+    def _connect(self):
+        self._set_state(STATE_CONNECTING)
+        try:
+            if not self._tls_configured:
+                self._client.tls_set_context(self._create_ssl_context())
+                self._tls_configured = True
+            self._client.connect(self._broker_host, self._broker_port, keepalive=KEEPALIVE_SECONDS)
+        except Exception as e:
+            self._connection_lost("could not connect: {}".format(e))
+
+    def _create_ssl_context(self):
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+        context.minimum_version = ssl.TLSVersion.TLSv1_2
+        context.load_verify_locations(cafile=self._ca_cert_path)
+        context.load_cert_chain(self._cert_file_path, keyfile=self._private_key_path)
+        return context
+
+    def _connection_lost(self, reason):
+        """
+        Moves to the backoff state and schedules the next connection attempt, unless the connection was already
+        known to be lost.
+        """
+        with self._state_lock:
+            if self._state not in (STATE_CONNECTING, STATE_CONNECTED):
+                return
+            self._state = STATE_BACKOFF
+            self._connected.clear()
+            delay_seconds = self._get_reconnect_delay_seconds(self._reconnect_attempts)
+            self._reconnect_attempts += 1
+            self._next_connect_attempt = monotonic() + delay_seconds
+
+        if not self._stopped.is_set():
+            self._logger.error("AWS IOT service connection lost (%s); reconnecting in %.1f seconds",
+                               reason, delay_seconds)
+
+    def _drop_connection(self, reason):
+        """
+        Gives up on a connection the broker stopped acknowledging messages on. paho only resends unacknowledged
+        messages when it reconnects, so until then they would hold its inflight slots and stall publishing for good.
+        """
+        self._connection_lost(reason)
+        self._client.disconnect()
+
+    def _get_reconnect_delay_seconds(self, attempt):
+        """
+        Exponential backoff with "equal jitter": the delay is at least half the exponential delay, plus a random share
+        of the other half.
+        """
+        delay_seconds = min(self._reconnect_max_delay_seconds, self._reconnect_min_delay_seconds * (2 ** attempt))
+        return delay_seconds / 2 + random.uniform(0, delay_seconds / 2)
+
+    def _set_state(self, state):
+        with self._state_lock:
+            self._state = state
 
     def _on_connect(self, client, userdata, flags, rc):
         if rc != 0:
-            raise ReporterError("Error connecting to AWS IOT service: {0}".format(str(rc)))
+            # raising here would kill the network thread; treat a refused connection like any other lost connection
+            self._connection_lost("connection refused: {}".format(mqtt.connack_string(rc)))
         else:
             self._logger.info("Connected: %s", str(rc))
+            with self._state_lock:
+                self._state = STATE_CONNECTED
+                self._reconnect_attempts = 0
+                self._connection_count += 1
+                # the schema goes out again ahead of the first batch on every connection
+                self._published_schema_version = None
+            self._connected.set()
 
     def _on_disconnect(self, client, userdata, rc):
+        self._disconnection_count += 1
         if rc != 0:  # unexpected disconnect
-            self._logger.error("Unexpected AWS IOT service disconnect: %s -- Reconnecting...", str(rc))
+            self._connection_lost("unexpected disconnect: {}".format(mqtt.error_string(rc)))
         else:
+            with self._state_lock:
+                # a connection dropped by _drop_connection stays in backoff until the next attempt
+                if self._state != STATE_BACKOFF:
+                    self._state = STATE_DISCONNECTED
+            self._connected.clear()
             self._logger.info("Disconnected: %s", str(rc))
-
@@ -1,82 +1,396 @@
-import datetime
-import traceback
-from time import sleep
-from brew_thermometer.thermometer import Thermometer
+import signal
+import threading
+import time
+from time import monotonic
+from brew_thermometer.thermometer import Thermometer, RESOLUTION_DEGREES_C
+from brew_thermometer.thermometer_reader import ThermometerReader
+from brew_thermometer.device_index import DeviceIndex
+from brew_thermometer.read_scheduler import ReadScheduler
+from brew_thermometer.deadband_filter import DeadbandFilter
+from brew_thermometer.adaptive_sampler import AdaptiveSampler, DEFAULT_RESOLUTION_DEGREES_C
+from brew_thermometer.reading_history import ReadingHistory
+from brew_thermometer.reading_aggregator import ReadingAggregator
+from brew_thermometer.reading_archive import ReadingArchive
 from brew_thermometer.configuration import load_config
 from brew_thermometer.logging import get_logger
 from brew_thermometer.aws_iot_reporter import AwsIotReporter
+from brew_thermometer.outbox import Outbox
+from brew_thermometer.publisher import Publisher, ReadingQueue
+from brew_thermometer.dispatcher import ReadingDispatcher, create_sink
+from brew_thermometer.gateway import GatewayServer, GATEWAY_MODE_SERVER, GATEWAY_MODE_CLIENT
+from brew_thermometer.gateway_reporter import GatewayReporter
+from brew_thermometer.histogram import Histogram
+from brew_thermometer.metrics_server import MetricsServer
+from brew_thermometer.instrumentation import Instrumentation, NULL_INSTRUMENTATION, STAGE_CYCLE
+
+
+# the name the AWS IoT reporter goes by among the sinks readings are dispatched to
+PRIMARY_SINK_NAME = 'aws_iot'
+# how long shutdown waits for each publisher to finish the readings it is publishing
+SHUTDOWN_TIMEOUT_SECONDS = 5
 
 
 class BrewThermometerApp:
     def __init__(self):
         config = load_config()
         self._logger = get_logger(config.get_log_level(), __name__, config.is_developer_mode())
-        self._thermometers = self._load_thermometers(config.get_thermometer_configs())
-        self._temperature_reporter = AwsIotReporter(config.get_temperature_reporter_config(), self._logger)
-        self.read_interval_seconds = config.get_read_interval_seconds()
+        if config.is_instrumentation_enabled():
+            self._instrumentation = Instrumentation(config.get_instrumentation_summary_interval_seconds(), self._logger)
+        else:
+            self._instrumentation = NULL_INSTRUMENTATION
+        self._read_scheduler = ReadScheduler()
+        self._deadband_filter = DeadbandFilter()
+        self._adaptive_sampler = AdaptiveSampler()
+        self._reading_aggregator = ReadingAggregator()
+        self._history_size = config.get_history_size()
+        self._devices_root = config.get_devices_root()
+        self._config = config
+        self._device_index = None
+        if config.is_discovery_enabled():
+            self._device_index = DeviceIndex(self._logger, config.get_discovery_interval_seconds(), self._devices_root)
+            self._thermometers = self._load_thermometers(self._get_discovered_thermometer_configs())
+        else:
+            self._thermometers = self._load_thermometers(config.get_thermometer_configs())
+        self._archive = None
+        if config.get_archive_path() is not None:
+            self._archive = ReadingArchive(
+                config.get_archive_path(),
+                self._logger,
+                config.get_archive_segment_seconds(),
+                config.get_archive_retention_seconds(),
+                config.get_archive_flush_interval_seconds(),
+                config.get_archive_index_bucket_seconds()
+            )
+        self._outbox = Outbox(config.get_outbox_path(), config.get_outbox_max_readings(),
+                              config.get_outbox_max_age_seconds(), self._logger)
+        gateway_mode = config.get_gateway_mode()
+        if gateway_mode == GATEWAY_MODE_CLIENT:
+            self._temperature_reporter = GatewayReporter(
+                config.get_gateway_config(), self._logger, self._outbox,
+                lambda: AwsIotReporter(config.get_temperature_reporter_config(), self._logger, self._outbox,
+                                       self._instrumentation)
+            )
+        else:
+            self._temperature_reporter = AwsIotReporter(config.get_temperature_reporter_config(), self._logger,
+                                                        self._outbox, self._instrumentation)
         self.loop_interval_seconds = config.get_loop_interval_seconds()
+        self._reading_queue = ReadingQueue(config.get_publish_queue_size(), config.get_publish_queue_policy())
+        self._publisher = Publisher(self._reading_queue, self._outbox, self._temperature_reporter,
+                                    self._record_reported_temps, self._logger)
+        self._dispatcher = ReadingDispatcher(self._logger)
+        self._dispatcher.add_sink(PRIMARY_SINK_NAME, self._reading_queue, self._publisher)
+        for sink_config in config.get_sink_configs():
+            self._dispatcher.add_sink(sink_config['name'], *create_sink(sink_config, self._logger))
+        self._thermometer_reader = ThermometerReader(
+            {thermometer_id: info['thermometer'] for thermometer_id, info in iter(self._thermometers.items())},
+            config.get_read_mode(),
+            config.get_read_worker_count(),
+            self._logger,
+            self._devices_root,
+            config.get_read_timeout_seconds(),
+            config.get_quarantine_initial_seconds(),
+            config.get_quarantine_max_seconds()
+        )
+        self._gateway_server = None
+        if gateway_mode == GATEWAY_MODE_SERVER:
+            self._gateway_server = GatewayServer(config.get_gateway_config(), self._logger, self._dispatch_payloads)
+        self._read_duration_histogram = Histogram()
+        self._metrics_server = None
+        if config.get_metrics_port() is not None:
+            self._metrics_server = MetricsServer(config.get_metrics_host(), config.get_metrics_port(), self._logger)
+        self._stopped = threading.Event()
 
     def run(self):
-        while True:
-            try:
-                self._logger.debug("Looping")
-                read_temps = self._try_read_thermometers()
-                reported_temp_ids = self._report_read_temperatures(read_temps)
-                self._record_reported_temps(reported_temp_ids)
-            except Exception as e:
-                self._logger.error("Error while reading thermometers: {}\n\n".format(e, ))
-                self._logger.exception(traceback.format_exc())
-
-            sleep(self.loop_interval_seconds)
-
-    def _try_read_thermometers(self):
+        """
+        Reads and publishes thermometers until stop is called or the daemon is sent SIGTERM, then shuts down.
+        """
+        signal.signal(signal.SIGTERM, lambda signum, frame: self.stop())
+        self._dispatcher.start()
+        if self._gateway_server is not None:
+            self._gateway_server.start()
+        if self._metrics_server is not None:
+            self._metrics_server.start()
+        try:
+            while not self._stopped.is_set():
+                self.run_once()
+                self._sleep_until_next_read()
+        finally:
+            self._shutdown()
+
+    def stop(self):
+        """
+        Asks the read loop to stop; safe to call from a signal handler or another thread.
+        """
+        self._stopped.set()
+
+    def run_once(self):
+        """
+        Reads the thermometers that are due, hands their readings to the publisher and schedules their next reads.
+        """
+        if self._device_index is not None:
+            self._update_discovered_thermometers()
+        due_ids = self._read_scheduler.pop_due()
+        handled_temp_ids = []
+        cycle_started = self._instrumentation.start_stage()
+        try:
+            self._logger.debug("Looping; due: %s", due_ids)
+            read_temps = self._try_read_thermometers(due_ids)
+            publish_temps, window_summaries = self._reading_aggregator.add(read_temps)
+            for thermometer_id, summary in iter(window_summaries.items()):
+                publish_temps[thermometer_id] = summary["temperature_degrees_celsius"]
+            self._queue_read_temperatures(self._deadband_filter.filter(publish_temps), window_summaries)
+            handled_temp_ids = list(read_temps.keys())
+            if self._archive is not None and read_temps:
+                self._archive.append(read_temps, time.time())
+            self._instrumentation.end_stage(STAGE_CYCLE, cycle_started)
+            self._instrumentation.log_summary_if_due()
+            if self._metrics_server is not None:
+                self._metrics_server.update(self._get_metrics_snapshot())
+        except Exception as e:
+            self._logger.exception("Error while reading thermometers: %s", e)
+        finally:
+            self._schedule_next_reads(due_ids, handled_temp_ids)
+
+    def get_reading_history(self, thermometer_id):
+        """
+        Returns the ReadingHistory of a thermometer's recent readings and their rolling statistics, so callers can query
+        them without reading the thermometer again.
+        """
+        return self._thermometers[thermometer_id]["history"]
+
+    def get_archive(self):
+        """
+        Returns the ReadingArchive every reading is kept in, or None if archiving is disabled.
+        """
+        return self._archive
+
+    def _try_read_thermometers(self, due_ids):
         read_values = {}
-        for thermometer_id, thermometer_info in iter(self._thermometers.items()):
-            if self._should_read_thermometer(thermometer_info["last_read"]):
-                temp = thermometer_info['thermometer'].get_temperature_c()
-                if temp is not None:
-                    self._logger.debug("Read temperature %s from thermometer %s", str(temp), thermometer_id)
-                    read_values[thermometer_id] = temp
-                else:
-                    self._logger.warn("Could not read thermometer with ID {0}".format(thermometer_id))
+        for thermometer_id, (temp, duration_seconds) in iter(self._thermometer_reader.read(due_ids).items()):
+            self._thermometers[thermometer_id]["last_read_duration_seconds"] = duration_seconds
+            self._read_duration_histogram.observe(duration_seconds)
+            if temp is not None:
+                self._logger.debug("Read temperature %s from thermometer %s in %.3f seconds",
+                                   temp, thermometer_id, duration_seconds)
+                self._thermometers[thermometer_id]["history"].append(monotonic(), temp)
+                read_values[thermometer_id] = temp
+            else:
+                self._logger.warning("Could not read thermometer with ID %s (took %.3f seconds)",
+                                     thermometer_id, duration_seconds)
 
         return read_values
 
-    def _should_read_thermometer(self, last_read_time):
-        if last_read_time is None or \
-                (datetime.datetime.now() - last_read_time).total_seconds() > self.read_interval_seconds:
-            return True
-        else:
-            return False
+    def _schedule_next_reads(self, due_ids, handled_temp_ids):
+        """
+        Thermometers whose reading was handed to the publisher (or deliberately suppressed by the deadband filter) are
+        next read on their regular schedule, whether or not it could be published yet; thermometers with adaptive reads
+        first have their interval adapted to their recent readings. Those that could not be read are retried after
+        loop_interval_seconds, or once their quarantine ends if their read timed out.
+        """
+        handled_temp_ids = set(handled_temp_ids)
+        for thermometer_id in due_ids:
+            if thermometer_id in handled_temp_ids:
+                self._adapt_read_interval(thermometer_id)
+                missed_deadlines = self._read_scheduler.reschedule(thermometer_id)
+                if missed_deadlines:
+                    self._logger.warning("Read of thermometer %s overran its interval; skipped %d deadline(s). "
+                                         "Scheduling lateness: %s", thermometer_id, missed_deadlines,
+                                         self._read_scheduler.get_lateness_stats())
+            else:
+                retry_seconds = max(self.loop_interval_seconds,
+                                    self._thermometer_reader.get_quarantine_remaining_seconds(thermometer_id))
+                self._read_scheduler.retry(thermometer_id, retry_seconds)
+
+    def _adapt_read_interval(self, thermometer_id):
+        if not self._adaptive_sampler.is_adaptive(thermometer_id) or thermometer_id not in self._thermometers:
+            return
+
+        interval_seconds = self._read_scheduler.get_interval(thermometer_id)
+        next_interval_seconds = self._adaptive_sampler.get_next_interval(
+            thermometer_id, self._thermometers[thermometer_id]["history"], interval_seconds)
+        if next_interval_seconds != interval_seconds:
+            self._logger.debug("Reading thermometer %s every %.1f seconds (was %.1f)",
+                               thermometer_id, next_interval_seconds, interval_seconds)
+            self._read_scheduler.set_interval(thermometer_id, next_interval_seconds)
+
+    def _sleep_until_next_read(self):
+        seconds_until_wakeup = self._get_seconds_until_wakeup()
+        if seconds_until_wakeup > 0:
+            self._stopped.wait(seconds_until_wakeup)
+
+    def _get_seconds_until_wakeup(self):
+        """
+        Returns how long the loop may sleep: until the next thermometer is due to be read or, if discovery is enabled,
+        until the buses are next checked for thermometers plugged in or removed, whichever comes first.
+        """
+        seconds_until_wakeup = self._read_scheduler.seconds_until_next_due()
+        if seconds_until_wakeup is None:
+            seconds_until_wakeup = self.loop_interval_seconds
+        if self._device_index is not None:
+            seconds_until_wakeup = min(seconds_until_wakeup, self._device_index.seconds_until_next_check())
 
-    def _report_read_temperatures(self, read_temps):
-        successful_reports = []
+        return seconds_until_wakeup
+
+    def _shutdown(self):
+        """
+        Stops the threads started by run and flushes the readings still buffered for the archive to disk.
+        """
+        self._logger.info("Shutting down")
+        if self._metrics_server is not None:
+            self._metrics_server.stop()
+        if self._gateway_server is not None:
+            self._gateway_server.stop(SHUTDOWN_TIMEOUT_SECONDS)
+        self._dispatcher.stop(SHUTDOWN_TIMEOUT_SECONDS)
+        self._temperature_reporter.stop(SHUTDOWN_TIMEOUT_SECONDS)
+        if self._archive is not None:
+            self._archive.close()
+
+    def _queue_read_temperatures(self, read_temps, window_summaries=None):
+        """
+        Hands a payload for each read temperature to the publisher, returning the IDs of the thermometers queued. The
+        payloads of aggregated thermometers also carry their window's summary from window_summaries.
+        """
         for thermometer_id, temp_degrees_c in iter(read_temps.items()):
-            payload = {
+            payload_hash = {
                 "thermometer_id": thermometer_id,
                 "description": self._thermometers[thermometer_id]["description"],
-                "temperature_degrees_celsius": temp_degrees_c
+                "temperature_degrees_celsius": temp_degrees_c,
+                "timestamp": time.time()
+            }
+            if window_summaries and thermometer_id in window_summaries:
+                payload_hash.update(window_summaries[thermometer_id])
+            self._dispatch_payloads([payload_hash])
+
+        return list(read_temps.keys())
+
+    def _dispatch_payloads(self, payload_hashes):
+        """
+        Hands payloads to every sink; the gateway server hands over the readings it receives from its clients here.
+        """
+        for payload_hash in payload_hashes:
+            for sink_name in self._dispatcher.put(payload_hash):
+                self._logger.warning("Publish queue of sink %s is full; dropped the oldest queued reading. "
+                                     "Sink stats: %s", sink_name, self._dispatcher.get_stats()[sink_name])
+
+    def _get_metrics_snapshot(self):
+        """
+        Collects the latest reading of each thermometer and the daemon's counters, as served by the MetricsServer.
+        """
+        monotonic_offset = time.time() - monotonic()
+        deadband_stats = self._deadband_filter.get_stats()
+        adaptive_stats = self._adaptive_sampler.get_stats()
+        failure_counts = self._instrumentation.get_failure_counts()
+        timeout_stats = self._thermometer_reader.get_timeout_stats()
+        thermometers = {}
+        for thermometer_id, info in iter(self._thermometers.items()):
+            thermometer_snapshot = {
+                'description': info['description'],
+                'bus_master': self._thermometer_reader.get_bus_master_name(thermometer_id),
+                'read_duration_seconds': info['last_read_duration_seconds'],
+                'read_interval_seconds': self._read_scheduler.get_interval(thermometer_id),
             }
+            latest = info['history'].get_latest()
+            if latest is not None:
+                thermometer_snapshot['temperature_degrees_celsius'] = latest[1]
+                thermometer_snapshot['last_read_timestamp'] = latest[0] + monotonic_offset
+            if info['last_reported'] is not None:
+                thermometer_snapshot['last_reported_timestamp'] = info['last_reported']
+            thermometer_snapshot.update(info['history'].get_stats())
+            thermometer_snapshot.update(deadband_stats.get(thermometer_id, {}))
+            thermometer_snapshot.update(adaptive_stats.get(thermometer_id, {}))
+            thermometer_snapshot.update(failure_counts.get(thermometer_id, {}))
+            thermometer_snapshot.update(timeout_stats.get(thermometer_id, {}))
+            thermometers[thermometer_id] = thermometer_snapshot
 
-            if self._temperature_reporter.publish_payload(payload):
-                self._logger.debug("Published payload: %s", str(payload))
-                successful_reports.append(thermometer_id)
+        histograms = {
+            'read_duration_seconds': self._read_duration_histogram.get_snapshot(),
+            'read_to_ack_seconds': self._publisher.get_latency_histogram(),
+        }
+        for stage, histogram in iter(self._instrumentation.get_stage_histograms().items()):
+            histograms['stage_{}_seconds'.format(stage)] = histogram
 
-        return successful_reports
+        snapshot = {
+            'thermometers': thermometers,
+            'buses': self._thermometer_reader.get_bus_stats(),
+            'publisher': self._publisher.get_stats(),
+            'sinks': self._dispatcher.get_stats(),
+            'connection': self._temperature_reporter.get_connection_stats(),
+            'scheduler': self._read_scheduler.get_lateness_stats(),
+            'histograms': histograms,
+        }
+        if self._gateway_server is not None:
+            snapshot['gateway'] = self._gateway_server.get_stats()
+        if self._archive is not None:
+            snapshot['archive'] = self._archive.get_stats()
+
+        return snapshot
 
     def _record_reported_temps(self, reported_temp_ids):
         for thermometer_id in reported_temp_ids:
-            self._thermometers[thermometer_id]["last_read"] = datetime.datetime.now()
+            # a thermometer unplugged since its reading was queued is no longer tracked
+            if thermometer_id in self._thermometers:
+                self._thermometers[thermometer_id]["last_reported"] = time.time()
 
     def _load_thermometers(self, thermometer_configs):
         thermometers = {}
 
         for conf in thermometer_configs:
-            self._logger.debug("Thermometer: %s - %s", conf.id, conf.description)
-            thermometers[conf.id] = {
-                'thermometer': Thermometer(conf.id, self._logger),
-                'description': conf.description,
-                'last_read': None
-            }
+            thermometers[conf.id] = self._create_thermometer(conf)
 
         return thermometers
+
+    def _create_thermometer(self, conf):
+        self._logger.debug("Thermometer: %s - %s", conf.id, conf.description)
+        thermometer = Thermometer(conf.id, self._logger, conf.resolution, conf.read_attribute,
+                                  self._instrumentation, self._devices_root)
+        thermometer.apply_resolution()
+        self._adaptive_sampler.configure(conf.id, conf.min_read_interval_seconds, conf.max_read_interval_seconds,
+                                         conf.adaptive_slope_threshold_degrees_c_per_hour,
+                                         conf.adaptive_noise_threshold_degrees_c,
+                                         RESOLUTION_DEGREES_C.get(conf.resolution, DEFAULT_RESOLUTION_DEGREES_C))
+        self._read_scheduler.add(conf.id,
+                                 self._adaptive_sampler.get_initial_interval(conf.id, conf.read_interval_seconds))
+        self._deadband_filter.configure(conf.id, conf.deadband_degrees_celsius, conf.heartbeat_seconds)
+        self._reading_aggregator.configure(conf.id, conf.aggregation_window_seconds)
+        return {
+            'thermometer': thermometer,
+            'description': conf.description,
+            'last_reported': None,
+            'last_read_duration_seconds': None,
+            'history': ReadingHistory(self._history_size)
+        }
+
+    def _get_discovered_thermometer_configs(self):
+        """
+        Returns the configuration of every thermometer found on the buses; configured thermometers that were not found
+        are picked up once they appear.
+        """
+        self._device_index.refresh(force=True)
+        discovered_ids = self._device_index.get_device_ids()
+        for conf in self._config.get_thermometer_configs():
+            if conf.id not in discovered_ids:
+                self._logger.warning("Configured thermometer %s was not found on any bus", conf.id)
+
+        return [self._config.get_thermometer_config(thermometer_id) for thermometer_id in discovered_ids]
+
+    def _update_discovered_thermometers(self):
+        """
+        Starts reading thermometers plugged in since the last check of the device index and stops reading those removed.
+        """
+        added_ids, removed_ids = self._device_index.refresh()
+        for thermometer_id in removed_ids:
+            info = self._thermometers.pop(thermometer_id, None)
+            if info is not None:
+                info['thermometer'].close()
+            self._read_scheduler.remove(thermometer_id)
+            self._thermometer_reader.remove_thermometer(thermometer_id)
+            self._deadband_filter.remove(thermometer_id)
+            self._reading_aggregator.remove(thermometer_id)
+            self._adaptive_sampler.remove(thermometer_id)
+            self._instrumentation.remove_thermometer(thermometer_id)
+
+        for thermometer_id in added_ids:
+            info = self._create_thermometer(self._config.get_thermometer_config(thermometer_id))
+            self._thermometers[thermometer_id] = info
+            self._thermometer_reader.add_thermometer(thermometer_id, info['thermometer'],
+                                                     self._device_index.get_bus_master_name(thermometer_id))
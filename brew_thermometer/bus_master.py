@@ -0,0 +1,61 @@
+import os
+from os import path
+from brew_thermometer.thermometer import W1_DEVICES_ROOT
+
+
+BUS_MASTER_PREFIX = 'w1_bus_master'
+BULK_READ_TRIGGER = b'trigger\n'
+
+
+class BusMaster:
+    """
+    This class wraps a 1-Wire bus master (w1_bus_masterN) exposed by the kernel's w1 subsystem
+    """
+
+    def __init__(self, name, logger, devices_root=W1_DEVICES_ROOT):
+        self.name = name
+        self._bulk_read_path = path.join(devices_root, name, 'therm_bulk_read')
+        self._logger = logger.getChild(name)
+        self._bulk_read_supported = None
+
+    def trigger_bulk_read(self):
+        """
+        Starts a temperature conversion on every thermometer on the bus at once by writing to the master's
+        therm_bulk_read attribute. Subsequent reads of each thermometer return the converted value without starting
+        (and waiting on) a conversion of their own. Returns True if the conversion was triggered, or False if the
+        kernel does not support bulk reads on this bus or the trigger could not be written.
+        """
+        if self._bulk_read_supported is False:
+            return False
+
+        try:
+            # opened without O_CREAT, so a missing attribute surfaces as FileNotFoundError
+            fd = os.open(self._bulk_read_path, os.O_WRONLY)
+            try:
+                os.write(fd, BULK_READ_TRIGGER)
+            finally:
+                os.close(fd)
+        except FileNotFoundError:
+            self._logger.info("Bus master %s does not support therm_bulk_read; falling back to per-device reads",
+                              self.name)
+            self._bulk_read_supported = False
+            return False
+        except IOError as ioe:
+            self._logger.error("Could not trigger a bulk read via '%s': %s", self._bulk_read_path, ioe)
+            return False
+
+        self._bulk_read_supported = True
+        return True
+
+    @staticmethod
+    def get_bus_master_name(device_id, devices_root=W1_DEVICES_ROOT):
+        """
+        Returns the name of the bus master the given device is attached to, or None if it cannot be determined.
+        Device entries under /sys/bus/w1/devices are symlinks into the directory of the master they hang off of.
+        """
+        device_dir = path.realpath(path.join(devices_root, device_id))
+        master_name = path.basename(path.dirname(device_dir))
+        if master_name.startswith(BUS_MASTER_PREFIX):
+            return master_name
+        else:
+            return None
@@ -3,6 +3,18 @@ from os import environ
 
 from brew_thermometer.errors import ConfigurationError
 from brew_thermometer.logging import get_logger, DEFAULT_LOG_LEVEL_STR
+from brew_thermometer.outbox import IN_MEMORY_PATH
+from brew_thermometer.adaptive_sampler import DEFAULT_SLOPE_THRESHOLD_DEGREES_C_PER_HOUR, \
+    DEFAULT_NOISE_THRESHOLD_DEGREES_C
+from brew_thermometer.device_index import DEFAULT_DISCOVERY_INTERVAL_SECONDS
+from brew_thermometer.dispatcher import SINK_TYPES, SINK_TYPE_FILE, SINK_TYPE_MQTT
+from brew_thermometer.gateway import GATEWAY_MODES, DEFAULT_GATEWAY_MODE
+from brew_thermometer.instrumentation import DEFAULT_SUMMARY_INTERVAL_SECONDS
+from brew_thermometer.reading_archive import DEFAULT_SEGMENT_SECONDS, DEFAULT_RETENTION_SECONDS, \
+    DEFAULT_FLUSH_INTERVAL_SECONDS, DEFAULT_INDEX_BUCKET_SECONDS, MAX_SEGMENT_SECONDS
+from brew_thermometer.publisher import QUEUE_POLICIES, QUEUE_POLICY_BLOCK, QUEUE_POLICY_DROP_OLDEST
+from brew_thermometer.thermometer import READ_ATTRIBUTE_W1_SLAVE, READ_ATTRIBUTES, RESOLUTION_CONVERSION_SECONDS, \
+    W1_DEVICES_ROOT
 
 
 BREW_THERMOMETER_DEV_FLAG = 'BREW_THERMOMETER_DEVELOPMENT'
@@ -10,12 +22,31 @@ BREW_THERMOMETER_CONFIG_ENV_VAR = 'BREW_THERMOMETER_CONFIG'
 DEFAULT_CONFIG_PATH = '/etc/brew_thermometer/config.json'
 DEFAULT_READ_INTERVAL_SECONDS = 30
 DEFAULT_LOOP_INTERVAL_SECONDS = 1
+READ_MODE_SEQUENTIAL = 'sequential'
+READ_MODE_CONCURRENT = 'concurrent'
+READ_MODE_PER_BUS = 'per_bus'
+READ_MODE_BULK = 'bulk'
+READ_MODES = (READ_MODE_SEQUENTIAL, READ_MODE_CONCURRENT, READ_MODE_PER_BUS, READ_MODE_BULK)
+DEFAULT_READ_MODE = READ_MODE_SEQUENTIAL
+DEFAULT_READ_WORKER_COUNT = 8
+DEFAULT_QUARANTINE_INITIAL_SECONDS = 10
+DEFAULT_QUARANTINE_MAX_SECONDS = 600
+DEFAULT_OUTBOX_PATH = '/var/lib/brew_thermometer/outbox.sqlite3'
+DEFAULT_OUTBOX_MAX_READINGS = 500000
+DEFAULT_OUTBOX_MAX_AGE_SECONDS = 14 * 24 * 60 * 60
+DEFAULT_PUBLISH_QUEUE_SIZE = 1000
+DEFAULT_PUBLISH_QUEUE_POLICY = QUEUE_POLICY_DROP_OLDEST
+DEFAULT_HISTORY_SIZE = 720
+DEFAULT_METRICS_HOST = '127.0.0.1'
 
 
 class Configuration:
     def __init__(self, config_hash):
         self._config_hash = config_hash
         self._logger = get_logger(self.get_log_level(), __name__, self.is_developer_mode())
+        # the thermometers entries, parsed (and their warnings logged) on first use
+        self._thermometer_configs = None
+        self._thermometer_configs_by_id = None
 
     def get_log_level(self):
         if 'log_level' in self._config_hash:
@@ -36,43 +67,390 @@ class Configuration:
     def get_loop_interval_seconds(self):
         return self._parse_int('loop_interval_seconds', DEFAULT_LOOP_INTERVAL_SECONDS)
 
+    def get_read_mode(self):
+        return self._parse_choice('read_mode', READ_MODES, DEFAULT_READ_MODE)
+
+    def get_read_worker_count(self):
+        worker_count = self._parse_int('read_worker_count', DEFAULT_READ_WORKER_COUNT)
+        if worker_count < 1:
+            self._logger.warning(
+                "Invalid value for 'read_worker_count': %s; the value must be at least 1. Defaulting to %s",
+                worker_count,
+                DEFAULT_READ_WORKER_COUNT
+            )
+            return DEFAULT_READ_WORKER_COUNT
+
+        return worker_count
+
+    def get_read_timeout_seconds(self):
+        """
+        Returns how long a single thermometer read may take before it is abandoned, or None if reads are not bounded.
+        """
+        if self._config_hash.get('read_timeout_seconds') is None:
+            return None
+
+        try:
+            read_timeout_seconds = float(self._config_hash['read_timeout_seconds'])
+            if read_timeout_seconds > 0:
+                return read_timeout_seconds
+        except (TypeError, ValueError):
+            pass
+
+        self._logger.warning(
+            "Invalid value for 'read_timeout_seconds': %s; the value must be a positive number. Not bounding reads",
+            self._config_hash['read_timeout_seconds']
+        )
+        return None
+
+    def get_quarantine_initial_seconds(self):
+        return self._parse_int('quarantine_initial_seconds', DEFAULT_QUARANTINE_INITIAL_SECONDS)
+
+    def get_quarantine_max_seconds(self):
+        return max(self._parse_int('quarantine_max_seconds', DEFAULT_QUARANTINE_MAX_SECONDS),
+                   self.get_quarantine_initial_seconds())
+
+    def get_devices_root(self):
+        return self._config_hash.get('devices_root', W1_DEVICES_ROOT)
+
+    def get_outbox_path(self):
+        if 'outbox_path' in self._config_hash:
+            return self._config_hash['outbox_path']
+        elif self.is_developer_mode():
+            return IN_MEMORY_PATH
+        else:
+            return DEFAULT_OUTBOX_PATH
+
+    def get_outbox_max_readings(self):
+        return self._parse_int('outbox_max_readings', DEFAULT_OUTBOX_MAX_READINGS)
+
+    def get_outbox_max_age_seconds(self):
+        return self._parse_int('outbox_max_age_seconds', DEFAULT_OUTBOX_MAX_AGE_SECONDS)
+
+    def get_publish_queue_size(self):
+        queue_size = self._parse_int('publish_queue_size', DEFAULT_PUBLISH_QUEUE_SIZE)
+        if queue_size < 1:
+            self._logger.warning(
+                "Invalid value for 'publish_queue_size': %s; the value must be at least 1. Defaulting to %s",
+                queue_size,
+                DEFAULT_PUBLISH_QUEUE_SIZE
+            )
+            return DEFAULT_PUBLISH_QUEUE_SIZE
+
+        return queue_size
+
+    def get_publish_queue_policy(self):
+        """
+        Returns the policy of the publish queue. The queue may only block while no other sinks are configured, as a
+        full queue would otherwise hold up every sink along with the read loop.
+        """
+        policy = self._parse_choice('publish_queue_policy', QUEUE_POLICIES, DEFAULT_PUBLISH_QUEUE_POLICY)
+        if policy == QUEUE_POLICY_BLOCK and self.get_sink_configs():
+            self._logger.warning(
+                "Invalid value for 'publish_queue_policy': %s; the publish queue may not block while other sinks are "
+                "configured. Defaulting to %s",
+                policy,
+                QUEUE_POLICY_DROP_OLDEST
+            )
+            return QUEUE_POLICY_DROP_OLDEST
+
+        return policy
+
+    def get_history_size(self):
+        history_size = self._parse_int('history_size', DEFAULT_HISTORY_SIZE)
+        if history_size < 1:
+            self._logger.warning(
+                "Invalid value for 'history_size': %s; the value must be at least 1. Defaulting to %s",
+                history_size,
+                DEFAULT_HISTORY_SIZE
+            )
+            return DEFAULT_HISTORY_SIZE
+
+        return history_size
+
+    def get_archive_path(self):
+        """
+        Returns the directory to archive readings in, or None if the archive is disabled.
+        """
+        return self._config_hash.get('archive_path')
+
+    def get_archive_segment_seconds(self):
+        segment_seconds = self._parse_int('archive_segment_seconds', DEFAULT_SEGMENT_SECONDS)
+        if not 1 <= segment_seconds <= MAX_SEGMENT_SECONDS:
+            self._logger.warning(
+                "Invalid value for 'archive_segment_seconds': %s; the value must be between 1 and %s. Defaulting to %s",
+                segment_seconds,
+                MAX_SEGMENT_SECONDS,
+                DEFAULT_SEGMENT_SECONDS
+            )
+            return DEFAULT_SEGMENT_SECONDS
+
+        return segment_seconds
+
+    def get_archive_retention_seconds(self):
+        return self._parse_int('archive_retention_seconds', DEFAULT_RETENTION_SECONDS)
+
+    def get_archive_flush_interval_seconds(self):
+        return self._parse_int('archive_flush_interval_seconds', DEFAULT_FLUSH_INTERVAL_SECONDS)
+
+    def get_archive_index_bucket_seconds(self):
+        index_bucket_seconds = self._parse_int('archive_index_bucket_seconds', DEFAULT_INDEX_BUCKET_SECONDS)
+        if index_bucket_seconds < 1:
+            self._logger.warning(
+                "Invalid value for 'archive_index_bucket_seconds': %s; the value must be at least 1. Defaulting to %s",
+                index_bucket_seconds,
+                DEFAULT_INDEX_BUCKET_SECONDS
+            )
+            return DEFAULT_INDEX_BUCKET_SECONDS
+
+        return index_bucket_seconds
+
+    def get_metrics_host(self):
+        return self._config_hash.get('metrics_host', DEFAULT_METRICS_HOST)
+
+    def get_metrics_port(self):
+        """
+        Returns the port to serve metrics on, or None if the metrics endpoint is disabled.
+        """
+        if self._config_hash.get('metrics_port') is None:
+            return None
+
+        metrics_port = self._parse_int('metrics_port', None)
+        if metrics_port is None or not 0 <= metrics_port <= 65535:
+            self._logger.warning(
+                "Invalid value for 'metrics_port': %s; the value must be a port number. Disabling the metrics endpoint",
+                self._config_hash['metrics_port']
+            )
+            return None
+
+        return metrics_port
+
+    def is_instrumentation_enabled(self):
+        return bool(self._config_hash.get('instrumentation', False))
+
+    def get_instrumentation_summary_interval_seconds(self):
+        return self._parse_int('instrumentation_summary_interval_seconds', DEFAULT_SUMMARY_INTERVAL_SECONDS)
+
+    def is_discovery_enabled(self):
+        return bool(self._config_hash.get('discovery', False))
+
+    def get_discovery_interval_seconds(self):
+        return self._parse_int('discovery_interval_seconds', DEFAULT_DISCOVERY_INTERVAL_SECONDS)
+
     def get_thermometer_configs(self):
-        return self._parse_thermometer_configs()
+        self._load_thermometer_configs()
+        return list(self._thermometer_configs)
+
+    def get_thermometer_config(self, thermometer_id):
+        """
+        Returns the configuration of the thermometer with the given ID: its entry under thermometers if it has one, or
+        the defaults for a thermometer found by discovery that has none.
+        """
+        self._load_thermometer_configs()
+        therm_config = self._thermometer_configs_by_id.get(thermometer_id)
+        if therm_config is not None:
+            return therm_config
+
+        return self._parse_thermometer_config({'id': thermometer_id})
 
     def get_temperature_reporter_config(self):
         return self._config_hash['aws_iot_configuration']
 
+    def get_sink_configs(self):
+        """
+        Returns the configuration hashes of the additional sinks readings are published to, skipping any that are
+        invalid.
+        """
+        sink_configs = []
+        for sink_conf in self._config_hash.get('sinks', []):
+            name = sink_conf.get('name')
+            if not name or name in [sink_config['name'] for sink_config in sink_configs]:
+                self._logger.warning("Ignoring sink without a unique name: %s", sink_conf)
+            elif sink_conf.get('type') not in SINK_TYPES:
+                self._logger.warning("Ignoring sink %s of invalid type %s; the type must be one of: %s",
+                                     name, sink_conf.get('type'), ", ".join(SINK_TYPES))
+            elif sink_conf['type'] == SINK_TYPE_FILE and not sink_conf.get('path'):
+                self._logger.warning("Ignoring file sink %s without a path", name)
+            elif sink_conf['type'] == SINK_TYPE_MQTT and not all(key in sink_conf
+                                                                 for key in ('host', 'port', 'topic_name')):
+                self._logger.warning("Ignoring MQTT sink %s without a host, port and topic_name", name)
+            else:
+                sink_configs.append(sink_conf)
+
+        return sink_configs
+
+    def get_gateway_mode(self):
+        return self._parse_choice('gateway_mode', GATEWAY_MODES, DEFAULT_GATEWAY_MODE)
+
+    def get_gateway_config(self):
+        return self._config_hash.get('gateway_configuration', {})
+
     def _parse_int(self, conf_key, default_val):
         if conf_key in self._config_hash:
             conf_val = self._config_hash[conf_key]
             try:
                 return int(conf_val)
-            except ValueError:
+            except (TypeError, ValueError):
+                self._logger.warning(
+                    "Invalid value for '%s': %s; the value must be an integer. Defaulting to %s",
+                    conf_key,
+                    conf_val,
+                    default_val
+                )
+
+        return default_val
+
+    def _parse_choice(self, conf_key, valid_values, default_val):
+        if conf_key in self._config_hash:
+            conf_val = self._config_hash[conf_key]
+            if conf_val in valid_values:
+                return conf_val
+            else:
                 self._logger.warning(
-                    "Invalid value for '{}': {}; the value must be an integer. Defaulting to {}",
+                    "Invalid value for '%s': %s; the value must be one of: %s. Defaulting to %s",
                     conf_key,
                     conf_val,
+                    ", ".join(valid_values),
                     default_val
                 )
 
         return default_val
 
+    def _load_thermometer_configs(self):
+        if self._thermometer_configs is None:
+            self._thermometer_configs = self._parse_thermometer_configs()
+            self._thermometer_configs_by_id = {}
+            for therm_config in self._thermometer_configs:
+                self._thermometer_configs_by_id.setdefault(therm_config.id, therm_config)
+
     def _parse_thermometer_configs(self):
         therm_configs = []
 
         if 'thermometers' in self._config_hash:
             for therm_conf in self._config_hash['thermometers']:
                 if 'id' in therm_conf and therm_conf['id']:
-                    description = therm_conf['description'] if 'description' in therm_conf else ""
-                    therm_configs.append(ThermometerConfiguration(therm_conf['id'], description))
+                    therm_configs.append(self._parse_thermometer_config(therm_conf))
 
         return therm_configs
 
+    def _parse_thermometer_config(self, therm_conf):
+        description = therm_conf['description'] if 'description' in therm_conf else ""
+        min_read_interval_seconds, max_read_interval_seconds = self._parse_thermometer_read_interval_bounds(therm_conf)
+        return ThermometerConfiguration(
+            therm_conf['id'],
+            description,
+            self._parse_thermometer_resolution(therm_conf),
+            self._parse_thermometer_read_attribute(therm_conf),
+            self._parse_thermometer_read_interval_seconds(therm_conf),
+            self._parse_thermometer_number(therm_conf, 'deadband_degrees_celsius', float, None, allow_zero=True),
+            self._parse_thermometer_number(therm_conf, 'heartbeat_seconds', int, None),
+            self._parse_thermometer_number(therm_conf, 'aggregation_window_seconds', int, None),
+            min_read_interval_seconds,
+            max_read_interval_seconds,
+            self._parse_thermometer_number(therm_conf, 'adaptive_slope_threshold_degrees_c_per_hour', float,
+                                           DEFAULT_SLOPE_THRESHOLD_DEGREES_C_PER_HOUR),
+            self._parse_thermometer_number(therm_conf, 'adaptive_noise_threshold_degrees_c', float,
+                                           DEFAULT_NOISE_THRESHOLD_DEGREES_C)
+        )
+
+    def _parse_thermometer_resolution(self, therm_conf):
+        if 'resolution' in therm_conf:
+            resolution = therm_conf['resolution']
+            if resolution in RESOLUTION_CONVERSION_SECONDS:
+                return resolution
+            else:
+                self._logger.warning(
+                    "Invalid resolution for thermometer %s: %s; the value must be one of: 9, 10, 11, or 12. Leaving "
+                    "the device's resolution unchanged",
+                    therm_conf['id'],
+                    resolution
+                )
+
+        return None
+
+    def _parse_thermometer_read_attribute(self, therm_conf):
+        if 'read_attribute' in therm_conf:
+            read_attribute = therm_conf['read_attribute']
+            if read_attribute in READ_ATTRIBUTES:
+                return read_attribute
+            else:
+                self._logger.warning(
+                    "Invalid read_attribute for thermometer %s: %s; the value must be one of: %s. Defaulting to %s",
+                    therm_conf['id'],
+                    read_attribute,
+                    ", ".join(READ_ATTRIBUTES),
+                    READ_ATTRIBUTE_W1_SLAVE
+                )
+
+        return READ_ATTRIBUTE_W1_SLAVE
+
+    def _parse_thermometer_read_interval_seconds(self, therm_conf):
+        return self._parse_thermometer_number(therm_conf, 'read_interval_seconds', int, self.get_read_interval_seconds())
+
+    def _parse_thermometer_read_interval_bounds(self, therm_conf):
+        """
+        Parses the bounds a thermometer's read interval is adapted between; (None, None) for a fixed interval.
+        """
+        min_read_interval_seconds = self._parse_thermometer_number(therm_conf, 'min_read_interval_seconds', int, None)
+        max_read_interval_seconds = self._parse_thermometer_number(therm_conf, 'max_read_interval_seconds', int, None)
+        if min_read_interval_seconds is None and max_read_interval_seconds is None:
+            return None, None
+        if min_read_interval_seconds is None or max_read_interval_seconds is None or \
+                min_read_interval_seconds >= max_read_interval_seconds:
+            self._logger.warning(
+                "Invalid read interval bounds for thermometer %s: %s to %s; both min_read_interval_seconds and "
+                "max_read_interval_seconds must be given, the min below the max. Reading at a fixed interval",
+                therm_conf['id'],
+                min_read_interval_seconds,
+                max_read_interval_seconds
+            )
+            return None, None
+
+        return min_read_interval_seconds, max_read_interval_seconds
+
+    def _parse_thermometer_number(self, therm_conf, conf_key, number_type, default_val, allow_zero=False):
+        """
+        Parses an optional positive (or, if allow_zero is True, non-negative) number from a thermometer's config.
+        """
+        if conf_key in therm_conf:
+            conf_val = therm_conf[conf_key]
+            try:
+                number = number_type(conf_val)
+                if number > 0 or (allow_zero and number == 0):
+                    return number
+            except (TypeError, ValueError):
+                pass
+
+            self._logger.warning(
+                "Invalid %s for thermometer %s: %s; the value must be a %s number. Defaulting to %s",
+                conf_key,
+                therm_conf['id'],
+                conf_val,
+                "non-negative" if allow_zero else "positive",
+                default_val
+            )
+
+        return default_val
+
 
 class ThermometerConfiguration:
-    def __init__(self, id, description):
+    def __init__(self, id, description, resolution=None, read_attribute=READ_ATTRIBUTE_W1_SLAVE,
+                 read_interval_seconds=DEFAULT_READ_INTERVAL_SECONDS, deadband_degrees_celsius=None,
+                 heartbeat_seconds=None, aggregation_window_seconds=None, min_read_interval_seconds=None,
+                 max_read_interval_seconds=None,
+                 adaptive_slope_threshold_degrees_c_per_hour=DEFAULT_SLOPE_THRESHOLD_DEGREES_C_PER_HOUR,
+                 adaptive_noise_threshold_degrees_c=DEFAULT_NOISE_THRESHOLD_DEGREES_C):
         self.id = id
         self.description = description
+        self.resolution = resolution
+        self.read_attribute = read_attribute
+        self.read_interval_seconds = read_interval_seconds
+        self.deadband_degrees_celsius = deadband_degrees_celsius
+        self.heartbeat_seconds = heartbeat_seconds
+        self.aggregation_window_seconds = aggregation_window_seconds
+        self.min_read_interval_seconds = min_read_interval_seconds
+        self.max_read_interval_seconds = max_read_interval_seconds
+        self.adaptive_slope_threshold_degrees_c_per_hour = adaptive_slope_threshold_degrees_c_per_hour
+        self.adaptive_noise_threshold_degrees_c = adaptive_noise_threshold_degrees_c
 
 
 def load_config():
@@ -81,22 +459,104 @@ def load_config():
     {
         "log_level": "warning",  # valid values: debug, info, warning, error, critical
         "read_interval_seconds": 30,  # how often to read and report values. if not specified, defaults to DEFAULT_READ_INTERVAL_SECONDS
-        "loop_interval_seconds": 1,  # how often to check to see if we need to read each thermometer. if not specified, defaults to DEFAULT_loop_INTERVAL_SECONDS
+        "loop_interval_seconds": 1,  # how long to wait before retrying a thermometer that could not be read or reported. if not specified, defaults to DEFAULT_LOOP_INTERVAL_SECONDS
+        "read_mode": "sequential",  # valid values: sequential, concurrent, per_bus, bulk. if not specified, defaults to DEFAULT_READ_MODE
+        "read_worker_count": 8,  # size of the worker pool used by the concurrent, per_bus and bulk read modes. if not specified, defaults to DEFAULT_READ_WORKER_COUNT
+        "read_timeout_seconds": 5,  # optional; abandon a thermometer read that takes longer than this and quarantine the thermometer, so a hung probe cannot stall the others. if not specified, reads are not bounded
+        "quarantine_initial_seconds": 10,  # how long a thermometer whose read timed out is left alone before it is tried again; doubles with each consecutive timeout. if not specified, defaults to DEFAULT_QUARANTINE_INITIAL_SECONDS
+        "quarantine_max_seconds": 600,  # the longest a timed out thermometer is quarantined for. if not specified, defaults to DEFAULT_QUARANTINE_MAX_SECONDS
+        "devices_root": "/sys/bus/w1/devices",  # where the 1-Wire devices are found; only changed to run against a simulated device tree. if not specified, defaults to W1_DEVICES_ROOT
+        "outbox_path": "/var/lib/brew_thermometer/outbox.sqlite3",  # where readings are kept until they are published. if not specified, defaults to DEFAULT_OUTBOX_PATH (in memory in developer mode)
+        "outbox_max_readings": 500000,  # the oldest unpublished readings are evicted past this many. if not specified, defaults to DEFAULT_OUTBOX_MAX_READINGS
+        "outbox_max_age_seconds": 1209600,  # unpublished readings older than this are evicted. if not specified, defaults to DEFAULT_OUTBOX_MAX_AGE_SECONDS
+        "publish_queue_size": 1000,  # how many readings may wait to be handed from the read loop to the publisher. if not specified, defaults to DEFAULT_PUBLISH_QUEUE_SIZE
+        "publish_queue_policy": "drop_oldest",  # what to do with a new reading when the publish queue is full. valid values: drop_oldest, coalesce (replace the queued reading from the same thermometer), block (only while no sinks are configured; otherwise drop_oldest). if not specified, defaults to DEFAULT_PUBLISH_QUEUE_POLICY
+        "history_size": 720,  # how many recent readings to keep in memory per thermometer for rolling statistics. if not specified, defaults to DEFAULT_HISTORY_SIZE
+        "archive_path": "/var/lib/brew_thermometer/archive",  # optional; keep every reading in a memory-mapped archive in this directory, to query history on the device. if not specified, readings are not archived
+        "archive_segment_seconds": 86400,  # how much time each archive segment file spans. if not specified, defaults to DEFAULT_SEGMENT_SECONDS
+        "archive_retention_seconds": 15552000,  # archive segments older than this are deleted. if not specified, defaults to DEFAULT_RETENTION_SECONDS
+        "archive_flush_interval_seconds": 60,  # how often archived readings are written to disk, in whole pages; a partial page is written once its oldest reading is 5 intervals old, and on shutdown. readings not yet written are lost if the daemon dies. if not specified, defaults to DEFAULT_FLUSH_INTERVAL_SECONDS
+        "archive_index_bucket_seconds": 300,  # the resolution of the summaries indexed for each archive segment, which answer downsampled queries without reading every record. if not specified, defaults to DEFAULT_INDEX_BUCKET_SECONDS
+        "metrics_host": "127.0.0.1",  # the address to serve metrics on. if not specified, defaults to DEFAULT_METRICS_HOST
+        "metrics_port": 9464,  # optional; serve metrics on this port, in the Prometheus text format at /metrics and as JSON at /metrics.json. if not specified, metrics are not served
+        "instrumentation": false,  # whether to time each stage of reading and publishing and count failures per thermometer. defaults to false
+        "instrumentation_summary_interval_seconds": 300,  # how often to log a summary of stage timings and failures when instrumentation is enabled. if not specified, defaults to DEFAULT_SUMMARY_INTERVAL_SECONDS
+        "discovery": false,  # whether to read every DS18B20 found on the 1-Wire buses, picking up probes as they are plugged in or removed. the thermometers entries then only add settings to the probes they name. defaults to false
+        "discovery_interval_seconds": 10,  # how often to check the bus masters for added or removed probes when discovery is enabled. if not specified, defaults to DEFAULT_DISCOVERY_INTERVAL_SECONDS
+        "gateway_mode": "off",  # valid values: off, server (accept readings from other daemons and publish them upstream along with this one's), client (send readings to the gateway, publishing directly while it cannot be reached). if not specified, defaults to DEFAULT_GATEWAY_MODE
+        "gateway_configuration": {  # optional; how the gateway server and its clients reach each other
+            "transport": "unix",  # valid values: unix (a datagram socket, for daemons on the same machine), udp (for daemons on the LAN). defaults to unix
+            "socket_path": "/run/brew_thermometer/gateway.sock",  # unix transport: the socket the server listens on. defaults to DEFAULT_SOCKET_PATH
+            "host": "127.0.0.1",  # udp transport: the address the server listens on, or the server's address for clients. defaults to DEFAULT_GATEWAY_HOST
+            "port": 9465,  # udp transport: the port the server listens on. defaults to DEFAULT_GATEWAY_PORT
+            "max_batch_size": 50,  # clients: how many readings to send to the gateway at once
+            "max_linger_seconds": 0,  # clients: how long a partial batch may wait for more readings before it's sent
+            "ack_timeout_seconds": 2,  # clients: how long to wait for the gateway to acknowledge a batch before publishing directly
+            "retry_seconds": 60,  # clients: how long to publish directly before trying the gateway again
+            "client_expiry_seconds": 300  # server: how long a client that has stopped sending batches still counts as connected
+        },
         thermometers: [
             {
                 "id": "28-0000075eddab",  # the device ID of the thermometer
-                "description": "Fermenter (Internal)"  # human readable description of the thermometer (e.g. "ambient air", "fermenter", etc.)
+                "description": "Fermenter (Internal)",  # human readable description of the thermometer (e.g. "ambient air", "fermenter", etc.)
+                "resolution": 12,  # optional conversion resolution in bits: 9 (0.5 C, ~94ms), 10 (~188ms), 11 (~375ms) or 12 (0.0625 C, ~750ms). if not specified, the device's resolution is left alone
+                "read_attribute": "w1_slave",  # optional sysfs attribute to read: w1_slave (raw scratchpad, CRC checked) or temperature (single integer). defaults to w1_slave
+                "read_interval_seconds": 30,  # optional per-thermometer read (sampling) interval. defaults to the top level read_interval_seconds
+                "deadband_degrees_celsius": 0.1,  # optional; only publish a reading if it moved more than this since the last published value. if not specified, every reading is published
+                "heartbeat_seconds": 900,  # optional; with a deadband, publish a reading at least this often even if it has not moved
+                "aggregation_window_seconds": 300,  # optional; instead of publishing every reading, publish one summary (mean, min, max, stddev, sample count) per window of this many seconds. if not specified, every reading is published
+                "min_read_interval_seconds": 10,  # optional, with max_read_interval_seconds; adapt the read interval between these bounds: read down to this often while the temperature is moving or noisy...
+                "max_read_interval_seconds": 600,  # ...and back off up to this often while it is stable. if not specified, the thermometer is read every read_interval_seconds
+                "adaptive_slope_threshold_degrees_c_per_hour": 0.5,  # optional; with adaptive reads, the temperature counts as moving once its recent trend is at least this steep
+                "adaptive_noise_threshold_degrees_c": 0.1  # optional; with adaptive reads, the temperature counts as noisy once its recent readings scatter this much (standard deviation) around their trend
             },
             ...
         ],
+        "sinks": [  # optional; further destinations every reading is also published to, each with its own queue and outbox
+            {
+                "name": "brewery_log",  # a unique name for the sink, used in logs and metrics
+                "type": "file",  # valid values: file, mqtt
+                "path": "/var/lib/brew_thermometer/readings.csv",  # file sinks: the file readings are appended to
+                "format": "csv",  # file sinks: valid values: csv, line_protocol (InfluxDB). defaults to csv
+                "measurement": "temperature",  # file sinks: the line protocol measurement name. defaults to temperature
+                "max_batch_size": 100,  # how many readings to write or publish at once
+                "max_linger_seconds": 10,  # how long a partial batch may wait for more readings before it's written
+                "retry_seconds": 30,  # file sinks: how long to wait before retrying after the file could not be written
+                "publish_queue_size": 1000,  # how many readings may wait for the sink. defaults to DEFAULT_SINK_QUEUE_SIZE
+                "publish_queue_policy": "drop_oldest",  # valid values: drop_oldest, coalesce. a sink never blocks the read loop
+                "outbox_path": ":memory:",  # where the sink keeps readings until they are delivered. defaults to memory
+                "outbox_max_readings": 10000  # the oldest undelivered readings are evicted past this many. defaults to DEFAULT_SINK_OUTBOX_MAX_READINGS
+            },
+            {
+                "name": "dashboard",
+                "type": "mqtt",  # takes the same settings as aws_iot_configuration, plus the sink settings above
+                "host": "192.168.1.10",
+                "port": 1883,
+                "topic_name": "brewery/temperature",
+                "tls": false  # whether to connect over TLS with the certificate settings. defaults to true
+            }
+        ],
         "aws_iot_configuration": {
             "host": "",
             "port": 8883,
             "certificate_authority_cert_file_path": "",
             "cert_file_path": "",
             "private_key_path": "",
+            "tls": true,  # whether to connect over TLS; only a broker on a trusted network should be used without it
             "thing_name": "BrewThermometer",
-            "topic_name": "temperature"
+            "topic_name": "temperature",
+            "max_batch_size": 50,  # how many readings to pack into each published message. 1 publishes each reading on its own, unbatched
+            "max_linger_seconds": 0,  # how long a partial batch may wait for more readings before it's published
+            "drain_batch_size": 100,  # how many readings to pack into each message when replaying a backlog left by an outage
+            "max_inflight_batches": 10,  # how many messages may be awaiting acknowledgement from the broker at once
+            "max_queued_messages": 100,  # how many messages the MQTT client may hold; publishing past this leaves readings in the outbox
+            "ack_timeout_seconds": 10,  # how long to wait for the broker to acknowledge a message before keeping it to retry
+            "drain_retry_seconds": 5,  # how long to wait before retrying to publish after a failure
+            "connect_timeout_seconds": 10,  # how long to wait for the first connection to the broker
+            "reconnect_min_delay_seconds": 1,  # the first reconnect backoff delay; it doubles with each failed attempt
+            "reconnect_max_delay_seconds": 120,  # the longest reconnect backoff delay
+            "payload_encoding": "json",  # valid values: json, compact (binary readings referring to sensors by index, described by a schema message published to <topic_name>/schema)
+            "delta_encoding": true  # whether the compact encoding stores readings as deltas within each batch
         }
     }
     """
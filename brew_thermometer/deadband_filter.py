@@ -0,0 +1,72 @@
+from time import monotonic
+
+
+class DeadbandFilter:
+    """
+    Decides which readings are worth publishing. A thermometer's reading is published only if it has moved more than
+    its deadband since the last value published for it, or if its heartbeat interval has passed since then, so long
+    flat stretches cost a heartbeat rather than a message per read. A thermometer with no deadband configured has every
+    reading published. Counts of published and suppressed readings are kept per thermometer.
+    """
+
+    def __init__(self, clock=monotonic):
+        self._clock = clock
+        self._settings = {}
+        self._last_published = {}
+        self._published_counts = {}
+        self._suppressed_counts = {}
+
+    def configure(self, thermometer_id, deadband_degrees_celsius, heartbeat_seconds):
+        """
+        Sets a thermometer's deadband (None or 0 to publish every reading) and heartbeat interval (None for no
+        heartbeat, so that only changes are published).
+        """
+        self._settings[thermometer_id] = (deadband_degrees_celsius, heartbeat_seconds)
+        self._published_counts.setdefault(thermometer_id, 0)
+        self._suppressed_counts.setdefault(thermometer_id, 0)
+
+    def remove(self, thermometer_id):
+        self._settings.pop(thermometer_id, None)
+        self._last_published.pop(thermometer_id, None)
+        self._published_counts.pop(thermometer_id, None)
+        self._suppressed_counts.pop(thermometer_id, None)
+
+    def filter(self, read_temps):
+        """
+        Returns the subset of read_temps (a dict of thermometer ID to degrees Celsius) that should be published.
+        """
+        now = self._clock()
+        to_publish = {}
+        for thermometer_id, temp_degrees_c in iter(read_temps.items()):
+            if self._should_publish(thermometer_id, temp_degrees_c, now):
+                self._last_published[thermometer_id] = (temp_degrees_c, now)
+                self._published_counts[thermometer_id] = self._published_counts.get(thermometer_id, 0) + 1
+                to_publish[thermometer_id] = temp_degrees_c
+            else:
+                self._suppressed_counts[thermometer_id] = self._suppressed_counts.get(thermometer_id, 0) + 1
+
+        return to_publish
+
+    def get_stats(self):
+        """
+        Returns a dict of thermometer ID to a dict of its published and suppressed reading counts.
+        """
+        return {
+            thermometer_id: {
+                'published': self._published_counts.get(thermometer_id, 0),
+                'suppressed': self._suppressed_counts.get(thermometer_id, 0),
+            }
+            for thermometer_id in set(self._published_counts) | set(self._suppressed_counts)
+        }
+
+    def _should_publish(self, thermometer_id, temp_degrees_c, now):
+        deadband_degrees_celsius, heartbeat_seconds = self._settings.get(thermometer_id, (None, None))
+        last_published = self._last_published.get(thermometer_id)
+        if not deadband_degrees_celsius or last_published is None:
+            return True
+
+        last_temp_degrees_c, last_published_at = last_published
+        if abs(temp_degrees_c - last_temp_degrees_c) > deadband_degrees_celsius:
+            return True
+
+        return heartbeat_seconds is not None and now - last_published_at >= heartbeat_seconds
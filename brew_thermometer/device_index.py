@@ -0,0 +1,126 @@
+import os
+from os import path
+from time import monotonic
+from brew_thermometer.bus_master import BUS_MASTER_PREFIX
+from brew_thermometer.thermometer import W1_DEVICES_ROOT
+
+
+# the 1-Wire family code of the DS18B20
+THERMOMETER_FAMILY_PREFIX = '28-'
+MASTER_SLAVES_ATTRIBUTE = 'w1_master_slaves'
+DEFAULT_DISCOVERY_INTERVAL_SECONDS = 10
+
+
+class DeviceIndex:
+    """
+    Keeps a cached index of the DS18B20s attached to the 1-Wire bus masters, mapping each device ID to the bus master
+    it hangs off of. The devices directory is scanned once to find the bus masters; after that, added and removed
+    devices are picked up by re-reading each master's w1_master_slaves list (a few dozen bytes per master) at most once
+    per check interval, rather than rescanning the tree. The directory is scanned again only if a bus master
+    disappears or the scan found none.
+    """
+
+    def __init__(self, logger, check_interval_seconds=DEFAULT_DISCOVERY_INTERVAL_SECONDS,
+                 devices_root=W1_DEVICES_ROOT, clock=monotonic):
+        self._logger = logger.getChild("DeviceIndex")
+        self._check_interval_seconds = check_interval_seconds
+        self._devices_root = devices_root
+        self._clock = clock
+        self._next_check = None
+        self._master_names = []
+        self._slaves_by_master = {}
+        self._devices = {}
+
+    def refresh(self, force=False):
+        """
+        Brings the index up to date if the check interval has passed (or force is set). Returns a tuple of the sorted
+        IDs of the devices added and removed since the last refresh.
+        """
+        now = self._clock()
+        if not force and self._next_check is not None and now < self._next_check:
+            return [], []
+        self._next_check = now + self._check_interval_seconds
+
+        if not self._master_names:
+            self._scan_masters()
+
+        devices, master_missing = self._read_devices()
+        if master_missing:
+            # a master went away (e.g. a USB adapter was unplugged); find out what is there now
+            self._scan_masters()
+            devices, _ = self._read_devices()
+
+        added_ids = sorted(set(devices) - set(self._devices))
+        removed_ids = sorted(set(self._devices) - set(devices))
+        for device_id in added_ids:
+            self._logger.info("Discovered thermometer %s on %s", device_id, devices[device_id])
+        for device_id in removed_ids:
+            self._logger.info("Thermometer %s is gone from %s", device_id, self._devices[device_id])
+        self._devices = devices
+        return added_ids, removed_ids
+
+    def seconds_until_next_check(self):
+        """
+        Returns the number of seconds until refresh next checks the bus masters (0 if it is already due).
+        """
+        if self._next_check is None:
+            return 0.0
+        return max(0.0, self._next_check - self._clock())
+
+    def get_device_ids(self):
+        return sorted(self._devices)
+
+    def get_bus_master_name(self, device_id):
+        """
+        Returns the name of the bus master the given device was last seen on, or None if it is not in the index.
+        """
+        return self._devices.get(device_id)
+
+    def _read_devices(self):
+        """
+        Returns a tuple of a dict of the thermometers on each known bus master, mapped to the master's name, and whether
+        any of the masters could not be found.
+        """
+        devices = {}
+        master_missing = False
+        for master_name in self._master_names:
+            slaves = self._read_master_slaves(master_name)
+            if slaves is None:
+                master_missing = True
+                continue
+
+            for device_id in slaves:
+                if device_id.startswith(THERMOMETER_FAMILY_PREFIX):
+                    devices[device_id] = master_name
+
+        return devices, master_missing
+
+    def _scan_masters(self):
+        try:
+            entries = os.listdir(self._devices_root)
+        except OSError as e:
+            self._logger.error("Could not list 1-Wire devices in '%s': %s", self._devices_root, e)
+            entries = []
+        self._master_names = sorted(entry for entry in entries if entry.startswith(BUS_MASTER_PREFIX))
+        self._slaves_by_master = {}
+        if not self._master_names:
+            self._logger.warning("No 1-Wire bus masters found in '%s'", self._devices_root)
+
+    def _read_master_slaves(self, master_name):
+        """
+        Returns the device IDs listed in a bus master's w1_master_slaves attribute, or None if the master is gone.
+        """
+        try:
+            with open(path.join(self._devices_root, master_name, MASTER_SLAVES_ATTRIBUTE)) as slaves_file:
+                contents = slaves_file.read()
+        except FileNotFoundError:
+            return None
+        except IOError as ioe:
+            self._logger.error("Could not read the devices on %s: %s", master_name, ioe)
+            # keep what was last seen on the master rather than dropping its devices over a transient error
+            return self._slaves_by_master.get(master_name, [])
+
+        # the kernel lists one device ID per line, or 'not found.' when the bus is empty
+        slaves = [line.strip() for line in contents.splitlines() if line.strip() and line.strip() != 'not found.']
+        self._slaves_by_master[master_name] = slaves
+        return slaves
@@ -0,0 +1,88 @@
+from brew_thermometer.aws_iot_reporter import AwsIotReporter
+from brew_thermometer.file_reporter import FileReporter
+from brew_thermometer.outbox import Outbox, IN_MEMORY_PATH
+from brew_thermometer.publisher import Publisher, ReadingQueue, QUEUE_POLICY_BLOCK, QUEUE_POLICY_DROP_OLDEST
+
+
+SINK_TYPE_MQTT = 'mqtt'
+SINK_TYPE_FILE = 'file'
+SINK_TYPES = (SINK_TYPE_MQTT, SINK_TYPE_FILE)
+DEFAULT_SINK_QUEUE_SIZE = 1000
+DEFAULT_SINK_QUEUE_POLICY = QUEUE_POLICY_DROP_OLDEST
+DEFAULT_SINK_OUTBOX_MAX_READINGS = 10000
+
+
+class ReadingDispatcher:
+    """
+    Fans each reading out to every configured sink. A sink is a reading queue, an outbox and a reporter driven by a
+    Publisher on its own thread, so each sink batches, retries and drops readings under its own policy, and a slow or
+    unreachable sink only ever backs up its own queue -- never the other sinks or the read loop. That holds as long as
+    no queue blocks: additional sinks never do, and Configuration only lets the primary queue block while it is the
+    only sink.
+    """
+
+    def __init__(self, logger):
+        self._logger = logger.getChild("ReadingDispatcher")
+        self._sinks = {}
+
+    def add_sink(self, name, reading_queue, publisher):
+        self._sinks[name] = (reading_queue, publisher)
+
+    def get_sink_names(self):
+        return list(self._sinks)
+
+    def start(self):
+        for _, publisher in self._sinks.values():
+            publisher.start()
+
+    def stop(self, timeout=None):
+        for _, publisher in self._sinks.values():
+            publisher.stop(timeout)
+
+    def put(self, payload_hash):
+        """
+        Queues a payload for every sink, returning the names of the sinks that had to drop a queued reading for it.
+        """
+        dropped_by = []
+        for name, (reading_queue, _) in iter(self._sinks.items()):
+            if not reading_queue.put(payload_hash):
+                dropped_by.append(name)
+
+        return dropped_by
+
+    def get_stats(self):
+        """
+        Returns a dict of each sink's name to its publisher's stats, plus whether its reporter is 'connected' and its
+        full connection stats under 'connection'.
+        """
+        sink_stats = {}
+        for name, (_, publisher) in iter(self._sinks.items()):
+            connection_stats = publisher.get_connection_stats()
+            sink_stats[name] = dict(publisher.get_stats(), connected=connection_stats['connected'],
+                                    connection=connection_stats)
+        return sink_stats
+
+
+def create_sink(sink_config, logger):
+    """
+    Builds the reading queue and publisher of an additional sink from its configuration. Its outbox is kept in memory
+    unless an outbox_path is configured. A sink may not use the block queue policy, as a full queue would then hold up
+    the read loop; it drops its oldest reading instead.
+    """
+    name = sink_config["name"]
+    sink_logger = logger.getChild("sink_{}".format(name))
+    policy = sink_config.get("publish_queue_policy", DEFAULT_SINK_QUEUE_POLICY)
+    if policy == QUEUE_POLICY_BLOCK:
+        sink_logger.warning("Sink %s may not block the read loop; dropping its oldest readings instead", name)
+        policy = QUEUE_POLICY_DROP_OLDEST
+
+    outbox = Outbox(sink_config.get("outbox_path", IN_MEMORY_PATH),
+                    int(sink_config.get("outbox_max_readings", DEFAULT_SINK_OUTBOX_MAX_READINGS)), 0, sink_logger)
+    if sink_config["type"] == SINK_TYPE_FILE:
+        reporter = FileReporter(sink_config, sink_logger, outbox)
+    else:
+        reporter = AwsIotReporter(sink_config, sink_logger, outbox)
+
+    reading_queue = ReadingQueue(int(sink_config.get("publish_queue_size", DEFAULT_SINK_QUEUE_SIZE)), policy)
+    publisher = Publisher(reading_queue, outbox, reporter, None, sink_logger, "Publisher-{}".format(name))
+    return reading_queue, publisher
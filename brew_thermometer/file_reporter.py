@@ -0,0 +1,140 @@
+import csv
+import io
+import os
+import time
+from time import monotonic
+from brew_thermometer.reporter import Reporter
+
+
+FILE_FORMAT_CSV = 'csv'
+FILE_FORMAT_LINE_PROTOCOL = 'line_protocol'
+FILE_FORMATS = (FILE_FORMAT_CSV, FILE_FORMAT_LINE_PROTOCOL)
+DEFAULT_FILE_FORMAT = FILE_FORMAT_CSV
+DEFAULT_FILE_MAX_BATCH_SIZE = 100
+DEFAULT_FILE_MAX_LINGER_SECONDS = 10
+DEFAULT_FILE_RETRY_SECONDS = 30
+DEFAULT_MEASUREMENT = 'temperature'
+CSV_COLUMNS = ('timestamp', 'thermometer_id', 'description', 'temperature_degrees_celsius')
+# fields of aggregated readings written alongside the temperature in line protocol
+SUMMARY_FIELDS = ('min_degrees_celsius', 'max_degrees_celsius', 'stddev_degrees_celsius', 'sample_count')
+
+
+class FileReporter(Reporter):
+    """
+    Appends readings from the outbox to a local file, as CSV (with a header line when the file is created) or in the
+    InfluxDB line protocol. Readings are written in batches of up to max_batch_size, one write per batch, and a partial
+    batch is held back until its oldest reading has waited max_linger_seconds, so the SD card sees a few large appends
+    rather than one small write per reading. If the file cannot be written, the readings stay in the outbox and the
+    write is retried after retry_seconds.
+    """
+
+    def __init__(self, config_hash, logger, outbox):
+        self._logger = logger.getChild("FileReporter")
+        self._outbox = outbox
+        self._path = config_hash["path"]
+        self._format = config_hash.get("format", DEFAULT_FILE_FORMAT)
+        if self._format not in FILE_FORMATS:
+            self._logger.warning("Invalid file format '%s'; the value must be one of: %s. Defaulting to %s",
+                                 self._format, ", ".join(FILE_FORMATS), DEFAULT_FILE_FORMAT)
+            self._format = DEFAULT_FILE_FORMAT
+        self._measurement = config_hash.get("measurement", DEFAULT_MEASUREMENT)
+        self._max_batch_size = max(1, int(config_hash.get("max_batch_size", DEFAULT_FILE_MAX_BATCH_SIZE)))
+        self._max_linger_seconds = float(config_hash.get("max_linger_seconds", DEFAULT_FILE_MAX_LINGER_SECONDS))
+        self._retry_seconds = float(config_hash.get("retry_seconds", DEFAULT_FILE_RETRY_SECONDS))
+        self._next_attempt = 0
+        self._write_errors = 0
+        self._failing = False
+
+    def drain(self, force=False):
+        if not len(self._outbox) or monotonic() < self._next_attempt:
+            return []
+
+        published = []
+        while len(self._outbox):
+            if not (force or len(self._outbox) >= self._max_batch_size or self._linger_expired()):
+                break
+
+            rows = self._outbox.peek(self._max_batch_size)
+            payloads = [payload_hash for _, payload_hash in rows]
+            if not self._append(payloads):
+                break
+            self._outbox.remove([reading_id for reading_id, _ in rows])
+            published.extend(payloads)
+
+        return published
+
+    def seconds_until_flush(self):
+        if not len(self._outbox):
+            return None
+        elif self._failing:
+            return max(0.0, self._next_attempt - monotonic())
+        elif len(self._outbox) >= self._max_batch_size:
+            return 0.0
+        else:
+            return max(0.0, self._outbox.oldest_created() + self._max_linger_seconds - time.time())
+
+    def get_connection_stats(self):
+        return {
+            'state': 'failing' if self._failing else 'writing',
+            'connected': not self._failing,
+            'write_errors': self._write_errors,
+        }
+
+    def _linger_expired(self):
+        oldest_created = self._outbox.oldest_created()
+        return oldest_created is not None and oldest_created + self._max_linger_seconds <= time.time()
+
+    def _append(self, payloads):
+        """
+        Appends the payloads to the file in a single write, returning whether they were written.
+        """
+        try:
+            new_file = not os.path.exists(self._path) or os.path.getsize(self._path) == 0
+            with open(self._path, 'a', newline='') as output_file:
+                output_file.write(self._format_payloads(payloads, new_file))
+        except OSError as ose:
+            self._write_errors += 1
+            if not self._failing:
+                self._logger.error("Could not write readings to '%s': %s; retrying in %.0f seconds", self._path, ose,
+                                   self._retry_seconds)
+            self._failing = True
+            self._next_attempt = monotonic() + self._retry_seconds
+            return False
+
+        if self._failing:
+            self._logger.info("Writing readings to '%s' again", self._path)
+        self._failing = False
+        return True
+
+    def _format_payloads(self, payloads, with_header):
+        if self._format == FILE_FORMAT_LINE_PROTOCOL:
+            return ''.join(self._format_line(payload_hash) for payload_hash in payloads)
+
+        output = io.StringIO()
+        writer = csv.writer(output, lineterminator='\n')
+        if with_header:
+            writer.writerow(CSV_COLUMNS)
+        for payload_hash in payloads:
+            writer.writerow([payload_hash.get(column, '') for column in CSV_COLUMNS])
+        return output.getvalue()
+
+    def _format_line(self, payload_hash):
+        tags = ',thermometer_id=' + _escape_tag(payload_hash["thermometer_id"])
+        if payload_hash.get("description"):
+            tags += ',description=' + _escape_tag(payload_hash["description"])
+
+        fields = 'temperature_degrees_celsius={}'.format(payload_hash["temperature_degrees_celsius"])
+        for field in SUMMARY_FIELDS:
+            if field in payload_hash:
+                value = payload_hash[field]
+                fields += ',{}={}'.format(field, '{}i'.format(value) if isinstance(value, int) else value)
+
+        return '{}{} {} {}\n'.format(_escape_tag(self._measurement), tags, fields,
+                                     int(round(payload_hash["timestamp"] * 1e9)))
+
+
+def _escape_tag(value):
+    """
+    Escapes the characters line protocol gives a meaning to in measurement names and tag keys and values.
+    """
+    return str(value).replace('\\', '\\\\').replace(',', '\\,').replace('=', '\\=').replace(' ', '\\ ')
@@ -0,0 +1,174 @@
+import json
+import os
+import socket
+import threading
+from time import monotonic
+
+
+GATEWAY_MODE_OFF = 'off'
+GATEWAY_MODE_SERVER = 'server'
+GATEWAY_MODE_CLIENT = 'client'
+GATEWAY_MODES = (GATEWAY_MODE_OFF, GATEWAY_MODE_SERVER, GATEWAY_MODE_CLIENT)
+DEFAULT_GATEWAY_MODE = GATEWAY_MODE_OFF
+TRANSPORT_UNIX = 'unix'
+TRANSPORT_UDP = 'udp'
+TRANSPORTS = (TRANSPORT_UNIX, TRANSPORT_UDP)
+DEFAULT_TRANSPORT = TRANSPORT_UNIX
+DEFAULT_SOCKET_PATH = '/run/brew_thermometer/gateway.sock'
+DEFAULT_GATEWAY_HOST = '127.0.0.1'
+DEFAULT_GATEWAY_PORT = 9465
+# the largest payload a single UDP datagram can carry; batches are kept below it on either transport
+MAX_DATAGRAM_BYTES = 65507
+# upper bound on how long the receiving thread waits for a datagram, so it notices being stopped
+MAX_RECEIVE_WAIT_SECONDS = 1.0
+# a client counts as connected while it has sent a batch this recently; clients rebind to a new address (a new
+# autobound Unix name or UDP source port) whenever they reconnect, so addresses not heard from are forgotten
+DEFAULT_CLIENT_EXPIRY_SECONDS = 300
+
+
+class GatewayServer:
+    """
+    Accepts batches of readings from sibling daemons running in gateway client mode, so a single daemon holds the one
+    upstream connection for a whole brewery. Each datagram carries a batch of reading payloads tagged with a batch
+    number; the batch is handed to on_payloads on the server's own thread and then acknowledged to the sender, which
+    keeps the readings in its outbox (and eventually publishes them itself) until the acknowledgement arrives.
+
+    Readings arrive over a Unix datagram socket for daemons on the same machine, or over UDP for daemons on the LAN.
+    Client addresses are forgotten once they have not sent a batch for client_expiry_seconds.
+    """
+
+    def __init__(self, config_hash, logger, on_payloads, clock=monotonic):
+        self._logger = logger.getChild("GatewayServer")
+        self._family, self._address = get_gateway_address(config_hash, self._logger)
+        self._on_payloads = on_payloads
+        self._client_expiry_seconds = float(config_hash.get("client_expiry_seconds", DEFAULT_CLIENT_EXPIRY_SECONDS))
+        self._clock = clock
+        self._socket = None
+        self._stopped = threading.Event()
+        self._thread = None
+        # client address to when it last sent a batch
+        self._clients = {}
+        self._clients_lock = threading.Lock()
+        self._next_client_expiry = 0
+        self._batches_received = 0
+        self._readings_received = 0
+        self._malformed_messages = 0
+
+    def start(self):
+        self._socket = socket.socket(self._family, socket.SOCK_DGRAM)
+        if self._family == socket.AF_UNIX and os.path.exists(self._address):
+            # left behind by a previous run; binding fails while it exists
+            os.unlink(self._address)
+        self._socket.bind(self._address)
+        self._socket.settimeout(MAX_RECEIVE_WAIT_SECONDS)
+        self._thread = threading.Thread(target=self._run, name="GatewayServer", daemon=True)
+        self._thread.start()
+        self._logger.info("Accepting readings on %s", self.get_address())
+
+    def stop(self, timeout=None):
+        self._stopped.set()
+        if self._thread is not None:
+            self._wake()
+            self._thread.join(timeout)
+        if self._socket is not None:
+            self._socket.close()
+            if self._family == socket.AF_UNIX and os.path.exists(self._address):
+                os.unlink(self._address)
+
+    def get_address(self):
+        """
+        Returns the address the server is listening on; a UDP port configured as 0 is chosen by the OS.
+        """
+        return self._socket.getsockname() if self._socket is not None else self._address
+
+    def get_stats(self):
+        with self._clients_lock:
+            self._expire_clients(self._clock())
+            client_count = len(self._clients)
+
+        return {
+            'clients': client_count,
+            'batches_received': self._batches_received,
+            'readings_received': self._readings_received,
+            'malformed_messages': self._malformed_messages,
+        }
+
+    def _wake(self):
+        """
+        Sends the server an empty datagram, so the receiving thread notices being stopped without waiting for its
+        receive timeout.
+        """
+        try:
+            with socket.socket(self._family, socket.SOCK_DGRAM) as wake_socket:
+                wake_socket.sendto(b'', self.get_address())
+        except OSError:
+            pass
+
+    def _run(self):
+        while not self._stopped.is_set():
+            try:
+                message, sender = self._socket.recvfrom(MAX_DATAGRAM_BYTES)
+            except socket.timeout:
+                continue
+            except OSError as ose:
+                self._logger.error("Error receiving readings: %s", ose)
+                self._stopped.wait(MAX_RECEIVE_WAIT_SECONDS)
+                continue
+            if self._stopped.is_set():
+                break
+
+            try:
+                self._handle_message(message, sender)
+            except Exception as e:
+                self._logger.exception("Error handling readings from %s: %s", sender, e)
+
+    def _handle_message(self, message, sender):
+        try:
+            batch = json.loads(message)
+            batch_number = batch["batch"]
+            payloads = batch["readings"]
+            if not all("thermometer_id" in payload_hash and "timestamp" in payload_hash for payload_hash in payloads):
+                raise ValueError("readings without a thermometer_id or timestamp")
+        except (ValueError, TypeError, KeyError) as e:
+            self._malformed_messages += 1
+            self._logger.warning("Ignoring malformed readings from %s: %s", sender, e)
+            return
+
+        self._on_payloads(payloads)
+        self._batches_received += 1
+        self._readings_received += len(payloads)
+        if not sender:
+            # a Unix socket client that is not bound to an address cannot be answered
+            self._logger.debug("Not acknowledging batch %s from an unbound client", batch_number)
+            return
+
+        now = self._clock()
+        with self._clients_lock:
+            self._clients[sender] = now
+            if now >= self._next_client_expiry:
+                self._expire_clients(now)
+                self._next_client_expiry = now + self._client_expiry_seconds
+        self._socket.sendto(json.dumps({"ack": batch_number}).encode('utf-8'), sender)
+
+    def _expire_clients(self, now):
+        expired = [client for client, last_seen in self._clients.items()
+                   if last_seen <= now - self._client_expiry_seconds]
+        for client in expired:
+            del self._clients[client]
+
+
+def get_gateway_address(config_hash, logger):
+    """
+    Returns the (socket family, address) of the gateway described by a gateway configuration hash.
+    """
+    transport = config_hash.get("transport", DEFAULT_TRANSPORT)
+    if transport not in TRANSPORTS:
+        logger.warning("Invalid gateway transport '%s'; the value must be one of: %s. Defaulting to %s",
+                       transport, ", ".join(TRANSPORTS), DEFAULT_TRANSPORT)
+        transport = DEFAULT_TRANSPORT
+
+    if transport == TRANSPORT_UDP:
+        return socket.AF_INET, (config_hash.get("host", DEFAULT_GATEWAY_HOST),
+                                int(config_hash.get("port", DEFAULT_GATEWAY_PORT)))
+    else:
+        return socket.AF_UNIX, config_hash.get("socket_path", DEFAULT_SOCKET_PATH)
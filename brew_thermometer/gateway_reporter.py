@@ -0,0 +1,187 @@
+import json
+import socket
+import time
+from time import monotonic
+from brew_thermometer.gateway import get_gateway_address, MAX_DATAGRAM_BYTES
+from brew_thermometer.reporter import Reporter
+
+
+DEFAULT_GATEWAY_MAX_BATCH_SIZE = 50
+DEFAULT_GATEWAY_MAX_LINGER_SECONDS = 0
+DEFAULT_GATEWAY_ACK_TIMEOUT_SECONDS = 2
+DEFAULT_GATEWAY_RETRY_SECONDS = 60
+
+STATE_GATEWAY = 'gateway'
+STATE_FALLBACK = 'fallback'
+
+
+class GatewayReporter(Reporter):
+    """
+    Hands readings from the outbox to a GatewayServer in batches of up to max_batch_size, one datagram per batch,
+    removing them from the outbox once the gateway acknowledges them. A partial batch is held back until its oldest
+    reading has waited max_linger_seconds.
+
+    If the gateway cannot be reached or does not acknowledge a batch within ack_timeout_seconds, the reporter falls
+    back to publishing directly through the reporter built by create_fallback (an AwsIotReporter draining the same
+    outbox), and tries the gateway again every retry_seconds. Once the gateway acknowledges a batch again the fallback
+    reporter is stopped, closing its upstream connection.
+    """
+
+    def __init__(self, config_hash, logger, outbox, create_fallback):
+        self._logger = logger.getChild("GatewayReporter")
+        self._outbox = outbox
+        self._create_fallback = create_fallback
+        self._family, self._address = get_gateway_address(config_hash, self._logger)
+        self._max_batch_size = max(1, int(config_hash.get("max_batch_size", DEFAULT_GATEWAY_MAX_BATCH_SIZE)))
+        self._max_linger_seconds = float(config_hash.get("max_linger_seconds", DEFAULT_GATEWAY_MAX_LINGER_SECONDS))
+        self._ack_timeout_seconds = float(config_hash.get("ack_timeout_seconds", DEFAULT_GATEWAY_ACK_TIMEOUT_SECONDS))
+        self._retry_seconds = float(config_hash.get("retry_seconds", DEFAULT_GATEWAY_RETRY_SECONDS))
+        self._socket = None
+        self._batch_number = 0
+        self._fallback = None
+        self._next_gateway_attempt = 0
+        self._gateway_failures = 0
+        self._fallback_count = 0
+
+    def drain(self, force=False):
+        if not len(self._outbox):
+            return []
+        if self._fallback is not None and monotonic() < self._next_gateway_attempt:
+            return self._fallback.drain(force)
+
+        published = []
+        while len(self._outbox):
+            # while falling back the backlog is sent as soon as the gateway answers again
+            if not (force or self._fallback is not None or len(self._outbox) >= self._max_batch_size
+                    or self._linger_expired()):
+                break
+
+            rows = self._outbox.peek(self._max_batch_size)
+            sent_rows = self._send_batch(rows)
+            if not sent_rows:
+                self._fall_back()
+                return published + self._fallback.drain(force)
+
+            self._outbox.remove([reading_id for reading_id, _ in sent_rows])
+            published.extend(payload_hash for _, payload_hash in sent_rows)
+            if self._fallback is not None:
+                self._logger.info("Gateway at %s is reachable again; no longer publishing directly", self._address)
+                self._fallback.stop()
+                self._fallback = None
+
+        return published
+
+    def seconds_until_flush(self):
+        if not len(self._outbox):
+            return None
+        elif self._fallback is not None:
+            seconds_until_gateway_attempt = max(0.0, self._next_gateway_attempt - monotonic())
+            fallback_seconds = self._fallback.seconds_until_flush()
+            if fallback_seconds is None:
+                return seconds_until_gateway_attempt
+            return min(fallback_seconds, seconds_until_gateway_attempt)
+        elif len(self._outbox) >= self._max_batch_size:
+            return 0.0
+        else:
+            return max(0.0, self._outbox.oldest_created() + self._max_linger_seconds - time.time())
+
+    def get_connection_stats(self):
+        """
+        Returns a dict describing whether readings are going through the gateway or directly upstream, and the
+        fallback reporter's connection stats under 'upstream' while falling back.
+        """
+        if self._fallback is not None:
+            upstream = self._fallback.get_connection_stats()
+            return {
+                'state': STATE_FALLBACK,
+                'connected': upstream['connected'],
+                'gateway_failures': self._gateway_failures,
+                'gateway_fallbacks': self._fallback_count,
+                'upstream': upstream,
+            }
+
+        return {
+            'state': STATE_GATEWAY,
+            'connected': True,
+            'gateway_failures': self._gateway_failures,
+            'gateway_fallbacks': self._fallback_count,
+        }
+
+    def stop(self, timeout=None):
+        if self._fallback is not None:
+            self._fallback.stop(timeout)
+        self._close_socket()
+
+    def _linger_expired(self):
+        oldest_created = self._outbox.oldest_created()
+        return oldest_created is not None and oldest_created + self._max_linger_seconds <= time.time()
+
+    def _send_batch(self, rows):
+        """
+        Sends the outbox rows to the gateway as one datagram and waits for it to be acknowledged. Returns the rows the
+        gateway acknowledged, which are fewer than given if they would not fit in a datagram, or an empty list if the
+        gateway could not be reached or did not answer.
+        """
+        self._batch_number += 1
+        message = self._encode_batch(self._batch_number, rows)
+        while len(message) > MAX_DATAGRAM_BYTES and len(rows) > 1:
+            rows = rows[:len(rows) // 2]
+            message = self._encode_batch(self._batch_number, rows)
+
+        try:
+            gateway_socket = self._get_socket()
+            gateway_socket.send(message)
+            ack_deadline = monotonic() + self._ack_timeout_seconds
+            while True:
+                # checked once per wait, as a deadline passing between two clock reads would hand settimeout() a
+                # negative timeout
+                remaining_seconds = ack_deadline - monotonic()
+                if remaining_seconds <= 0:
+                    raise socket.timeout()
+                gateway_socket.settimeout(remaining_seconds)
+                ack = json.loads(gateway_socket.recv(MAX_DATAGRAM_BYTES))
+                # acknowledgements of earlier batches that timed out are stale
+                if isinstance(ack, dict) and ack.get("ack") == self._batch_number:
+                    return rows
+        except socket.timeout:
+            self._logger.warning("Gateway at %s did not acknowledge batch %d within %.1f seconds", self._address,
+                                 self._batch_number, self._ack_timeout_seconds)
+        except (OSError, ValueError) as e:
+            self._logger.warning("Could not send readings to the gateway at %s: %s", self._address, e)
+
+        self._close_socket()
+        return []
+
+    @staticmethod
+    def _encode_batch(batch_number, rows):
+        payloads = [payload_hash for _, payload_hash in rows]
+        return json.dumps({"batch": batch_number, "readings": payloads}).encode('utf-8')
+
+    def _fall_back(self):
+        self._gateway_failures += 1
+        self._next_gateway_attempt = monotonic() + self._retry_seconds
+        if self._fallback is None:
+            self._logger.warning("Publishing directly until the gateway at %s can be reached; retrying it in %.0f "
+                                 "seconds", self._address, self._retry_seconds)
+            self._fallback = self._create_fallback()
+            self._fallback_count += 1
+
+    def _get_socket(self):
+        if self._socket is None:
+            gateway_socket = socket.socket(self._family, socket.SOCK_DGRAM)
+            try:
+                if self._family == socket.AF_UNIX:
+                    # bind to an address the kernel picks, so the gateway can send acknowledgements back
+                    gateway_socket.bind('')
+                gateway_socket.connect(self._address)
+            except OSError:
+                gateway_socket.close()
+                raise
+            self._socket = gateway_socket
+
+        return self._socket
+
+    def _close_socket(self):
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
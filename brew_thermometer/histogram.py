@@ -0,0 +1,60 @@
+import bisect
+
+
+# upper bounds of the buckets latencies are counted into, from a fast local read up to a long outage
+LATENCY_BUCKETS_SECONDS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0, 3600.0)
+
+
+class Histogram:
+    """
+    Counts observations into fixed buckets, so the distribution of a latency can be kept in constant memory and
+    exported in the cumulative form Prometheus expects. Observations above the last bucket bound are only counted in the
+    total.
+    """
+
+    def __init__(self, bucket_bounds=LATENCY_BUCKETS_SECONDS):
+        self._bucket_bounds = tuple(bucket_bounds)
+        self._bucket_counts = [0] * len(self._bucket_bounds)
+        self._count = 0
+        self._sum = 0.0
+
+    def observe(self, value):
+        index = bisect.bisect_left(self._bucket_bounds, value)
+        if index < len(self._bucket_counts):
+            self._bucket_counts[index] += 1
+        self._count += 1
+        self._sum += value
+
+    def get_quantile_bound(self, quantile):
+        """
+        Returns the bound of the bucket the given quantile (0 - 1) of observations falls in, None if there are no
+        observations, or infinity if it is past the last bucket.
+        """
+        if not self._count:
+            return None
+
+        rank = quantile * self._count
+        cumulative_count = 0
+        for bound, count in zip(self._bucket_bounds, self._bucket_counts):
+            cumulative_count += count
+            if cumulative_count >= rank:
+                return bound
+
+        return float('inf')
+
+    def get_snapshot(self):
+        """
+        Returns a dict of the cumulative count of observations at or below each bucket bound (as a list of
+        (bound, count) tuples), the total count and the sum of the observations.
+        """
+        cumulative_counts = []
+        cumulative_count = 0
+        for bound, count in zip(self._bucket_bounds, list(self._bucket_counts)):
+            cumulative_count += count
+            cumulative_counts.append((bound, cumulative_count))
+
+        return {
+            'buckets': cumulative_counts,
+            'count': self._count,
+            'sum': self._sum,
+        }
@@ -0,0 +1,135 @@
+import threading
+from time import monotonic, perf_counter
+from brew_thermometer.histogram import Histogram
+
+
+STAGE_READ_DEVICE = 'read_device'
+STAGE_PARSE = 'parse'
+STAGE_PUBLISH = 'publish'
+STAGE_PUBACK = 'puback'
+STAGE_CYCLE = 'cycle'
+STAGES = (STAGE_READ_DEVICE, STAGE_PARSE, STAGE_PUBLISH, STAGE_PUBACK, STAGE_CYCLE)
+
+FAILURE_CRC = 'crc_failures'
+FAILURE_PARSE = 'parse_failures'
+FAILURE_IO = 'io_errors'
+FAILURE_PUBLISH = 'publish_errors'
+FAILURES = (FAILURE_CRC, FAILURE_PARSE, FAILURE_IO, FAILURE_PUBLISH)
+
+# stages range from microseconds (parsing) to seconds (a conversion at 12 bits, an acknowledgement over a slow link)
+STAGE_BUCKETS_SECONDS = (0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5,
+                         5.0, 10.0, 30.0)
+DEFAULT_SUMMARY_INTERVAL_SECONDS = 300
+
+
+class Instrumentation:
+    """
+    Times the stages of the read and publish path into fixed-bucket histograms and counts failures per thermometer,
+    logging a summary of both every summary_interval_seconds. A stage is timed by passing the value returned by
+    start_stage() to end_stage() once it is done.
+
+    Components hold NULL_INSTRUMENTATION unless instrumentation is enabled, so a disabled stage costs two empty method
+    calls.
+    """
+
+    enabled = True
+
+    def __init__(self, summary_interval_seconds, logger, clock=monotonic):
+        self._summary_interval_seconds = summary_interval_seconds
+        self._logger = logger.getChild("Instrumentation")
+        self._clock = clock
+        self._next_summary = clock() + summary_interval_seconds
+        self._lock = threading.Lock()
+        self._stage_histograms = {stage: Histogram(STAGE_BUCKETS_SECONDS) for stage in STAGES}
+        self._failure_counts = {}
+
+    @staticmethod
+    def start_stage():
+        return perf_counter()
+
+    def end_stage(self, stage, started):
+        elapsed_seconds = perf_counter() - started
+        with self._lock:
+            self._stage_histograms[stage].observe(elapsed_seconds)
+
+    def count_failure(self, thermometer_id, failure):
+        with self._lock:
+            counts = self._failure_counts.get(thermometer_id)
+            if counts is None:
+                counts = self._failure_counts[thermometer_id] = dict.fromkeys(FAILURES, 0)
+            counts[failure] += 1
+
+    def remove_thermometer(self, thermometer_id):
+        with self._lock:
+            self._failure_counts.pop(thermometer_id, None)
+
+    def get_stage_histograms(self):
+        """
+        Returns a dict of stage to a snapshot of its timing Histogram.
+        """
+        with self._lock:
+            return {stage: histogram.get_snapshot() for stage, histogram in iter(self._stage_histograms.items())}
+
+    def get_failure_counts(self):
+        """
+        Returns a dict of thermometer ID to a dict of its failure counts, for thermometers that have failed.
+        """
+        with self._lock:
+            return {thermometer_id: dict(counts) for thermometer_id, counts in iter(self._failure_counts.items())}
+
+    def log_summary_if_due(self):
+        now = self._clock()
+        if now < self._next_summary:
+            return
+
+        self._next_summary = now + self._summary_interval_seconds
+        stage_summaries = []
+        with self._lock:
+            for stage, histogram in iter(self._stage_histograms.items()):
+                snapshot = histogram.get_snapshot()
+                if snapshot['count']:
+                    stage_summaries.append("{} n={} mean={:.3f}ms p50<={:.3f}ms p99<={:.3f}ms".format(
+                        stage,
+                        snapshot['count'],
+                        snapshot['sum'] / snapshot['count'] * 1000,
+                        histogram.get_quantile_bound(0.5) * 1000,
+                        histogram.get_quantile_bound(0.99) * 1000
+                    ))
+            failure_counts = {thermometer_id: dict(counts) for thermometer_id, counts in
+                              iter(self._failure_counts.items())}
+
+        self._logger.info("Stage timings: %s; failures: %s", "; ".join(stage_summaries) or "none",
+                          failure_counts or "none")
+
+
+class NullInstrumentation:
+    """
+    Stands in for Instrumentation when it is disabled; every method does nothing.
+    """
+
+    enabled = False
+
+    @staticmethod
+    def start_stage():
+        return None
+
+    def end_stage(self, stage, started):
+        pass
+
+    def count_failure(self, thermometer_id, failure):
+        pass
+
+    def remove_thermometer(self, thermometer_id):
+        pass
+
+    def get_stage_histograms(self):
+        return {}
+
+    def get_failure_counts(self):
+        return {}
+
+    def log_summary_if_due(self):
+        pass
+
+
+NULL_INSTRUMENTATION = NullInstrumentation()
@@ -1,39 +1,68 @@
+import atexit
 import logging
-from logging.handlers import TimedRotatingFileHandler
+import queue
+import threading
+from logging.handlers import TimedRotatingFileHandler, QueueHandler, QueueListener
 from brew_thermometer.errors import ConfigurationError
 
 
 LOG_FORMATTER = logging.Formatter('%(asctime)s %(levelname)s: %(message)s')
 DEFAULT_LOG_LEVEL_STR = 'warning'
 PRODUCTION_LOG_FILE = '/var/log/brew_thermometer/brew_thermometer.log'
+# the queue handler is attached to the package's logger, so every logger in the package shares it
+PACKAGE_LOGGER_NAME = 'brew_thermometer'
+
+_setup_lock = threading.Lock()
+_queue_handler = None
+_queue_listener = None
 
 
 def get_logger(config_log_level, logger_name, developer_mode=False):
+    """
+    Returns the named logger set to the configured level. Records are handed to a queue and written out (to stderr in
+    developer mode, or to the production log file, rotated at midnight) by a single background listener thread, so
+    logging never blocks the caller on a slow SD card or a log rotation. The queue handler and listener are set up on
+    the first call and shared by every later one, so each record is written once however many times this is called.
+    """
     conf_error = None
+    try:
+        log_level = _get_log_level(config_log_level)
+    except ConfigurationError as ce:
+        conf_error = ce
+        log_level = _get_log_level(DEFAULT_LOG_LEVEL_STR)
 
+    _start_queue_listener(developer_mode)
     logger = logging.getLogger(logger_name)
-    if developer_mode:
-        from logging import StreamHandler
-        log_handler = StreamHandler()
-        log_handler.setLevel(logging.DEBUG)
-    else:
-        log_handler = TimedRotatingFileHandler(PRODUCTION_LOG_FILE, when='midnight', interval=1, backupCount=7)
-        try:
-            log_level = _get_log_level(config_log_level)
-        except ConfigurationError as ce:
-            conf_error = ce
-            log_level = _get_log_level(DEFAULT_LOG_LEVEL_STR)
-        log_handler.setLevel(log_level)
-
-    log_handler.setFormatter(LOG_FORMATTER)
-    logger.addHandler(log_handler)
+    logger.setLevel(log_level)
 
     if conf_error:
-        logger.warning("Error getting log level from configuration: {}".format(conf_error))
+        logger.warning("Error getting log level from configuration: %s", conf_error)
 
     return logger
 
 
+def _start_queue_listener(developer_mode):
+    global _queue_handler, _queue_listener
+
+    with _setup_lock:
+        if _queue_handler is not None:
+            return
+
+        if developer_mode:
+            log_handler = logging.StreamHandler()
+        else:
+            log_handler = TimedRotatingFileHandler(PRODUCTION_LOG_FILE, when='midnight', interval=1, backupCount=7)
+        log_handler.setFormatter(LOG_FORMATTER)
+
+        log_queue = queue.SimpleQueue()
+        _queue_handler = QueueHandler(log_queue)
+        _queue_listener = QueueListener(log_queue, log_handler)
+        _queue_listener.start()
+        logging.getLogger(PACKAGE_LOGGER_NAME).addHandler(_queue_handler)
+        # write out whatever is still queued when the daemon exits
+        atexit.register(_queue_listener.stop)
+
+
 def _get_log_level(config_log_level):
     if config_log_level.lower() == 'debug':
         return logging.DEBUG
@@ -0,0 +1,229 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+PROMETHEUS_PATH = '/metrics'
+JSON_PATH = '/metrics.json'
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+JSON_CONTENT_TYPE = 'application/json'
+METRIC_PREFIX = 'brew_thermometer_'
+
+# (name, type, help, key) of the metrics exported for each thermometer
+THERMOMETER_METRICS = (
+    ('temperature_degrees_celsius', 'gauge', "Latest temperature read from the thermometer.",
+     'temperature_degrees_celsius'),
+    ('last_read_timestamp_seconds', 'gauge', "Unix time of the latest reading.", 'last_read_timestamp'),
+    ('last_reported_timestamp_seconds', 'gauge', "Unix time the broker last acknowledged a reading of the thermometer.",
+     'last_reported_timestamp'),
+    ('read_duration_seconds', 'gauge', "How long the latest read of the thermometer took.", 'read_duration_seconds'),
+    ('read_interval_seconds', 'gauge', "Current interval between reads of the thermometer.", 'read_interval_seconds'),
+    ('read_interval_tightened_total', 'counter', "Times the adaptive read interval was shortened.",
+     'interval_tightened'),
+    ('read_interval_relaxed_total', 'counter', "Times the adaptive read interval was lengthened.", 'interval_relaxed'),
+    ('readings_published_total', 'counter', "Readings passed on for publishing.", 'published'),
+    ('readings_suppressed_total', 'counter', "Readings suppressed by the deadband filter.", 'suppressed'),
+    ('recent_min_degrees_celsius', 'gauge', "Minimum of the recent readings kept in memory.", 'min'),
+    ('recent_max_degrees_celsius', 'gauge', "Maximum of the recent readings kept in memory.", 'max'),
+    ('recent_mean_degrees_celsius', 'gauge', "Mean of the recent readings kept in memory.", 'mean'),
+    ('recent_ewma_degrees_celsius', 'gauge', "Exponentially weighted moving average of the readings.", 'ewma'),
+    ('recent_slope_degrees_celsius_per_hour', 'gauge', "Trend of the recent readings kept in memory.",
+     'slope_degrees_c_per_hour'),
+    ('crc_failures_total', 'counter', "Reads the device reported a failed CRC check for.", 'crc_failures'),
+    ('parse_failures_total', 'counter', "Reads that could not be parsed.", 'parse_failures'),
+    ('io_errors_total', 'counter', "Reads that failed with an IO error.", 'io_errors'),
+    ('read_timeouts_total', 'counter', "Reads abandoned because they took longer than the read timeout.", 'timeouts'),
+    ('quarantined', 'gauge', "Whether the thermometer is quarantined after its reads timed out.", 'quarantined'),
+    ('publish_errors_total', 'counter', "Readings in messages the broker did not acknowledge.", 'publish_errors'),
+)
+# (name, type, help, key) of the metrics exported for each 1-Wire bus master
+BUS_METRICS = (
+    ('bus_thermometers', 'gauge', "Thermometers attached to the bus.", 'thermometers'),
+    ('bus_reads_total', 'counter', "Reads made on the bus.", 'reads'),
+    ('bus_read_failures_total', 'counter', "Reads on the bus that did not return a temperature.", 'failures'),
+    ('bus_read_seconds_total', 'counter', "Time spent reading thermometers on the bus.", 'read_seconds'),
+)
+# (name, type, help, key) of the metrics exported for each sink readings are published to
+SINK_METRICS = (
+    ('sink_queue_depth', 'gauge', "Readings waiting to be handed to the sink's publisher.", 'queue_depth'),
+    ('sink_queue_dropped_total', 'counter', "Readings dropped from the sink's full queue.", 'dropped'),
+    ('sink_outbox_depth', 'gauge', "Readings stored in the sink's outbox awaiting delivery.", 'outbox_depth'),
+    ('sink_lag_seconds', 'gauge', "How long the oldest reading in the sink's outbox has waited.", 'outbox_lag_seconds'),
+    ('sink_readings_delivered_total', 'counter', "Readings delivered by the sink.", 'published'),
+    ('sink_connected', 'gauge', "Whether the sink can currently deliver readings.", 'connected'),
+)
+# (name, type, help, section, key) of the daemon-wide metrics
+DAEMON_METRICS = (
+    ('publish_queue_depth', 'gauge', "Readings waiting to be handed to the publisher.", 'publisher', 'queue_depth'),
+    ('publish_queue_max_depth', 'gauge', "Deepest the publish queue has been.", 'publisher', 'max_queue_depth'),
+    ('publish_queue_dropped_total', 'counter', "Readings dropped from a full publish queue.", 'publisher', 'dropped'),
+    ('publish_queue_coalesced_total', 'counter', "Queued readings replaced by a newer one.", 'publisher',
+     'coalesced'),
+    ('outbox_depth', 'gauge', "Readings stored in the outbox awaiting acknowledgement.", 'publisher', 'outbox_depth'),
+    ('outbox_lag_seconds', 'gauge', "How long the oldest reading in the outbox has waited.", 'publisher',
+     'outbox_lag_seconds'),
+    ('readings_acknowledged_total', 'counter', "Readings acknowledged by the broker.", 'publisher', 'published'),
+    ('broker_connected', 'gauge', "Whether the client is connected to the broker.", 'connection', 'connected'),
+    ('broker_connections_total', 'counter', "Connections made to the broker.", 'connection', 'connections'),
+    ('broker_disconnections_total', 'counter', "Connections to the broker lost.", 'connection', 'disconnections'),
+    ('gateway_fallbacks_total', 'counter', "Times the gateway could not be reached and readings were published "
+     "directly.", 'connection', 'gateway_fallbacks'),
+    ('gateway_clients', 'gauge', "Daemons that have recently sent readings to this gateway.", 'gateway', 'clients'),
+    ('gateway_batches_received_total', 'counter', "Batches of readings received from gateway clients.", 'gateway',
+     'batches_received'),
+    ('gateway_readings_received_total', 'counter', "Readings received from gateway clients.", 'gateway',
+     'readings_received'),
+    ('gateway_malformed_messages_total', 'counter', "Messages from gateway clients that could not be parsed.",
+     'gateway', 'malformed_messages'),
+    ('archive_records', 'gauge', "Readings held in the on-device archive.", 'archive', 'records'),
+    ('archive_segments', 'gauge', "Segment files of the on-device archive.", 'archive', 'segments'),
+    ('archive_bytes', 'gauge', "Bytes of readings held in the on-device archive.", 'archive', 'bytes'),
+    ('read_missed_deadlines_total', 'counter', "Scheduled reads skipped because reads overran.", 'scheduler',
+     'missed_deadlines'),
+    ('read_max_lateness_seconds', 'gauge', "Latest a read has started after its deadline.", 'scheduler',
+     'max_seconds'),
+)
+
+
+class MetricsServer:
+    """
+    Serves the daemon's metrics over HTTP, in the Prometheus text format at /metrics and as JSON at /metrics.json.
+    Requests are answered on the server's own threads from the latest snapshot handed to update(), so a scrape never
+    reads a thermometer or waits on the read loop. Each snapshot is rendered at most once per format however many
+    scrapers ask for it.
+
+    A snapshot is a dict of:
+      thermometers - a dict of thermometer ID to a dict of its description and the keys in THERMOMETER_METRICS
+      buses - a dict of bus master name to a dict of the keys in BUS_METRICS
+      sinks - a dict of sink name to a dict of the keys in SINK_METRICS
+      publisher, connection, scheduler, gateway, archive - dicts of the keys in DAEMON_METRICS
+      histograms - a dict of name to Histogram snapshot
+    """
+
+    def __init__(self, host, port, logger):
+        self._host = host
+        self._port = port
+        self._logger = logger.getChild("MetricsServer")
+        self._http_server = None
+        self._thread = None
+        # the snapshot and its renderings by path, swapped as a single reference so scrapes never see them mismatched
+        self._state = ({'thermometers': {}, 'histograms': {}}, {})
+
+    def start(self):
+        self._http_server = ThreadingHTTPServer((self._host, self._port), MetricsRequestHandler)
+        self._http_server.metrics_server = self
+        self._thread = threading.Thread(target=self._http_server.serve_forever, name="MetricsServer", daemon=True)
+        self._thread.start()
+        self._logger.info("Serving metrics on http://%s:%d%s", self._host, self.get_port(), PROMETHEUS_PATH)
+
+    def stop(self):
+        if self._http_server is not None:
+            self._http_server.shutdown()
+            self._http_server.server_close()
+
+    def get_port(self):
+        """
+        Returns the port the server is listening on, which is chosen by the OS if it was configured as 0.
+        """
+        return self._http_server.server_address[1] if self._http_server is not None else self._port
+
+    def update(self, snapshot):
+        self._state = (snapshot, {})
+
+    def render(self, path):
+        """
+        Returns the (content type, body) of the current snapshot for the given request path, or None for an unknown path.
+        """
+        snapshot, renderings = self._state
+        if path not in renderings:
+            if path == PROMETHEUS_PATH:
+                renderings[path] = (PROMETHEUS_CONTENT_TYPE, render_prometheus(snapshot).encode('utf-8'))
+            elif path == JSON_PATH:
+                renderings[path] = (JSON_CONTENT_TYPE, json.dumps(snapshot).encode('utf-8'))
+            else:
+                return None
+
+        return renderings[path]
+
+
+class MetricsRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        rendering = self.server.metrics_server.render(self.path.split('?', 1)[0])
+        if rendering is None:
+            self.send_error(404)
+            return
+
+        content_type, body = rendering
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        self.server.metrics_server._logger.debug("%s - %s", self.address_string(), format % args)
+
+
+def render_prometheus(snapshot):
+    """
+    Renders a metrics snapshot in the Prometheus text exposition format.
+    """
+    lines = []
+    thermometers = snapshot.get('thermometers', {})
+    for name, metric_type, help_text, key in THERMOMETER_METRICS:
+        samples = [
+            (_format_labels(thermometer=thermometer_id, description=info.get('description', '')), info.get(key))
+            for thermometer_id, info in sorted(thermometers.items())
+        ]
+        _render_metric(lines, name, metric_type, help_text, samples)
+
+    buses = snapshot.get('buses', {})
+    for name, metric_type, help_text, key in BUS_METRICS:
+        samples = [(_format_labels(bus=master_name), stats.get(key)) for master_name, stats in sorted(buses.items())]
+        _render_metric(lines, name, metric_type, help_text, samples)
+
+    sinks = snapshot.get('sinks', {})
+    for name, metric_type, help_text, key in SINK_METRICS:
+        samples = [(_format_labels(sink=sink_name), stats.get(key)) for sink_name, stats in sorted(sinks.items())]
+        _render_metric(lines, name, metric_type, help_text, samples)
+
+    for name, metric_type, help_text, section, key in DAEMON_METRICS:
+        _render_metric(lines, name, metric_type, help_text, [('', snapshot.get(section, {}).get(key))])
+
+    for name, histogram in sorted(snapshot.get('histograms', {}).items()):
+        _render_histogram(lines, name, histogram)
+
+    return '\n'.join(lines) + '\n'
+
+
+def _render_metric(lines, name, metric_type, help_text, samples):
+    samples = [(labels, value) for labels, value in samples if value is not None]
+    if not samples:
+        return
+
+    lines.append('# HELP {}{} {}'.format(METRIC_PREFIX, name, help_text))
+    lines.append('# TYPE {}{} {}'.format(METRIC_PREFIX, name, metric_type))
+    for labels, value in samples:
+        lines.append('{}{}{} {}'.format(METRIC_PREFIX, name, labels, _format_value(value)))
+
+
+def _render_histogram(lines, name, histogram):
+    lines.append('# TYPE {}{} histogram'.format(METRIC_PREFIX, name))
+    for bound, count in histogram['buckets']:
+        lines.append('{}{}_bucket{} {}'.format(METRIC_PREFIX, name, _format_labels(le=_format_value(bound)), count))
+    lines.append('{}{}_bucket{} {}'.format(METRIC_PREFIX, name, _format_labels(le='+Inf'), histogram['count']))
+    lines.append('{}{}_sum {}'.format(METRIC_PREFIX, name, _format_value(histogram['sum'])))
+    lines.append('{}{}_count {}'.format(METRIC_PREFIX, name, histogram['count']))
+
+
+def _format_labels(**labels):
+    return '{' + ','.join(
+        '{}="{}"'.format(key, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for key, value in labels.items()
+    ) + '}'
+
+
+def _format_value(value):
+    if isinstance(value, bool):
+        return '1' if value else '0'
+    return repr(value) if isinstance(value, float) else str(value)
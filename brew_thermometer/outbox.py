@@ -0,0 +1,129 @@
+import json
+import sqlite3
+import threading
+import time
+
+
+IN_MEMORY_PATH = ':memory:'
+
+
+class Outbox:
+    """
+    A durable, append-only store of readings waiting to be published. Every reading is appended here before it is
+    published and only removed once the broker has acknowledged it, so readings taken while the broker is unreachable
+    survive the outage (and restarts) and are replayed once it comes back.
+
+    Readings are kept in SQLite in WAL mode, which turns each append into a single sequential write to the log rather
+    than rewriting pages in place -- easier on the SD card. The outbox is bounded: readings older than max_age_seconds
+    and, past max_readings, the oldest readings are evicted first.
+    """
+
+    def __init__(self, db_path, max_readings, max_age_seconds, logger):
+        self._logger = logger.getChild("Outbox")
+        self._max_readings = max_readings
+        self._max_age_seconds = max_age_seconds
+        self._lock = threading.Lock()
+
+        self._db = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        if db_path != IN_MEMORY_PATH:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            # in WAL mode NORMAL only risks losing the last transactions on power loss, never corrupting the database
+            self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS readings ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+            "created REAL NOT NULL, "
+            "payload TEXT NOT NULL)"
+        )
+        self._count = self._db.execute("SELECT COUNT(*) FROM readings").fetchone()[0]
+        if self._count:
+            self._logger.info("Outbox holds %d unpublished readings from a previous run", self._count)
+
+    def append(self, payload_hashes):
+        """
+        Appends the given payloads in a single transaction, then evicts readings past the outbox's bounds.
+        """
+        if not payload_hashes:
+            return
+
+        now = time.time()
+        rows = [(now, json.dumps(payload_hash)) for payload_hash in payload_hashes]
+        with self._lock:
+            self._db.execute("BEGIN")
+            self._db.executemany("INSERT INTO readings (created, payload) VALUES (?, ?)", rows)
+            self._count += len(rows)
+            evicted = self._evict(now)
+            self._db.execute("COMMIT")
+
+        if evicted:
+            self._logger.warning("Outbox is full; evicted the %d oldest unpublished readings", evicted)
+
+    def peek(self, limit):
+        """
+        Returns up to limit of the oldest readings as a list of (reading ID, payload hash) tuples, without removing them.
+        """
+        with self._lock:
+            rows = self._db.execute("SELECT id, payload FROM readings ORDER BY id LIMIT ?", (limit,)).fetchall()
+
+        return [(reading_id, json.loads(payload)) for reading_id, payload in rows]
+
+    def remove(self, reading_ids):
+        """
+        Removes the readings with the given IDs, once they have been published.
+        """
+        if not reading_ids:
+            return
+
+        with self._lock:
+            self._db.execute("BEGIN")
+            cursor = self._db.executemany("DELETE FROM readings WHERE id = ?", [(i,) for i in reading_ids])
+            self._count -= cursor.rowcount
+            self._db.execute("COMMIT")
+
+    def oldest_created(self):
+        """
+        Returns the unix time the oldest reading was appended at, or None if the outbox is empty.
+        """
+        with self._lock:
+            row = self._db.execute("SELECT created FROM readings ORDER BY id LIMIT 1").fetchone()
+
+        return row[0] if row else None
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def __len__(self):
+        return self._count
+
+    def _evict(self, now):
+        evicted = 0
+        if self._max_age_seconds:
+            evicted += self._evict_expired(now - self._max_age_seconds)
+            self._count -= evicted
+
+        if self._count > self._max_readings:
+            overflow = self._db.execute(
+                "DELETE FROM readings WHERE id IN (SELECT id FROM readings ORDER BY id LIMIT ?)",
+                (self._count - self._max_readings,)
+            ).rowcount
+            self._count -= overflow
+            evicted += overflow
+
+        return evicted
+
+    def _evict_expired(self, cutoff):
+        """
+        Deletes the readings created before cutoff. Readings are appended in time order, so only the oldest reading is
+        checked on each append, and an expired run is found by walking the rowid order from the head rather than by
+        scanning the (unindexed) created column of the whole table.
+        """
+        oldest = self._db.execute("SELECT created FROM readings ORDER BY id LIMIT 1").fetchone()
+        if oldest is None or oldest[0] >= cutoff:
+            return 0
+
+        first_fresh = self._db.execute("SELECT id FROM readings WHERE created >= ? ORDER BY id LIMIT 1",
+                                       (cutoff,)).fetchone()
+        if first_fresh is None:
+            return self._db.execute("DELETE FROM readings").rowcount
+        return self._db.execute("DELETE FROM readings WHERE id < ?", first_fresh).rowcount
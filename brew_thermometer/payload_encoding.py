@@ -0,0 +1,251 @@
+import json
+import struct
+import zlib
+
+
+PAYLOAD_ENCODING_JSON = 'json'
+PAYLOAD_ENCODING_COMPACT = 'compact'
+PAYLOAD_ENCODINGS = (PAYLOAD_ENCODING_JSON, PAYLOAD_ENCODING_COMPACT)
+
+COMPACT_FORMAT_VERSION = 1
+COMPACT_FLAG_DELTA = 0x01
+# format version, flags, schema version, reading count, base unix timestamp
+COMPACT_HEADER = struct.Struct('!BBHHI')
+# the window summary field whose presence marks a payload as carrying a window summary
+WINDOW_SUMMARY_COUNT_FIELD = 'sample_count'
+
+
+class JsonPayloadEncoder:
+    """
+    Encodes batches of reading payloads as JSON, as published before encoders were pluggable. With a max batch size of
+    1 a lone payload is published bare; otherwise batches are wrapped as {"readings": [...]}.
+    """
+
+    def __init__(self, max_batch_size):
+        self._max_batch_size = max_batch_size
+
+    def encode(self, payloads):
+        if len(payloads) == 1 and self._max_batch_size == 1:
+            return json.dumps(payloads[0])
+        else:
+            return json.dumps({"readings": payloads})
+
+    def register_sensors(self, payloads):
+        """
+        Adds the sensors of the given payloads to the schema, so that payloads encoded afterwards share its version.
+        """
+        pass
+
+    def get_schema_message(self):
+        """
+        Returns the message describing the sensors that encoded payloads refer to, or None if payloads are self
+        describing.
+        """
+        return None
+
+    def get_schema_version(self):
+        return None
+
+
+class CompactPayloadEncoder:
+    """
+    Encodes batches of reading payloads in a compact binary form. Sensors are referred to by a small index rather than
+    by ID and description; the mapping is published separately as a JSON schema message (see get_schema_message),
+    which is identified by a 16 bit schema version carried in every batch's header. A batch's header carries the
+    version current when it was encoded, so callers encoding several batches register all of their sensors (see
+    register_sensors) before encoding any of them.
+
+    A batch is a header (format version, flags, schema version, reading count, and the unix timestamp of its first
+    reading) followed by one record per reading, each made of three varints:
+      sensor index
+      timestamp: seconds since the batch's base timestamp (zigzag encoded)
+      temperature: fixed-point centi-degrees Celsius (zigzag encoded)
+    With delta encoding, timestamps are instead relative to the previous reading in the batch, and temperatures relative
+    to the previous reading of the same sensor in the batch, which keeps most records to three bytes.
+
+    Sensors whose payloads carry window summaries (see ReadingAggregator) are flagged with window_summary in the schema,
+    and their records continue with the summary's sample count; unless it is 0 (a reading without a summary), five more
+    varints follow: min and max (centi-degrees relative to the record's temperature, zigzag encoded), standard deviation
+    (centi-degrees), window start (seconds before the record's timestamp, zigzag encoded) and window length in seconds.
+    """
+
+    def __init__(self, delta_encoding):
+        self._delta_encoding = delta_encoding
+        self._sensor_indexes = {}
+        self._sensors = []
+        self._schema_version = None
+
+    def encode(self, payloads):
+        indexes = [self._get_sensor_index(payload) for payload in payloads]
+        base_timestamp = int(payloads[0]["timestamp"])
+        flags = COMPACT_FLAG_DELTA if self._delta_encoding else 0
+
+        encoded = bytearray(COMPACT_HEADER.pack(COMPACT_FORMAT_VERSION, flags, self.get_schema_version(),
+                                                len(payloads), base_timestamp))
+        previous_timestamp = base_timestamp
+        previous_centi_c = {}
+        for index, payload in zip(indexes, payloads):
+            timestamp = int(payload["timestamp"])
+            centi_c = _to_centi_c(payload["temperature_degrees_celsius"])
+            _write_varint(encoded, index)
+            if self._delta_encoding:
+                _write_varint(encoded, _zigzag(timestamp - previous_timestamp))
+                _write_varint(encoded, _zigzag(centi_c - previous_centi_c.get(index, 0)))
+                previous_timestamp = timestamp
+                previous_centi_c[index] = centi_c
+            else:
+                _write_varint(encoded, _zigzag(timestamp - base_timestamp))
+                _write_varint(encoded, _zigzag(centi_c))
+            if self._sensors[index].get("window_summary"):
+                _write_window_summary(encoded, payload, timestamp, centi_c)
+
+        return bytes(encoded)
+
+    def register_sensors(self, payloads):
+        for payload in payloads:
+            self._get_sensor_index(payload)
+
+    def get_schema_message(self):
+        return json.dumps({
+            "schema_version": self.get_schema_version(),
+            "sensors": self._sensors,
+        })
+
+    def get_schema_version(self):
+        if self._schema_version is None:
+            self._schema_version = zlib.crc32(json.dumps(self._sensors).encode('utf-8')) & 0xffff
+        return self._schema_version
+
+    def _get_sensor_index(self, payload):
+        thermometer_id = payload["thermometer_id"]
+        index = self._sensor_indexes.get(thermometer_id)
+        if index is None:
+            index = len(self._sensors)
+            self._sensor_indexes[thermometer_id] = index
+            self._sensors.append({
+                "index": index,
+                "thermometer_id": thermometer_id,
+                "description": payload.get("description", ""),
+            })
+            self._schema_version = None
+        if WINDOW_SUMMARY_COUNT_FIELD in payload and not self._sensors[index].get("window_summary"):
+            self._sensors[index]["window_summary"] = True
+            self._schema_version = None
+
+        return index
+
+
+def decode_compact_payload(data, schema):
+    """
+    Decodes a batch encoded by CompactPayloadEncoder back into reading payloads, given the schema message (as a dict)
+    the batch refers to.
+    """
+    version, flags, schema_version, count, base_timestamp = COMPACT_HEADER.unpack_from(data)
+    if version != COMPACT_FORMAT_VERSION:
+        raise ValueError("Unsupported compact payload version {}".format(version))
+    if schema_version != schema["schema_version"]:
+        raise ValueError("Payload refers to schema version {}, not {}".format(schema_version, schema["schema_version"]))
+
+    sensors = {sensor["index"]: sensor for sensor in schema["sensors"]}
+    delta_encoding = flags & COMPACT_FLAG_DELTA
+    position = COMPACT_HEADER.size
+    previous_timestamp = base_timestamp
+    previous_centi_c = {}
+    payloads = []
+    for _ in range(count):
+        index, position = _read_varint(data, position)
+        timestamp, position = _read_varint(data, position)
+        centi_c, position = _read_varint(data, position)
+        if delta_encoding:
+            timestamp = previous_timestamp + _unzigzag(timestamp)
+            centi_c = previous_centi_c.get(index, 0) + _unzigzag(centi_c)
+            previous_timestamp = timestamp
+            previous_centi_c[index] = centi_c
+        else:
+            timestamp = base_timestamp + _unzigzag(timestamp)
+            centi_c = _unzigzag(centi_c)
+
+        payload = {
+            "thermometer_id": sensors[index]["thermometer_id"],
+            "description": sensors[index]["description"],
+            "temperature_degrees_celsius": centi_c / 100.0,
+            "timestamp": timestamp,
+        }
+        if sensors[index].get("window_summary"):
+            position = _read_window_summary(data, position, payload, timestamp, centi_c)
+        payloads.append(payload)
+
+    return payloads
+
+
+def create_payload_encoder(payload_encoding, max_batch_size, delta_encoding):
+    if payload_encoding == PAYLOAD_ENCODING_COMPACT:
+        return CompactPayloadEncoder(delta_encoding)
+    else:
+        return JsonPayloadEncoder(max_batch_size)
+
+
+def _write_window_summary(buffer, payload, timestamp, centi_c):
+    sample_count = payload.get(WINDOW_SUMMARY_COUNT_FIELD, 0)
+    _write_varint(buffer, sample_count)
+    if sample_count:
+        _write_varint(buffer, _zigzag(_to_centi_c(payload["min_degrees_celsius"]) - centi_c))
+        _write_varint(buffer, _zigzag(_to_centi_c(payload["max_degrees_celsius"]) - centi_c))
+        _write_varint(buffer, _to_centi_c(payload["stddev_degrees_celsius"]))
+        _write_varint(buffer, _zigzag(timestamp - int(payload["window_start"])))
+        _write_varint(buffer, int(payload["window_seconds"]))
+
+
+def _read_window_summary(data, position, payload, timestamp, centi_c):
+    """
+    Adds the window summary of a record at position to its payload, returning the position after it.
+    """
+    sample_count, position = _read_varint(data, position)
+    if not sample_count:
+        return position
+
+    min_centi_c, position = _read_varint(data, position)
+    max_centi_c, position = _read_varint(data, position)
+    stddev_centi_c, position = _read_varint(data, position)
+    window_start, position = _read_varint(data, position)
+    window_seconds, position = _read_varint(data, position)
+    payload.update({
+        "min_degrees_celsius": (centi_c + _unzigzag(min_centi_c)) / 100.0,
+        "max_degrees_celsius": (centi_c + _unzigzag(max_centi_c)) / 100.0,
+        "stddev_degrees_celsius": stddev_centi_c / 100.0,
+        WINDOW_SUMMARY_COUNT_FIELD: sample_count,
+        "window_start": timestamp - _unzigzag(window_start),
+        "window_seconds": window_seconds,
+    })
+    return position
+
+
+def _to_centi_c(degrees_c):
+    return int(round(degrees_c * 100))
+
+
+def _zigzag(value):
+    return (value << 1) ^ (value >> 63)
+
+
+def _unzigzag(value):
+    return (value >> 1) ^ -(value & 1)
+
+
+def _write_varint(buffer, value):
+    while value > 0x7f:
+        buffer.append((value & 0x7f) | 0x80)
+        value >>= 7
+    buffer.append(value)
+
+
+def _read_varint(data, position):
+    value = 0
+    shift = 0
+    while True:
+        byte = data[position]
+        position += 1
+        value |= (byte & 0x7f) << shift
+        if not byte & 0x80:
+            return value, position
+        shift += 7
@@ -0,0 +1,191 @@
+import threading
+import time
+import traceback
+from collections import deque
+from brew_thermometer.histogram import Histogram
+
+
+QUEUE_POLICY_DROP_OLDEST = 'drop_oldest'
+QUEUE_POLICY_COALESCE = 'coalesce'
+QUEUE_POLICY_BLOCK = 'block'
+QUEUE_POLICIES = (QUEUE_POLICY_DROP_OLDEST, QUEUE_POLICY_COALESCE, QUEUE_POLICY_BLOCK)
+# upper bound on how long the publisher waits for readings, so it still notices flush deadlines and being stopped
+MAX_PUBLISHER_WAIT_SECONDS = 1.0
+
+
+class ReadingQueue:
+    """
+    A bounded, thread-safe queue of reading payloads handed from the read loop to the publisher. When the queue is full
+    its policy decides what happens to a new reading:
+      drop_oldest - the oldest queued reading is dropped to make room
+      coalesce - the latest queued reading from the same thermometer is replaced by the new one; if there is none,
+                 the oldest queued reading is dropped
+      block - put waits until the publisher makes room
+    """
+
+    def __init__(self, max_size, policy):
+        self._max_size = max_size
+        self._policy = policy
+        self._payloads = deque()
+        self._queued_by_thermometer = {}
+        self._condition = threading.Condition()
+
+        self.dropped = 0
+        self.coalesced = 0
+        self.max_depth = 0
+
+    def put(self, payload_hash):
+        """
+        Queues a payload, returning False if a queued reading had to be dropped to make room for it.
+        """
+        with self._condition:
+            thermometer_id = payload_hash["thermometer_id"]
+            if self._policy == QUEUE_POLICY_COALESCE and len(self._payloads) >= self._max_size and \
+                    thermometer_id in self._queued_by_thermometer:
+                self._queued_by_thermometer[thermometer_id].clear()
+                self._queued_by_thermometer[thermometer_id].update(payload_hash)
+                self.coalesced += 1
+                return True
+
+            dropped = False
+            if self._policy == QUEUE_POLICY_BLOCK:
+                while len(self._payloads) >= self._max_size:
+                    self._condition.wait()
+            elif len(self._payloads) >= self._max_size:
+                self._forget(self._payloads.popleft())
+                self.dropped += 1
+                dropped = True
+
+            # queue a copy, so coalescing can update it in place without touching the caller's payload
+            queued = dict(payload_hash)
+            self._payloads.append(queued)
+            if self._policy == QUEUE_POLICY_COALESCE:
+                self._queued_by_thermometer[thermometer_id] = queued
+            self.max_depth = max(self.max_depth, len(self._payloads))
+            self._condition.notify_all()
+            return not dropped
+
+    def get_all(self, timeout):
+        """
+        Waits up to timeout seconds for at least one reading, then removes and returns every queued reading.
+        """
+        with self._condition:
+            if not self._payloads:
+                self._condition.wait(timeout)
+
+            payloads = list(self._payloads)
+            self._payloads.clear()
+            self._queued_by_thermometer.clear()
+            self._condition.notify_all()
+            return payloads
+
+    def wake(self):
+        with self._condition:
+            self._condition.notify_all()
+
+    def __len__(self):
+        return len(self._payloads)
+
+    def _forget(self, payload_hash):
+        if self._queued_by_thermometer.get(payload_hash["thermometer_id"]) is payload_hash:
+            del self._queued_by_thermometer[payload_hash["thermometer_id"]]
+
+
+class Publisher:
+    """
+    Publishes readings on a dedicated thread, so a slow TLS handshake or a stalled network never delays the read loop.
+    The read loop hands readings over through a ReadingQueue; the publisher moves them into the outbox, drains the
+    outbox through the reporter and passes the IDs of the thermometers whose readings were acknowledged to
+    on_reported, if one is given.
+    """
+
+    def __init__(self, reading_queue, outbox, reporter, on_reported, logger, name="Publisher"):
+        self._name = name
+        self._reading_queue = reading_queue
+        self._outbox = outbox
+        self._reporter = reporter
+        self._on_reported = on_reported
+        self._logger = logger.getChild("Publisher")
+        self._stopped = threading.Event()
+        self._thread = None
+
+        self._latency_count = 0
+        self._latency_total_seconds = 0.0
+        self._last_latency_seconds = None
+        self._max_latency_seconds = None
+        self._latency_histogram = Histogram()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name=self._name, daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        self._stopped.set()
+        self._reading_queue.wake()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def get_stats(self):
+        """
+        Returns a dict of statistics about the reading queue and the time from reading to broker acknowledgement.
+        outbox_lag_seconds is how long the oldest reading in the outbox has been waiting to be published.
+        """
+        oldest_created = self._outbox.oldest_created()
+        return {
+            'queue_depth': len(self._reading_queue),
+            'max_queue_depth': self._reading_queue.max_depth,
+            'dropped': self._reading_queue.dropped,
+            'coalesced': self._reading_queue.coalesced,
+            'outbox_depth': len(self._outbox),
+            'outbox_lag_seconds': time.time() - oldest_created if oldest_created is not None else None,
+            'published': self._latency_count,
+            'last_read_to_ack_seconds': self._last_latency_seconds,
+            'max_read_to_ack_seconds': self._max_latency_seconds,
+            'mean_read_to_ack_seconds':
+                self._latency_total_seconds / self._latency_count if self._latency_count else None,
+        }
+
+    def get_connection_stats(self):
+        return self._reporter.get_connection_stats()
+
+    def get_latency_histogram(self):
+        """
+        Returns a snapshot of the Histogram of times from reading to broker acknowledgement.
+        """
+        return self._latency_histogram.get_snapshot()
+
+    def publish_once(self, timeout):
+        """
+        Waits up to timeout seconds for readings, then stores and publishes whatever is due.
+        """
+        self._outbox.append(self._reading_queue.get_all(timeout))
+        published = self._reporter.drain()
+        if published:
+            self._record_latencies(published)
+            self._logger.debug("Published payloads: %s", published)
+            if self._on_reported is not None:
+                self._on_reported([payload["thermometer_id"] for payload in published])
+
+    def _run(self):
+        while not self._stopped.is_set():
+            timeout = self._reporter.seconds_until_flush()
+            if timeout is None or timeout > MAX_PUBLISHER_WAIT_SECONDS:
+                timeout = MAX_PUBLISHER_WAIT_SECONDS
+
+            try:
+                self.publish_once(timeout)
+            except Exception as e:
+                self._logger.error("Error while publishing readings: %s", e)
+                self._logger.error(traceback.format_exc())
+                self._stopped.wait(MAX_PUBLISHER_WAIT_SECONDS)
+
+    def _record_latencies(self, published):
+        now = time.time()
+        for payload in published:
+            latency_seconds = now - payload["timestamp"]
+            self._latency_count += 1
+            self._latency_total_seconds += latency_seconds
+            self._last_latency_seconds = latency_seconds
+            self._latency_histogram.observe(latency_seconds)
+            if self._max_latency_seconds is None or latency_seconds > self._max_latency_seconds:
+                self._max_latency_seconds = latency_seconds
@@ -0,0 +1,144 @@
+import heapq
+import math
+from time import monotonic
+
+
+class ReadScheduler:
+    """
+    Schedules thermometer reads against deadlines on the monotonic clock, so the read loop can sleep exactly until the
+    next thermometer is due rather than polling. Each thermometer has its own read interval and its reads are kept on a
+    fixed grid (first due time + n * interval), so the time spent reading and reporting does not accumulate as drift.
+    How late each read was relative to its deadline is recorded, so overruns are visible.
+    """
+
+    def __init__(self, clock=monotonic):
+        self._clock = clock
+        self._heap = []
+        self._schedules = {}
+        self._sequence = 0
+
+        self._lateness_count = 0
+        self._lateness_total_seconds = 0.0
+        self._last_lateness_seconds = None
+        self._max_lateness_seconds = None
+        self._missed_deadlines = 0
+
+    def add(self, thermometer_id, interval_seconds):
+        """
+        Adds a thermometer to the schedule, due immediately.
+        """
+        now = self._clock()
+        self._schedules[thermometer_id] = {
+            'interval_seconds': interval_seconds,
+            'grid_deadline': now,
+            'due': None,
+        }
+        self._push(thermometer_id, now)
+
+    def remove(self, thermometer_id):
+        self._schedules.pop(thermometer_id, None)
+
+    def set_interval(self, thermometer_id, interval_seconds):
+        """
+        Changes a thermometer's read interval. A pending deadline is pulled in if the interval got shorter; otherwise
+        the new interval takes effect from the next deadline.
+        """
+        schedule = self._schedules[thermometer_id]
+        previous_interval_seconds = schedule['interval_seconds']
+        schedule['interval_seconds'] = interval_seconds
+        if interval_seconds < previous_interval_seconds and schedule['due'] == schedule['grid_deadline']:
+            next_due = schedule['grid_deadline'] - previous_interval_seconds + interval_seconds
+            schedule['grid_deadline'] = next_due
+            self._push(thermometer_id, next_due)
+
+    def get_interval(self, thermometer_id):
+        return self._schedules[thermometer_id]['interval_seconds']
+
+    def pop_due(self):
+        """
+        Returns the IDs of all thermometers whose deadline has passed, recording how late each one is. Popped
+        thermometers are not scheduled again until they are passed to reschedule or retry.
+        """
+        now = self._clock()
+        due_ids = []
+        while self._heap and self._heap[0][0] <= now:
+            due, _, thermometer_id = heapq.heappop(self._heap)
+            schedule = self._schedules.get(thermometer_id)
+            if schedule is None or schedule['due'] != due:
+                continue  # removed, or superseded by a later push
+
+            schedule['due'] = None
+            self._record_lateness(now - due)
+            due_ids.append(thermometer_id)
+
+        return due_ids
+
+    def reschedule(self, thermometer_id):
+        """
+        Schedules a thermometer's next read on its grid, skipping any grid slots that have already passed. Returns the
+        number of slots skipped.
+        """
+        schedule = self._schedules.get(thermometer_id)
+        if schedule is None:
+            return 0
+
+        now = self._clock()
+        interval_seconds = schedule['interval_seconds']
+        next_due = schedule['grid_deadline'] + interval_seconds
+        missed = 0
+        if next_due <= now:
+            missed = math.floor((now - next_due) / interval_seconds) + 1
+            self._missed_deadlines += missed
+            next_due += missed * interval_seconds
+
+        schedule['grid_deadline'] = next_due
+        self._push(thermometer_id, next_due)
+        return missed
+
+    def retry(self, thermometer_id, delay_seconds):
+        """
+        Schedules another attempt at a thermometer's read after delay_seconds, without moving its grid; the read after a
+        successful retry is still due on the grid.
+        """
+        if thermometer_id in self._schedules:
+            self._push(thermometer_id, self._clock() + delay_seconds)
+
+    def seconds_until_next_due(self):
+        """
+        Returns the number of seconds until the next thermometer is due (0 if one is already due), or None if nothing
+        is scheduled.
+        """
+        while self._heap:
+            due, _, thermometer_id = self._heap[0]
+            schedule = self._schedules.get(thermometer_id)
+            if schedule is None or schedule['due'] != due:
+                heapq.heappop(self._heap)
+                continue
+
+            return max(0.0, due - self._clock())
+
+        return None
+
+    def get_lateness_stats(self):
+        """
+        Returns a dict of statistics about how late reads were relative to their deadlines.
+        """
+        return {
+            'count': self._lateness_count,
+            'last_seconds': self._last_lateness_seconds,
+            'max_seconds': self._max_lateness_seconds,
+            'mean_seconds': self._lateness_total_seconds / self._lateness_count if self._lateness_count else None,
+            'missed_deadlines': self._missed_deadlines,
+        }
+
+    def _push(self, thermometer_id, due):
+        self._schedules[thermometer_id]['due'] = due
+        self._sequence += 1
+        heapq.heappush(self._heap, (due, self._sequence, thermometer_id))
+
+    def _record_lateness(self, lateness_seconds):
+        self._lateness_count += 1
+        self._lateness_total_seconds += lateness_seconds
+        self._last_lateness_seconds = lateness_seconds
+        if self._max_lateness_seconds is None or lateness_seconds > self._max_lateness_seconds:
+            self._max_lateness_seconds = lateness_seconds
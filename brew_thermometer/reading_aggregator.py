@@ -0,0 +1,74 @@
+import math
+import time
+from array import array
+
+
+class ReadingAggregator:
+    """
+    Summarizes readings of thermometers sampled faster than they should be published. Each aggregated thermometer's
+    samples are collected into tumbling windows of its aggregation window length, aligned to multiples of that length in
+    unix time so the windows of thermometers sharing a length line up. Once a window has ended it is summarized as one
+    record (mean, min, max, population standard deviation and sample count) and the window's samples are discarded.
+    Readings of thermometers without an aggregation window pass straight through.
+    """
+
+    def __init__(self, clock=time.time):
+        self._clock = clock
+        self._windows = {}
+
+    def configure(self, thermometer_id, window_seconds):
+        """
+        Sets the length of a thermometer's aggregation windows, or None to publish each of its readings as it is.
+        """
+        if window_seconds:
+            self._windows[thermometer_id] = {'window_seconds': window_seconds, 'start': None, 'samples': array('d')}
+        else:
+            self._windows.pop(thermometer_id, None)
+
+    def remove(self, thermometer_id):
+        """
+        Stops aggregating a thermometer, discarding the samples of its current window.
+        """
+        self._windows.pop(thermometer_id, None)
+
+    def add(self, read_temps):
+        """
+        Adds read_temps (a dict of thermometer ID to degrees Celsius) to the current windows. Returns a tuple of the
+        readings that are not aggregated and a dict of thermometer ID to the summary of each window that has ended;
+        call it every loop, with no readings if need be, so windows are closed on time.
+        """
+        now = self._clock()
+        summaries = {}
+        for thermometer_id, window in iter(self._windows.items()):
+            if window['start'] is not None and now >= window['start'] + window['window_seconds']:
+                summaries[thermometer_id] = self._summarize(window)
+                window['start'] = None
+                del window['samples'][:]
+
+        passthrough_temps = {}
+        for thermometer_id, temp_degrees_c in iter(read_temps.items()):
+            window = self._windows.get(thermometer_id)
+            if window is None:
+                passthrough_temps[thermometer_id] = temp_degrees_c
+                continue
+
+            if window['start'] is None:
+                window['start'] = now - now % window['window_seconds']
+            window['samples'].append(temp_degrees_c)
+
+        return passthrough_temps, summaries
+
+    @staticmethod
+    def _summarize(window):
+        samples = window['samples']
+        count = len(samples)
+        mean = math.fsum(samples) / count
+        return {
+            'temperature_degrees_celsius': mean,
+            'min_degrees_celsius': min(samples),
+            'max_degrees_celsius': max(samples),
+            'stddev_degrees_celsius': math.sqrt(math.fsum((sample - mean) ** 2 for sample in samples) / count),
+            'sample_count': count,
+            'window_start': window['start'],
+            'window_seconds': window['window_seconds'],
+        }
@@ -0,0 +1,466 @@
+import json
+import math
+import mmap
+import os
+import re
+import struct
+import threading
+from time import monotonic
+
+
+DEFAULT_SEGMENT_SECONDS = 24 * 60 * 60
+# offsets into a segment are kept in 32-bit milliseconds, which caps a segment's span at about 49 days
+MAX_SEGMENT_SECONDS = (2 ** 32 - 1) // 1000
+DEFAULT_SEGMENT_MAX_RECORDS = 2 ** 21
+DEFAULT_RETENTION_SECONDS = 180 * 24 * 60 * 60
+DEFAULT_FLUSH_INTERVAL_SECONDS = 60
+# buffered readings that do not fill a page are written anyway once the oldest has waited this many flush intervals
+MAX_PENDING_FLUSH_INTERVALS = 5
+DEFAULT_INDEX_BUCKET_SECONDS = 300
+# (milliseconds since the segment's start, sensor number, centi-degrees Celsius); sensor 0 marks an unused slot
+RECORD = struct.Struct('<IHh')
+# (bucket number since the epoch, sensor number, reading count, min, max, sum of centi-degrees Celsius)
+INDEX_ENTRY = struct.Struct('<IHIhhq')
+INDEX_HEADER = struct.Struct('<4sI')
+INDEX_MAGIC = b'BTA1'
+SENSORS_FILE = 'sensors.json'
+SEGMENT_FILE_PATTERN = re.compile(r'^segment-(\d{10})\.bin$')
+CENTI_DEGREES_RANGE = (-2 ** 15, 2 ** 15 - 1)
+
+
+class ReadingArchive:
+    """
+    A compact on-device archive of every reading, kept for retention_seconds so history can be graphed without a
+    round trip to the cloud. Readings are stored as fixed-width 8 byte records -- a sensor number, the milliseconds
+    since the start of their segment and the temperature in centi-degrees Celsius -- in segment files each spanning at
+    most segment_seconds, which are memory-mapped for reads and writes. Sensor numbers are assigned to thermometer IDs
+    in sensors.json.
+
+    Records are appended in time order, so a time range within a segment is found by binary search. Each segment also
+    has a summary index of the count, min, max and sum of each sensor's readings per index_bucket_seconds, kept up to
+    date in memory and written beside the segment when it is sealed, so downsampled queries over long ranges are
+    answered without reading the raw records. Whole segments past retention_seconds are deleted.
+
+    To keep writes to the SD card few and sequential, appended readings are buffered in memory, and once per
+    flush_interval_seconds as many of them as fill whole pages are copied into the segment and synced to disk, so each
+    page is written once; the rest wait for the next flush, unless the oldest of them was read
+    MAX_PENDING_FLUSH_INTERVALS flush intervals ago, in which case they are written as a partial page. Each segment is
+    preallocated as a sparse file and truncated to the records it holds when it is sealed. Readings still buffered are
+    lost if the daemon dies without closing the archive.
+    """
+
+    def __init__(self, directory, logger, segment_seconds=DEFAULT_SEGMENT_SECONDS,
+                 retention_seconds=DEFAULT_RETENTION_SECONDS, flush_interval_seconds=DEFAULT_FLUSH_INTERVAL_SECONDS,
+                 index_bucket_seconds=DEFAULT_INDEX_BUCKET_SECONDS, segment_max_records=DEFAULT_SEGMENT_MAX_RECORDS,
+                 clock=monotonic):
+        self._directory = directory
+        self._logger = logger.getChild("ReadingArchive")
+        self._segment_seconds = min(segment_seconds, MAX_SEGMENT_SECONDS)
+        self._retention_seconds = retention_seconds
+        self._flush_interval_seconds = flush_interval_seconds
+        self._max_pending_ms = int(MAX_PENDING_FLUSH_INTERVALS * flush_interval_seconds * 1000)
+        self._index_bucket_seconds = index_bucket_seconds
+        self._segment_max_records = segment_max_records
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._pending = []
+        self._next_flush = clock() + flush_interval_seconds
+        self._summary_indexes = {}
+
+        os.makedirs(directory, exist_ok=True)
+        self._sensors = self._load_sensors()
+        self._segments = []
+        self._active = None
+        self._open_segments()
+
+    def append(self, read_temps, timestamp):
+        """
+        Archives a dict of thermometer ID to degrees Celsius read at the given Unix timestamp, flushing the buffered
+        readings to disk if the flush interval has passed.
+        """
+        with self._lock:
+            if self._active is None or timestamp >= self._active.start_seconds + self._segment_seconds \
+                    or self._active.count + len(self._pending) + len(read_temps) > self._segment_max_records:
+                self._roll(timestamp)
+
+            last_offset_ms = self._pending[-1][0] if self._pending else self._active.last_offset_ms
+            # the clock may step back; offsets never do, so the segment stays sorted for binary search
+            offset_ms = max(last_offset_ms, int((timestamp - self._active.start_seconds) * 1000))
+            for thermometer_id, temp_degrees_c in iter(read_temps.items()):
+                centi_degrees = min(max(int(round(temp_degrees_c * 100)), CENTI_DEGREES_RANGE[0]),
+                                    CENTI_DEGREES_RANGE[1])
+                self._pending.append((offset_ms, self._get_sensor_number(thermometer_id), centi_degrees))
+
+            if self._clock() >= self._next_flush:
+                self._flush(whole_pages_only=not self._pending or offset_ms - self._pending[0][0] < self._max_pending_ms)
+
+    def flush(self):
+        """
+        Writes all the buffered readings to the active segment and syncs it to disk.
+        """
+        with self._lock:
+            self._flush()
+
+    def close(self):
+        with self._lock:
+            self._flush()
+            for segment in self._segments:
+                segment.close()
+            self._segments = []
+            self._active = None
+
+    def query(self, thermometer_id, start_seconds, end_seconds):
+        """
+        Returns a list of the (Unix timestamp, degrees Celsius) readings of a thermometer taken from start_seconds up
+        to, but excluding, end_seconds, oldest first.
+        """
+        sensor_number = self._sensors.get(thermometer_id)
+        if sensor_number is None:
+            return []
+
+        readings = []
+        with self._lock:
+            for segment, records in self._iter_records(start_seconds, end_seconds):
+                readings.extend((segment.start_seconds + offset_ms / 1000.0, centi_degrees / 100.0)
+                                for offset_ms, sensor, centi_degrees in records if sensor == sensor_number)
+
+        return readings
+
+    def query_downsampled(self, thermometer_id, start_seconds, end_seconds, bucket_seconds):
+        """
+        Returns a list of (bucket start, mean, min, max, reading count) summarizing a thermometer's readings in each
+        bucket_seconds wide bucket that overlaps start_seconds to end_seconds and holds any, oldest first. Buckets are
+        aligned to multiples of bucket_seconds since the epoch. When bucket_seconds is a multiple of
+        index_bucket_seconds, sealed segments are summarized from their indexes rather than their records.
+        """
+        sensor_number = self._sensors.get(thermometer_id)
+        if sensor_number is None:
+            return []
+
+        start_seconds = math.floor(start_seconds / bucket_seconds) * bucket_seconds
+        end_seconds = math.ceil(end_seconds / bucket_seconds) * bucket_seconds
+        use_indexes = bucket_seconds % self._index_bucket_seconds == 0
+        buckets = {}
+        with self._lock:
+            for segment in self._get_overlapping_segments(start_seconds, end_seconds):
+                if use_indexes:
+                    for index_bucket, summary in iter(self._get_summary_index(segment).get(sensor_number, {}).items()):
+                        bucket_start = index_bucket * self._index_bucket_seconds
+                        if start_seconds <= bucket_start < end_seconds:
+                            _merge_bucket(buckets, bucket_start // bucket_seconds * bucket_seconds, *summary)
+                    # buffered readings are not indexed yet
+                    records = [record for record in self._pending if segment is self._active and
+                               start_seconds <= segment.start_seconds + record[0] / 1000.0 < end_seconds]
+                else:
+                    records = self._get_records(segment, start_seconds, end_seconds)
+
+                for offset_ms, sensor, centi_degrees in records:
+                    if sensor == sensor_number:
+                        timestamp = segment.start_seconds + offset_ms / 1000.0
+                        _merge_bucket(buckets, math.floor(timestamp / bucket_seconds) * bucket_seconds, 1,
+                                      centi_degrees, centi_degrees, centi_degrees)
+
+        return [
+            (bucket_start, sum_centi / count / 100.0, min_centi / 100.0, max_centi / 100.0, count)
+            for bucket_start, (count, min_centi, max_centi, sum_centi) in sorted(buckets.items())
+        ]
+
+    def get_stats(self):
+        with self._lock:
+            return {
+                'sensors': len(self._sensors),
+                'segments': len(self._segments),
+                'records': sum(segment.count for segment in self._segments) + len(self._pending),
+                'bytes': sum(segment.get_size() for segment in self._segments),
+                'oldest_timestamp': self._segments[0].start_seconds if self._segments else None,
+            }
+
+    def _flush(self, whole_pages_only=False):
+        self._next_flush = self._clock() + self._flush_interval_seconds
+        if self._active is None:
+            return
+
+        write_count = len(self._pending)
+        if whole_pages_only:
+            records_per_page = mmap.PAGESIZE // RECORD.size
+            write_count = max(0, (self._active.count + write_count) // records_per_page * records_per_page
+                              - self._active.count)
+        if write_count:
+            records = self._pending[:write_count]
+            del self._pending[:write_count]
+            self._active.append(records)
+            self._add_to_summary_index(self._summary_indexes[self._active.path], self._active.start_seconds, records)
+        self._active.flush()
+
+    def _roll(self, timestamp):
+        """
+        Seals the active segment, starts a new one at the given timestamp and deletes segments past retention.
+        """
+        start_seconds = int(timestamp)
+        if self._active is not None:
+            self._flush()
+            self._seal(self._active)
+            # a segment filled within its first second must not reuse its file name
+            start_seconds = max(start_seconds, self._active.start_seconds + 1)
+
+        path = os.path.join(self._directory, 'segment-{:010d}.bin'.format(start_seconds))
+        self._active = ArchiveSegment(path, start_seconds, self._segment_max_records)
+        self._segments.append(self._active)
+        self._summary_indexes[path] = {}
+        self._delete_expired_segments(timestamp)
+
+    def _seal(self, segment):
+        segment.seal()
+        if segment.path not in self._summary_indexes:
+            self._summary_indexes[segment.path] = self._build_summary_index(segment)
+        self._write_summary_index(segment, self._summary_indexes[segment.path])
+
+    def _write_summary_index(self, segment, summary_index):
+        index_path = _get_index_path(segment.path)
+        with open(index_path + '.tmp', 'wb') as index_file:
+            index_file.write(INDEX_HEADER.pack(INDEX_MAGIC, self._index_bucket_seconds))
+            for sensor_number, buckets in iter(summary_index.items()):
+                index_file.write(b''.join(INDEX_ENTRY.pack(index_bucket, sensor_number, *summary)
+                                          for index_bucket, summary in sorted(buckets.items())))
+        os.replace(index_path + '.tmp', index_path)
+
+    def _build_summary_index(self, segment):
+        summary_index = {}
+        self._add_to_summary_index(summary_index, segment.start_seconds, segment.iter_records(0, segment.count))
+        return summary_index
+
+    def _add_to_summary_index(self, summary_index, segment_start_seconds, records):
+        for offset_ms, sensor, centi_degrees in records:
+            index_bucket = int((segment_start_seconds + offset_ms / 1000.0) // self._index_bucket_seconds)
+            _merge_bucket(summary_index.setdefault(sensor, {}), index_bucket, 1, centi_degrees, centi_degrees,
+                          centi_degrees)
+
+    def _get_summary_index(self, segment):
+        """
+        Returns the summary index of a segment as a dict of sensor number to a dict of index bucket number to the
+        [count, min, max, sum] of the sensor's readings in the bucket, loading it or building it from the records.
+        """
+        if segment.path not in self._summary_indexes:
+            summary_index = self._load_summary_index(segment)
+            if summary_index is None:
+                summary_index = self._build_summary_index(segment)
+                if segment is not self._active:
+                    # written with another index bucket size, or lost
+                    self._write_summary_index(segment, summary_index)
+            self._summary_indexes[segment.path] = summary_index
+
+        return self._summary_indexes[segment.path]
+
+    def _load_summary_index(self, segment):
+        try:
+            with open(_get_index_path(segment.path), 'rb') as index_file:
+                contents = index_file.read()
+        except OSError:
+            return None
+        if len(contents) < INDEX_HEADER.size or \
+                INDEX_HEADER.unpack_from(contents) != (INDEX_MAGIC, self._index_bucket_seconds):
+            return None
+
+        summary_index = {}
+        for index_bucket, sensor, *summary in INDEX_ENTRY.iter_unpack(contents[INDEX_HEADER.size:]):
+            summary_index.setdefault(sensor, {})[index_bucket] = summary
+        return summary_index
+
+    def _iter_records(self, start_seconds, end_seconds):
+        for segment in self._get_overlapping_segments(start_seconds, end_seconds):
+            yield segment, self._get_records(segment, start_seconds, end_seconds)
+
+    def _get_records(self, segment, start_seconds, end_seconds):
+        """
+        Returns the (offset, sensor, centi-degrees) records of a segment, including any still buffered, taken from
+        start_seconds up to end_seconds.
+        """
+        start_offset_ms = math.ceil((start_seconds - segment.start_seconds) * 1000)
+        end_offset_ms = math.ceil((end_seconds - segment.start_seconds) * 1000)
+        records = list(segment.iter_records(segment.find(start_offset_ms), segment.find(end_offset_ms)))
+        if segment is self._active:
+            records.extend(record for record in self._pending if start_offset_ms <= record[0] < end_offset_ms)
+        return records
+
+    def _get_overlapping_segments(self, start_seconds, end_seconds):
+        """
+        Returns the segments that may hold readings from start_seconds up to end_seconds; each segment spans from its
+        start to the start of the next.
+        """
+        overlapping = []
+        for i, segment in enumerate(self._segments):
+            next_start = self._segments[i + 1].start_seconds if i + 1 < len(self._segments) else math.inf
+            if segment.start_seconds < end_seconds and next_start > start_seconds:
+                overlapping.append(segment)
+        return overlapping
+
+    def _delete_expired_segments(self, latest_seconds):
+        cutoff = latest_seconds - self._retention_seconds
+        while len(self._segments) > 1 and self._segments[1].start_seconds <= cutoff:
+            segment = self._segments.pop(0)
+            segment.close()
+            self._summary_indexes.pop(segment.path, None)
+            for path in (segment.path, _get_index_path(segment.path)):
+                if os.path.exists(path):
+                    os.unlink(path)
+            self._logger.info("Deleted archive segment %s past retention", segment.path)
+
+    def _open_segments(self):
+        """
+        Opens the segments left by a previous run. Every segment but the newest is sealed; the newest is appended to
+        unless it was sealed too.
+        """
+        starts = sorted(int(match.group(1)) for match in
+                        (SEGMENT_FILE_PATTERN.match(name) for name in os.listdir(self._directory)) if match)
+        for i, start_seconds in enumerate(starts):
+            path = os.path.join(self._directory, 'segment-{:010d}.bin'.format(start_seconds))
+            sealed = os.path.exists(_get_index_path(path))
+            if sealed or i < len(starts) - 1:
+                if not sealed:
+                    segment = ArchiveSegment(path, start_seconds, self._segment_max_records)
+                    self._seal(segment)
+                else:
+                    segment = ArchiveSegment(path, start_seconds)
+                if segment.count:
+                    self._segments.append(segment)
+                else:
+                    segment.close()
+            else:
+                self._active = ArchiveSegment(path, start_seconds, self._segment_max_records)
+                self._segments.append(self._active)
+                self._summary_indexes[path] = self._build_summary_index(self._active)
+
+        if self._segments:
+            self._logger.info("Archive holds %d segments from %s", len(self._segments), self._directory)
+
+    def _load_sensors(self):
+        try:
+            with open(os.path.join(self._directory, SENSORS_FILE)) as sensors_file:
+                return json.load(sensors_file)
+        except FileNotFoundError:
+            return {}
+
+    def _get_sensor_number(self, thermometer_id):
+        if thermometer_id not in self._sensors:
+            self._sensors[thermometer_id] = len(self._sensors) + 1
+            sensors_path = os.path.join(self._directory, SENSORS_FILE)
+            with open(sensors_path + '.tmp', 'w') as sensors_file:
+                json.dump(self._sensors, sensors_file)
+            os.replace(sensors_path + '.tmp', sensors_path)
+
+        return self._sensors[thermometer_id]
+
+
+class ArchiveSegment:
+    """
+    One segment file of the archive, memory-mapped. A writable segment is preallocated to capacity records as a sparse
+    file; unused slots read as zeros, so the number of records it holds is found by binary search for the first one.
+    Sealing truncates the file to its records and maps it read-only.
+    """
+
+    def __init__(self, path, start_seconds, capacity=None):
+        self.path = path
+        self.start_seconds = start_seconds
+        self._writable = capacity is not None
+        self._file = open(path, 'r+b' if self._writable else 'rb') if os.path.exists(path) else open(path, 'w+b')
+        if self._writable and os.fstat(self._file.fileno()).st_size < capacity * RECORD.size:
+            self._file.truncate(capacity * RECORD.size)
+        self._map = None
+        self._map_file()
+        self.count = self._find_count() if self._writable else self._get_mapped_size() // RECORD.size
+        self._flushed_count = self.count
+
+    @property
+    def last_offset_ms(self):
+        return RECORD.unpack_from(self._map, (self.count - 1) * RECORD.size)[0] if self.count else 0
+
+    def append(self, records):
+        position = self.count * RECORD.size
+        self._map[position:position + len(records) * RECORD.size] = b''.join(RECORD.pack(*record)
+                                                                             for record in records)
+        self.count += len(records)
+
+    def flush(self):
+        """
+        Syncs the pages written since the last flush to disk.
+        """
+        if self.count == self._flushed_count:
+            return
+
+        start = self._flushed_count * RECORD.size // mmap.PAGESIZE * mmap.PAGESIZE
+        self._map.flush(start, self.count * RECORD.size - start)
+        self._flushed_count = self.count
+
+    def seal(self):
+        self.flush()
+        if self._map is not None:
+            self._map.close()
+        self._file.truncate(self.count * RECORD.size)
+        self._writable = False
+        self._map_file()
+
+    def find(self, offset_ms):
+        """
+        Returns the position of the first record at or after offset_ms milliseconds into the segment.
+        """
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if RECORD.unpack_from(self._map, middle * RECORD.size)[0] < offset_ms:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def iter_records(self, start_position, end_position):
+        if start_position >= end_position:
+            return iter(())
+        return RECORD.iter_unpack(self._map[start_position * RECORD.size:end_position * RECORD.size])
+
+    def get_size(self):
+        """
+        Returns the bytes the segment's records take up on disk.
+        """
+        return self.count * RECORD.size
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        self._file.close()
+
+    def _map_file(self):
+        size = os.fstat(self._file.fileno()).st_size
+        # an empty file cannot be mapped
+        self._map = None
+        if size:
+            self._map = mmap.mmap(self._file.fileno(), size,
+                                  access=mmap.ACCESS_WRITE if self._writable else mmap.ACCESS_READ)
+
+    def _get_mapped_size(self):
+        return len(self._map) if self._map is not None else 0
+
+    def _find_count(self):
+        low, high = 0, self._get_mapped_size() // RECORD.size
+        while low < high:
+            middle = (low + high) // 2
+            if RECORD.unpack_from(self._map, middle * RECORD.size)[1] != 0:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+
+def _merge_bucket(buckets, key, count, min_centi, max_centi, sum_centi):
+    if key in buckets:
+        bucket = buckets[key]
+        bucket[0] += count
+        bucket[1] = min(bucket[1], min_centi)
+        bucket[2] = max(bucket[2], max_centi)
+        bucket[3] += sum_centi
+    else:
+        buckets[key] = [count, min_centi, max_centi, sum_centi]
+
+
+def _get_index_path(segment_path):
+    return segment_path[:-len('.bin')] + '.idx'
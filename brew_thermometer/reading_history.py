@@ -0,0 +1,161 @@
+from array import array
+from collections import deque
+
+
+# weight of each new reading in the exponentially weighted moving average
+DEFAULT_EWMA_ALPHA = 0.2
+SECONDS_PER_HOUR = 3600.0
+
+
+class ReadingHistory:
+    """
+    A fixed-capacity ring buffer of one thermometer's most recent readings, as monotonic timestamps and degrees Celsius
+    held in preallocated arrays, so memory use stays flat however long the daemon runs. Alongside the readings it keeps
+    rolling statistics over the buffered window, each updated in (amortized) constant time per reading:
+      min/max - from monotonic deques of candidate readings
+      mean - from a running sum
+      ewma - an exponentially weighted moving average of every reading
+      slope - the least squares trend in degrees Celsius per hour, from running sums
+
+    The running sums are recomputed from the buffer once per capacity readings, which rebases timestamps on the oldest
+    buffered reading and keeps floating point error from accumulating over months of uptime.
+    """
+
+    def __init__(self, capacity, ewma_alpha=DEFAULT_EWMA_ALPHA):
+        self._capacity = capacity
+        self._ewma_alpha = ewma_alpha
+        self._timestamps = array('d', [0.0]) * capacity
+        self._values = array('d', [0.0]) * capacity
+        self._count = 0
+        self._next_index = 0
+        self._appended = 0
+        self._ewma = None
+        # (sequence number, value) of readings that may yet become the window's min (or max), oldest first
+        self._min_candidates = deque()
+        self._max_candidates = deque()
+
+        self._origin = 0.0
+        self._sum_t = 0.0
+        self._sum_v = 0.0
+        self._sum_tt = 0.0
+        self._sum_tv = 0.0
+
+    def append(self, timestamp, temp_degrees_c):
+        """
+        Records a reading taken at the given monotonic timestamp, evicting the oldest reading if the buffer is full.
+        """
+        if not self._appended:
+            self._origin = timestamp
+        if self._count == self._capacity:
+            self._remove_from_sums(self._timestamps[self._next_index], self._values[self._next_index])
+        else:
+            self._count += 1
+
+        self._timestamps[self._next_index] = timestamp
+        self._values[self._next_index] = temp_degrees_c
+        self._next_index = (self._next_index + 1) % self._capacity
+        self._add_to_sums(timestamp, temp_degrees_c)
+
+        sequence = self._appended
+        self._appended += 1
+        oldest_sequence = self._appended - self._count
+        self._push_candidate(self._min_candidates, sequence, temp_degrees_c, oldest_sequence, lambda a, b: a >= b)
+        self._push_candidate(self._max_candidates, sequence, temp_degrees_c, oldest_sequence, lambda a, b: a <= b)
+
+        if self._ewma is None:
+            self._ewma = temp_degrees_c
+        else:
+            self._ewma += self._ewma_alpha * (temp_degrees_c - self._ewma)
+
+        if self._appended % self._capacity == 0:
+            self._recompute_sums()
+
+    def get_latest(self):
+        """
+        Returns the most recent reading as a (timestamp, degrees Celsius) tuple, or None if there are none.
+        """
+        if not self._count:
+            return None
+
+        index = (self._next_index - 1) % self._capacity
+        return self._timestamps[index], self._values[index]
+
+    def get_readings(self, since=None):
+        """
+        Returns the buffered readings, oldest first, as a list of (timestamp, degrees Celsius) tuples; only those taken at
+        or after the monotonic timestamp since, if given.
+        """
+        start = (self._next_index - self._count) % self._capacity
+        first = 0 if since is None else self._find_first_since(start, since)
+        return [(self._timestamps[index], self._values[index])
+                for index in ((start + offset) % self._capacity for offset in range(first, self._count))]
+
+    def get_slope_degrees_c_per_hour(self):
+        """
+        Returns the least squares trend of the buffered readings in degrees Celsius per hour, or None if there are too
+        few readings to tell.
+        """
+        denominator = self._count * self._sum_tt - self._sum_t * self._sum_t
+        if self._count < 2 or denominator <= 0:
+            return None
+
+        return (self._count * self._sum_tv - self._sum_t * self._sum_v) / denominator * SECONDS_PER_HOUR
+
+    def get_stats(self):
+        """
+        Returns a dict of the rolling statistics over the buffered readings; values are None while the buffer is empty.
+        """
+        return {
+            'count': self._count,
+            'min': self._min_candidates[0][1] if self._min_candidates else None,
+            'max': self._max_candidates[0][1] if self._max_candidates else None,
+            'mean': self._sum_v / self._count if self._count else None,
+            'ewma': self._ewma,
+            'slope_degrees_c_per_hour': self.get_slope_degrees_c_per_hour(),
+        }
+
+    def __len__(self):
+        return self._count
+
+    def _find_first_since(self, start, since):
+        """
+        Returns the offset from start of the oldest buffered reading taken at or after since; readings are appended in
+        timestamp order, so it is found by binary search.
+        """
+        low, high = 0, self._count
+        while low < high:
+            middle = (low + high) // 2
+            if self._timestamps[(start + middle) % self._capacity] < since:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    @staticmethod
+    def _push_candidate(candidates, sequence, value, oldest_sequence, dominates):
+        while candidates and dominates(candidates[-1][1], value):
+            candidates.pop()
+        candidates.append((sequence, value))
+        while candidates[0][0] < oldest_sequence:
+            candidates.popleft()
+
+    def _add_to_sums(self, timestamp, value):
+        t = timestamp - self._origin
+        self._sum_t += t
+        self._sum_v += value
+        self._sum_tt += t * t
+        self._sum_tv += t * value
+
+    def _remove_from_sums(self, timestamp, value):
+        t = timestamp - self._origin
+        self._sum_t -= t
+        self._sum_v -= value
+        self._sum_tt -= t * t
+        self._sum_tv -= t * value
+
+    def _recompute_sums(self):
+        readings = self.get_readings()
+        self._origin = readings[0][0]
+        self._sum_t = self._sum_v = self._sum_tt = self._sum_tv = 0.0
+        for timestamp, value in readings:
+            self._add_to_sums(timestamp, value)
@@ -0,0 +1,32 @@
+class Reporter:
+    """
+    The interface the Publisher drives a sink through. A reporter publishes readings from its sink's outbox, removing
+    them from the outbox only once they have been delivered, so whatever it cannot deliver yet stays there to retry.
+    """
+
+    def drain(self, force=False):
+        """
+        Publishes readings from the outbox, holding back a partial batch until it is due unless force is True. Returns
+        the list of payloads that were delivered.
+        """
+        raise NotImplementedError
+
+    def seconds_until_flush(self):
+        """
+        Returns the number of seconds until drain should next be called (0 if it is already due), or None if there is
+        nothing to publish.
+        """
+        raise NotImplementedError
+
+    def get_connection_stats(self):
+        """
+        Returns a dict describing the state of the reporter's connection to its destination, including at least
+        'state' and whether it is 'connected'.
+        """
+        raise NotImplementedError
+
+    def stop(self, timeout=None):
+        """
+        Releases the reporter's connection and threads, if it has any.
+        """
+        pass
@@ -1,5 +1,30 @@
+import os
 from os import path
-import re
+from brew_thermometer.instrumentation import NULL_INSTRUMENTATION, STAGE_READ_DEVICE, STAGE_PARSE, FAILURE_CRC, \
+    FAILURE_PARSE, FAILURE_IO
+
+
+W1_DEVICES_ROOT = '/sys/bus/w1/devices'
+READ_ATTRIBUTE_W1_SLAVE = 'w1_slave'
+READ_ATTRIBUTE_TEMPERATURE = 'temperature'
+READ_ATTRIBUTES = (READ_ATTRIBUTE_W1_SLAVE, READ_ATTRIBUTE_TEMPERATURE)
+# approximate DS18B20 conversion time for each supported resolution, in bits
+RESOLUTION_CONVERSION_SECONDS = {
+    9: 0.09375,
+    10: 0.1875,
+    11: 0.375,
+    12: 0.75,
+}
+# DS18B20 quantization step for each supported resolution, in bits
+RESOLUTION_DEGREES_C = {
+    9: 0.5,
+    10: 0.25,
+    11: 0.125,
+    12: 0.0625,
+}
+# w1_slave output is two lines of 40-odd bytes; the temperature attribute is a single short integer
+READ_BUFFER_SIZE = 256
+TRAILING_WHITESPACE = b' \t\r'
 
 
 class Thermometer:
@@ -7,21 +32,70 @@ class Thermometer:
     This class is used to read temperature from a DS18B20 thermometer
     """
 
-    TEMP_LINE_REGEX = re.compile('t=(\d+)')
-
-    def __init__(self, device_id, logger):
+    def __init__(self, device_id, logger, resolution=None, read_attribute=READ_ATTRIBUTE_W1_SLAVE,
+                 instrumentation=NULL_INSTRUMENTATION, devices_root=W1_DEVICES_ROOT):
+        """
+        resolution is the conversion resolution in bits (9 - 12) to configure the device with, or None to leave the
+        device's current resolution alone. read_attribute selects which sysfs attribute temperatures are read from:
+        w1_slave (the raw scratchpad plus CRC check) or temperature (a single integer in 1/1000 degrees Celsius).
+        Reads are timed and their failures counted through instrumentation. devices_root is the directory the 1-Wire
+        devices are found in, which is only changed to point at a simulated device tree.
+        """
         self.device_id = device_id
-        self._device_path = self._get_device_path(self.device_id)
+        self.resolution = resolution
+        self.read_attribute = read_attribute
+        self._device_path = self._get_device_path(self.device_id, read_attribute, devices_root)
+        self._resolution_path = self._get_device_path(self.device_id, 'resolution', devices_root)
         self._logger = logger.getChild("thermometer_{}".format(self.device_id))
+        self._fd = None
+        self._instrumentation = instrumentation
+
+        if read_attribute == READ_ATTRIBUTE_TEMPERATURE:
+            self._parse = self._parse_temperature_attribute
+        else:
+            self._parse = self._parse_temperature
+
+    def apply_resolution(self):
+        """
+        Writes the configured resolution to the device through the kernel's resolution attribute. Returns True if the
+        resolution was written (or there is none configured), or False otherwise.
+        """
+        if self.resolution is None:
+            return True
+
+        try:
+            with open(self._resolution_path, 'w') as r:
+                r.write("{}\n".format(self.resolution))
+        except IOError as ioe:
+            self._logger.error("Could not write resolution %d to '%s': %s", self.resolution, self._resolution_path, ioe)
+            return False
+
+        self._logger.debug("Set resolution to %d bits", self.resolution)
+        return True
+
+    def close(self):
+        """
+        Closes the device file descriptor held open between reads, if there is one.
+        """
+        if self._fd is not None:
+            try:
+                os.close(self._fd)
+            except OSError:
+                pass
+            self._fd = None
 
     def get_temperature(self):
         """
         Attempts to read the temperature from the device, returns the temperature in 1/1000 degrees Celsius if
         temp was read, or None, otherwise.
         """
+        started = self._instrumentation.start_stage()
         read_data = self._read_device_data()
+        self._instrumentation.end_stage(STAGE_READ_DEVICE, started)
         if read_data:
-            read_temp, temp = self._parse_temperature(self._read_device_data())
+            started = self._instrumentation.start_stage()
+            read_temp, temp = self._parse(read_data)
+            self._instrumentation.end_stage(STAGE_PARSE, started)
             if read_temp:
                 return temp
             else:
@@ -35,16 +109,28 @@ class Thermometer:
         None.
         """
         temp = self.get_temperature()
-        if temp:
-            return float(temp) / 1000.0
+        if temp is not None:
+            return temp / 1000.0
         else:
             return None
 
     @staticmethod
-    def _get_device_path(device_id):
-        return path.join('/sys/bus/w1/devices', device_id, 'w1_slave')
+    def _get_device_path(device_id, attribute=READ_ATTRIBUTE_W1_SLAVE, devices_root=W1_DEVICES_ROOT):
+        return path.join(devices_root, device_id, attribute)
+
+    def _parse_temperature_attribute(self, data):
+        """
+        Parses what was read from the temperature attribute, which holds just the temperature in 1/1000 degrees
+        Celsius. Returns a tuple in the same form as _parse_temperature.
+        """
+        try:
+            return True, int(data)
+        except ValueError:
+            self._logger.error("Data read from the thermometer device is not an integer temperature: %r", data)
+            self._instrumentation.count_failure(self.device_id, FAILURE_PARSE)
+            return False, None
 
-    def _parse_temperature(self, data_str):
+    def _parse_temperature(self, data):
         """
         Returns a tuple, where the first value is a boolean denoting whether or not a temp was successfully read,
         and the second value is either:
@@ -58,44 +144,41 @@ class Thermometer:
         #   21 01 4b 46 7f ff 0c 10 1e t=18062
         # where the ending 'YES' of the first line denotes that the temperature was successfully read
         # (will be 'NO' otherwise). The temperature is after the 't=' at the end of the second line. It is expressed in
-        # 1/000 degrees Celsius
-        data_lines = data_str.strip().splitlines()
-        if len(data_lines) == 2:
-            read_temp = data_lines[0].strip().endswith('YES')
-            if read_temp:
-                m = Thermometer.TEMP_LINE_REGEX.search(data_lines[1].strip())
-                temp = None
-                if m is not None:
-                    try:
-                        temp = int(m.group(1))
-                    except ValueError:
-                        self._logger.error(
-                            "Read temperature value '%s' could not be converted to an integer", m.group(1)
-                        )
-                        read_temp = False
-                else:
-                    self._logger.error(
-                        "Could not parse temperature value from what was read from the thermometer device:\n%s\n",
-                        read_temp
-                    )
-                    read_temp = False
-
-            else:
-                temp = None
+        # 1/000 degrees Celsius, and is negative below freezing (e.g. t=-1250).
+        # The bytes are scanned in place rather than decoded, split and regex matched, since this runs on every read.
+        first_line_end = data.find(b'\n')
+        temp_index = data.find(b't=', first_line_end) if first_line_end >= 0 else -1
+        if temp_index < 0:
+            self._logger.error("Data read from the thermometer device does not match expected format:\n%r\n", data)
+            self._instrumentation.count_failure(self.device_id, FAILURE_PARSE)
+            return False, None
 
-            return read_temp, temp
-        else:
-            self._logger.error(
-                "Data read from the thermometer device does not match expected format:\n%s\n",
-                "\n".join(data_lines)
-            )
+        while first_line_end > 0 and data[first_line_end - 1] in TRAILING_WHITESPACE:
+            first_line_end -= 1
+        if not data.endswith(b'YES', 0, first_line_end):
+            self._instrumentation.count_failure(self.device_id, FAILURE_CRC)
+            return False, None
 
+        try:
+            return True, int(data[temp_index + 2:])
+        except ValueError:
+            self._logger.error("Read temperature value %r could not be converted to an integer", data[temp_index + 2:])
+            self._instrumentation.count_failure(self.device_id, FAILURE_PARSE)
             return False, None
 
     def _read_device_data(self):
+        """
+        Reads the raw bytes of the device's read attribute. The descriptor is kept open between reads and re-read from
+        offset 0 with pread, which makes sysfs regenerate the attribute (starting a new conversion) without paying for
+        an open and close on every sample. It is dropped and reopened on the next read if the read fails, e.g. because
+        the device went away.
+        """
         try:
-            with open(self._device_path, 'r') as d:
-                return d.read()
-        except IOError as ioe:
-            self._logger.error("Could not read data from '%s': %s", self._device_path, ioe)
+            if self._fd is None:
+                self._fd = os.open(self._device_path, os.O_RDONLY)
+            return os.pread(self._fd, READ_BUFFER_SIZE, 0)
+        except OSError as ose:
+            self._logger.error("Could not read data from '%s': %s", self._device_path, ose)
+            self._instrumentation.count_failure(self.device_id, FAILURE_IO)
+            self.close()
             return None
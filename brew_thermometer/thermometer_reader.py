@@ -0,0 +1,288 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from time import monotonic
+from brew_thermometer.bus_master import BusMaster
+from brew_thermometer.configuration import READ_MODE_CONCURRENT, READ_MODE_PER_BUS, READ_MODE_BULK, \
+    DEFAULT_QUARANTINE_INITIAL_SECONDS, DEFAULT_QUARANTINE_MAX_SECONDS
+from brew_thermometer.thermometer import W1_DEVICES_ROOT
+
+
+# the name bus stats are kept under for thermometers whose bus master cannot be determined
+UNKNOWN_BUS = 'unknown'
+
+
+class ThermometerReader:
+    """
+    Reads a set of thermometers in one of the configured read modes:
+      sequential - each thermometer is read in turn, paying a full conversion per device
+      concurrent - thermometers are read through a worker pool, so a cycle takes roughly one conversion time
+      per_bus - the thermometers on each bus master are read in turn, with the buses read in parallel through the
+                worker pool, so reads never contend for a bus and a cycle scales with the number of buses rather than
+                the number of thermometers. Thermometers whose bus cannot be determined are read in turn as one bus.
+      bulk - one conversion is triggered per bus master via therm_bulk_read, and the results are then harvested bus by
+             bus in parallel. Thermometers on buses without bulk read support are read concurrently through the worker
+             pool instead.
+    The bus master of every thermometer is looked up when it is added, and read counts, failures and time spent reading
+    are kept per bus in every mode.
+
+    With a read timeout, each read runs on a worker thread of its own thermometer and is abandoned if it has not
+    finished by the deadline, as a blocked sysfs read cannot be interrupted. A thermometer whose read timed out is
+    quarantined: it is skipped until its quarantine ends, and each consecutive timeout doubles the quarantine (from
+    quarantine_initial_seconds up to quarantine_max_seconds). Since each thermometer has its own worker, a hung read
+    only ever ties up that thermometer's, and it is not read again until the hung read returns.
+    """
+
+    def __init__(self, thermometers, read_mode, worker_count, logger, devices_root=W1_DEVICES_ROOT,
+                 read_timeout_seconds=None, quarantine_initial_seconds=DEFAULT_QUARANTINE_INITIAL_SECONDS,
+                 quarantine_max_seconds=DEFAULT_QUARANTINE_MAX_SECONDS, clock=monotonic):
+        self._thermometers = thermometers
+        self._read_mode = read_mode
+        self._logger = logger.getChild("ThermometerReader")
+        self._read_timeout_seconds = read_timeout_seconds
+        self._quarantine_initial_seconds = quarantine_initial_seconds
+        self._quarantine_max_seconds = quarantine_max_seconds
+        self._clock = clock
+        self._quarantine_lock = threading.Lock()
+        self._read_states = {}
+        self._read_workers = {}
+        self._hung_reads = {}
+
+        if read_mode in (READ_MODE_CONCURRENT, READ_MODE_PER_BUS, READ_MODE_BULK):
+            self._logger.debug("Reading thermometers in %s mode with %d workers", read_mode, worker_count)
+            self._executor = ThreadPoolExecutor(max_workers=worker_count)
+        else:
+            self._executor = None
+
+        self._devices_root = devices_root
+        self._bus_masters = {}
+        self._thermometer_bus_masters = {}
+        for thermometer_id in list(self._thermometers):
+            self.add_thermometer(thermometer_id, self._thermometers[thermometer_id])
+
+        self._bus_stats_lock = threading.Lock()
+        self._bus_stats = {}
+
+    def add_thermometer(self, thermometer_id, thermometer, master_name=None):
+        """
+        Adds a thermometer to be read, on the given bus master or, if that is not given, the one it is found on.
+        """
+        if master_name is None:
+            master_name = BusMaster.get_bus_master_name(thermometer_id, self._devices_root)
+        if master_name is not None and master_name not in self._bus_masters:
+            self._bus_masters[master_name] = BusMaster(master_name, self._logger, self._devices_root)
+        self._thermometers[thermometer_id] = thermometer
+        self._thermometer_bus_masters[thermometer_id] = master_name
+        self._logger.info("Thermometer %s is on bus %s", thermometer_id, master_name or UNKNOWN_BUS)
+
+    def remove_thermometer(self, thermometer_id):
+        self._thermometers.pop(thermometer_id, None)
+        self._thermometer_bus_masters.pop(thermometer_id, None)
+        with self._quarantine_lock:
+            self._read_states.pop(thermometer_id, None)
+            self._hung_reads.pop(thermometer_id, None)
+            read_worker = self._read_workers.pop(thermometer_id, None)
+        if read_worker is not None:
+            read_worker.shutdown(wait=False)
+
+    def read(self, thermometer_ids):
+        """
+        Reads the given thermometers. Returns a dict mapping each thermometer ID to a tuple of the temperature in
+        degrees Celsius (or None if it could not be read) and the number of seconds the read took. Quarantined
+        thermometers are not read and are left out of the result.
+        """
+        if self._read_states:
+            now = self._clock()
+            thermometer_ids = [thermometer_id for thermometer_id in thermometer_ids
+                               if self._get_quarantine_remaining_seconds(thermometer_id, now) == 0]
+
+        if self._read_mode == READ_MODE_BULK:
+            return self._read_bulk(thermometer_ids)
+        elif self._read_mode == READ_MODE_PER_BUS:
+            return self._read_by_bus(self._group_by_bus_master(thermometer_ids))
+        else:
+            return self._read_each(thermometer_ids)
+
+    def get_bus_master_name(self, thermometer_id):
+        """
+        Returns the name of the bus master the given thermometer is attached to, or None if it could not be determined.
+        """
+        return self._thermometer_bus_masters.get(thermometer_id)
+
+    def get_bus_stats(self):
+        """
+        Returns a dict of bus master name to a dict of:
+          thermometers - how many thermometers are on the bus
+          reads - how many reads were made on the bus
+          failures - how many of them did not return a temperature
+          read_seconds - the total time spent in those reads
+          reads_per_second - reads divided by read_seconds, the bus' throughput while it is being read
+        """
+        thermometer_counts = {}
+        for master_name in self._thermometer_bus_masters.values():
+            thermometer_counts[master_name or UNKNOWN_BUS] = thermometer_counts.get(master_name or UNKNOWN_BUS, 0) + 1
+
+        with self._bus_stats_lock:
+            bus_stats = {master_name: dict(stats) for master_name, stats in iter(self._bus_stats.items())}
+
+        for master_name, thermometer_count in iter(thermometer_counts.items()):
+            stats = bus_stats.setdefault(master_name, {'reads': 0, 'failures': 0, 'read_seconds': 0.0})
+            stats['thermometers'] = thermometer_count
+            stats['reads_per_second'] = stats['reads'] / stats['read_seconds'] if stats['read_seconds'] else None
+        return bus_stats
+
+    def get_quarantine_remaining_seconds(self, thermometer_id):
+        """
+        Returns how many seconds are left of the thermometer's quarantine, or 0 if it is not quarantined.
+        """
+        return self._get_quarantine_remaining_seconds(thermometer_id, self._clock())
+
+    def get_timeout_stats(self):
+        """
+        Returns a dict of the ID of each thermometer that has had a read time out to a dict of:
+          timeouts - how many of its reads have timed out
+          consecutive_timeouts - how many times in a row its reads have timed out
+          quarantined - whether it is quarantined
+          quarantine_remaining_seconds - how many seconds are left of its quarantine
+        """
+        now = self._clock()
+        with self._quarantine_lock:
+            read_states = {thermometer_id: dict(state) for thermometer_id, state in iter(self._read_states.items())}
+
+        timeout_stats = {}
+        for thermometer_id, state in iter(read_states.items()):
+            remaining_seconds = max(0.0, state['quarantined_until'] - now)
+            timeout_stats[thermometer_id] = {
+                'timeouts': state['timeouts'],
+                'consecutive_timeouts': state['consecutive_timeouts'],
+                'quarantined': remaining_seconds > 0,
+                'quarantine_remaining_seconds': remaining_seconds,
+            }
+        return timeout_stats
+
+    def _get_quarantine_remaining_seconds(self, thermometer_id, now):
+        state = self._read_states.get(thermometer_id)
+        if state is None:
+            return 0
+        return max(0, state['quarantined_until'] - now)
+
+    def _read_bulk(self, thermometer_ids):
+        converted_groups = {}
+        unconverted_ids = []
+        for master_name, ids_on_bus in iter(self._group_by_bus_master(thermometer_ids).items()):
+            if master_name is not None and self._bus_masters[master_name].trigger_bulk_read():
+                self._logger.debug("Triggered bulk conversion of %d thermometers on %s", len(ids_on_bus), master_name)
+                converted_groups[master_name] = ids_on_bus
+            else:
+                unconverted_ids.extend(ids_on_bus)
+
+        # conversions on every bus are now under way at once; harvesting the first reading on a bus waits out the rest
+        # of that bus' conversion, after which the other thermometers on it return immediately
+        results = self._read_by_bus(converted_groups)
+        results.update(self._read_each(unconverted_ids))
+        return results
+
+    def _read_by_bus(self, groups):
+        if self._executor is not None and len(groups) > 1:
+            results = {}
+            for bus_results in self._executor.map(self._read_in_turn, groups.values()):
+                results.update(bus_results)
+            return results
+        else:
+            return self._read_in_turn([thermometer_id for ids_on_bus in groups.values()
+                                       for thermometer_id in ids_on_bus])
+
+    def _read_each(self, thermometer_ids):
+        if self._executor is not None and len(thermometer_ids) > 1:
+            return dict(zip(thermometer_ids, self._executor.map(self._timed_read, thermometer_ids)))
+        else:
+            return self._read_in_turn(thermometer_ids)
+
+    def _read_in_turn(self, thermometer_ids):
+        return {thermometer_id: self._timed_read(thermometer_id) for thermometer_id in thermometer_ids}
+
+    def _group_by_bus_master(self, thermometer_ids):
+        groups = {}
+        for thermometer_id in thermometer_ids:
+            groups.setdefault(self._thermometer_bus_masters.get(thermometer_id), []).append(thermometer_id)
+
+        return groups
+
+    def _timed_read(self, thermometer_id):
+        start = monotonic()
+        if self._read_timeout_seconds is None:
+            temp = self._thermometers[thermometer_id].get_temperature_c()
+        else:
+            temp = self._read_within_timeout(thermometer_id)
+        duration_seconds = monotonic() - start
+        self._record_bus_read(thermometer_id, temp, duration_seconds)
+        return temp, duration_seconds
+
+    def _record_bus_read(self, thermometer_id, temp, duration_seconds):
+        master_name = self._thermometer_bus_masters.get(thermometer_id) or UNKNOWN_BUS
+        with self._bus_stats_lock:
+            stats = self._bus_stats.get(master_name)
+            if stats is None:
+                stats = self._bus_stats[master_name] = {'reads': 0, 'failures': 0, 'read_seconds': 0.0}
+            stats['reads'] += 1
+            if temp is None:
+                stats['failures'] += 1
+            stats['read_seconds'] += duration_seconds
+
+    def _read_within_timeout(self, thermometer_id):
+        """
+        Reads a thermometer on its own worker thread, giving up on the read if it takes longer than the read timeout.
+        Returns the temperature in degrees Celsius, or None if the read failed or timed out.
+        """
+        with self._quarantine_lock:
+            hung_read = self._hung_reads.get(thermometer_id)
+            if hung_read is not None and hung_read.done():
+                del self._hung_reads[thermometer_id]
+                hung_read = None
+            read_worker = self._read_workers.get(thermometer_id)
+            if read_worker is None:
+                read_worker = self._read_workers[thermometer_id] = ThreadPoolExecutor(
+                    max_workers=1, thread_name_prefix="read_{}".format(thermometer_id))
+
+        if hung_read is not None:
+            # the read abandoned last time still has not returned; don't pile another read on top of it, and don't count
+            # it as another timeout either
+            self._quarantine(thermometer_id, "its previous read is still hung", escalate=False)
+            return None
+
+        read = read_worker.submit(self._thermometers[thermometer_id].get_temperature_c)
+        try:
+            temp = read.result(timeout=self._read_timeout_seconds)
+        except TimeoutError:
+            with self._quarantine_lock:
+                self._hung_reads[thermometer_id] = read
+            self._quarantine(thermometer_id, "its read took longer than {} seconds".format(self._read_timeout_seconds))
+            return None
+
+        with self._quarantine_lock:
+            state = self._read_states.get(thermometer_id)
+            if state is not None:
+                state['consecutive_timeouts'] = 0
+        return temp
+
+    def _quarantine(self, thermometer_id, reason, escalate=True):
+        """
+        Quarantines a thermometer. A new timeout (escalate) is counted and doubles the quarantine; otherwise the
+        thermometer is quarantined again for as long as its last timeout earned it.
+        """
+        with self._quarantine_lock:
+            state = self._read_states.get(thermometer_id)
+            if state is None:
+                state = self._read_states[thermometer_id] = {
+                    'timeouts': 0,
+                    'consecutive_timeouts': 0,
+                    'quarantined_until': 0,
+                }
+            if escalate or not state['consecutive_timeouts']:
+                state['timeouts'] += 1
+                state['consecutive_timeouts'] += 1
+            quarantine_seconds = min(self._quarantine_max_seconds,
+                                     self._quarantine_initial_seconds * 2 ** (state['consecutive_timeouts'] - 1))
+            state['quarantined_until'] = self._clock() + quarantine_seconds
+
+        self._logger.warning("Quarantining thermometer %s for %d seconds as %s (%d consecutive timeouts)",
+                             thermometer_id, quarantine_seconds, reason, state['consecutive_timeouts'])
@@ -5,6 +5,7 @@ CONF_DIR="/etc/brew_thermometer"
 DEFAULT_CONF_FILE="default_configuration.json"
 CONF_FILE_NAME="config.json"
 LOG_DIR="/var/log/brew_thermometer/"
+DATA_DIR="/var/lib/brew_thermometer/"
 
 echo "configuring brew_thermometer configuration directory..."
 mkdir -p "$CONF_DIR"
@@ -20,3 +21,8 @@ chmod -R 700 "$LOG_DIR"
 
 
 
+
+echo "configuring brew_thermometer data directory..."
+mkdir -p "$DATA_DIR"
+chown -R "$PI_USER":"$PI_USER" "$DATA_DIR"
+chmod -R 700 "$DATA_DIR"
@@ -5,7 +5,7 @@ setup(
     version='1.0',
     packages=['tests', 'brew_thermometer'],
     scripts=['bin/brew_thermometerd'],
-    install_requires=['paho-mqtt>=1.1'],
+    install_requires=['paho-mqtt>=1.6,<2'],
     url='',
     license='BSD 3-Clause',
     author='ksletmoe',
@@ -0,0 +1,92 @@
+import unittest
+from brew_thermometer.adaptive_sampler import AdaptiveSampler
+from brew_thermometer.reading_history import ReadingHistory
+
+
+class TestAdaptiveSampler(unittest.TestCase):
+    def setUp(self):
+        self.sampler = AdaptiveSampler()
+        self.sampler.configure('a', 10, 600, 0.5, 0.1)
+        self.history = ReadingHistory(100)
+
+    def _append_all(self, values, interval_seconds=60.0):
+        for index, value in enumerate(values):
+            self.history.append(1000.0 + index * interval_seconds, value)
+
+    def test_stable_temperature_relaxes_interval(self):
+        self._append_all([18.0] * 10)
+        self.assertEqual(self.sampler.get_next_interval('a', self.history, 60), 90,
+                         msg="get_next_interval() should lengthen the interval while the temperature is stable")
+        self.assertEqual(self.sampler.get_next_interval('a', self.history, 500), 600,
+                         msg="get_next_interval() should not lengthen the interval past its maximum")
+
+    def test_moving_temperature_tightens_interval(self):
+        # 0.1 degrees a minute is 6 degrees an hour
+        self._append_all([18.0 + 0.1 * index for index in range(10)])
+        self.assertEqual(self.sampler.get_next_interval('a', self.history, 60), 15,
+                         msg="get_next_interval() should shorten the interval while the temperature is moving")
+        self.assertEqual(self.sampler.get_next_interval('a', self.history, 15), 10,
+                         msg="get_next_interval() should not shorten the interval past its minimum")
+
+    def test_noisy_temperature_tightens_interval(self):
+        self._append_all([18.0, 18.5] * 5)
+        self.assertEqual(self.sampler.get_next_interval('a', self.history, 60), 15,
+                         msg="get_next_interval() should shorten the interval while the temperature is noisy, even "
+                             "without a trend")
+
+    def test_borderline_temperature_holds_interval(self):
+        # 0.3 degrees an hour is above half the slope threshold but below the threshold itself
+        self._append_all([18.0 + 0.3 / 18 * index for index in range(10)], interval_seconds=200.0)
+        self.assertEqual(self.sampler.get_next_interval('a', self.history, 200), 200,
+                         msg="get_next_interval() should hold the interval between the quiet and active thresholds")
+
+    def test_stable_probe_flickering_between_quantization_steps_is_quiet(self):
+        # a single flicker at the end of the window fits a slope of several degrees an hour at short intervals
+        self._append_all([18.0] * 59 + [18.0625], interval_seconds=10.0)
+        self.assertEqual(self.sampler.get_next_interval('a', self.history, 10), 15,
+                         msg="get_next_interval() should not count a flicker of one quantization step as movement")
+
+        self.history = ReadingHistory(100)
+        self._append_all([18.0, 18.0625, 18.0625, 18.0, 18.0625, 18.0, 18.0, 18.0625] * 5, interval_seconds=10.0)
+        self.assertEqual(self.sampler.get_next_interval('a', self.history, 10), 15,
+                         msg="get_next_interval() should not count flickering between quantization steps as movement")
+
+    def test_noise_below_resolution_is_quiet(self):
+        self.sampler.configure('b', 10, 600, resolution_degrees_c=0.5)
+        self._append_all([18.0, 18.5] * 5)
+        self.assertEqual(self.sampler.get_next_interval('b', self.history, 60), 90,
+                         msg="get_next_interval() should not count flickering between a coarse resolution's steps as "
+                             "noise")
+
+    def test_judges_only_recent_readings(self):
+        self._append_all([10.0 + index for index in range(20)] + [30.0] * 12)
+        self.assertEqual(self.sampler.get_next_interval('a', self.history, 60), 90,
+                         msg="get_next_interval() should only judge the readings within the window")
+
+    def test_too_few_readings_hold_interval(self):
+        self._append_all([18.0, 25.0, 18.0, 25.0])
+        self.assertEqual(self.sampler.get_next_interval('a', self.history, 60), 60,
+                         msg="get_next_interval() should hold the interval until there are enough readings")
+
+    def test_unconfigured_thermometer_keeps_interval(self):
+        self._append_all([18.0 + index for index in range(10)])
+        self.assertFalse(self.sampler.is_adaptive('b'), msg="is_adaptive() should be False without bounds")
+        self.assertEqual(self.sampler.get_next_interval('b', self.history, 60), 60,
+                         msg="get_next_interval() should keep the interval of a thermometer without bounds")
+        self.assertEqual(self.sampler.get_initial_interval('b', 5), 5,
+                         msg="get_initial_interval() should keep the read interval of a thermometer without bounds")
+
+    def test_initial_interval_within_bounds(self):
+        self.assertEqual(self.sampler.get_initial_interval('a', 5), 10,
+                         msg="get_initial_interval() should keep the read interval within its bounds")
+
+    def test_stats(self):
+        self._append_all([18.0] * 10)
+        self.sampler.get_next_interval('a', self.history, 60)
+        self.sampler.get_next_interval('a', self.history, 600)
+        self.assertEqual(self.sampler.get_stats(), {'a': {'interval_tightened': 0, 'interval_relaxed': 1}},
+                         msg="get_stats() should count interval changes, not reads at a bound")
+
+
+if __name__ == '__main__':
+    unittest.main()
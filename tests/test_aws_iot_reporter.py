@@ -0,0 +1,268 @@
+import json
+import time
+import unittest
+from logging import getLogger, NullHandler
+from unittest.mock import MagicMock
+from brew_thermometer.aws_iot_reporter import AwsIotReporter, STATE_BACKOFF, STATE_CONNECTED, STATE_CONNECTING
+from brew_thermometer.outbox import Outbox, IN_MEMORY_PATH
+from brew_thermometer.payload_encoding import decode_compact_payload
+from brew_thermometer.instrumentation import Instrumentation, STAGE_PUBLISH, STAGE_PUBACK, FAILURE_PUBLISH
+from benchmarks.mqtt_broker_stand_in import MqttBrokerStandIn
+
+
+class FakeMessageInfo:
+    def __init__(self, mid, acked):
+        self.mid = mid
+        self._acked = acked
+
+    def wait_for_publish(self, timeout=None):
+        pass
+
+    def is_published(self):
+        return self._acked
+
+
+class TestAwsIotReporter(unittest.TestCase):
+    def setUp(self):
+        self.logger = getLogger('test_logger')
+        self.logger.addHandler(NullHandler())
+        self.config_hash = {
+            "host": "localhost",
+            "port": 8883,
+            "topic_name": "temperature",
+            "certificate_authority_cert_file_path": "",
+            "cert_file_path": "",
+            "private_key_path": "",
+            "max_batch_size": 3,
+            "max_linger_seconds": 60,
+            "drain_batch_size": 5,
+        }
+        self.outbox = Outbox(IN_MEMORY_PATH, 1000, 0, self.logger)
+        self.payloads = [{"thermometer_id": str(i), "temperature_degrees_celsius": float(i)} for i in range(7)]
+
+    def _reporter(self, acks=None, instrumentation=None):
+        """
+        Returns a reporter connected to a fake client, which acknowledges messages according to acks (all of them if
+        acks is None).
+        """
+        if instrumentation is not None:
+            reporter = AwsIotReporter(self.config_hash, self.logger, self.outbox, instrumentation)
+        else:
+            reporter = AwsIotReporter(self.config_hash, self.logger, self.outbox)
+        reporter._network_thread = MagicMock()
+        reporter._connected.set()
+        acks = iter(acks) if acks is not None else None
+        reporter._client.publish = MagicMock(
+            side_effect=lambda topic, payload, qos, retain=False: FakeMessageInfo(0, next(acks) if acks else True)
+        )
+        return reporter
+
+    def _published_messages(self, reporter):
+        return [json.loads(c[1]['payload']) for c in reporter._client.publish.call_args_list]
+
+    def test_drain_packs_payloads_into_batches(self):
+        reporter = self._reporter()
+        self.outbox.append(self.payloads)
+
+        published = reporter.drain(force=True)
+        messages = self._published_messages(reporter)
+        self.assertEqual(len(messages), 3, msg="drain() should publish one message per max_batch_size payloads")
+        self.assertEqual(messages[0], {"readings": self.payloads[:3]},
+                         msg="drain() should pack each batch of payloads into a single message")
+        self.assertEqual(published, self.payloads, msg="drain() should return every payload that was acknowledged")
+        self.assertEqual(len(self.outbox), 0, msg="drain() should remove acknowledged payloads from the outbox")
+
+    def test_drain_holds_partial_batch_until_linger_expires(self):
+        reporter = self._reporter()
+        self.outbox.append(self.payloads)
+
+        published = reporter.drain()
+        self.assertEqual(published, self.payloads[:6], msg="drain() should publish full batches right away")
+        self.assertGreater(reporter.seconds_until_flush(), 0,
+                           msg="drain() should hold back a partial batch until max_linger_seconds passes")
+
+        reporter._linger_expired = MagicMock(return_value=True)
+        published = reporter.drain()
+        self.assertEqual(published, self.payloads[6:],
+                         msg="drain() should publish a partial batch once max_linger_seconds has passed")
+        self.assertIsNone(reporter.seconds_until_flush(),
+                          msg="seconds_until_flush() should return None once nothing is left to publish")
+
+    def test_drain_keeps_unacknowledged_payloads(self):
+        reporter = self._reporter(acks=[True, False, True])
+        self.outbox.append(self.payloads)
+
+        published = reporter.drain(force=True)
+        self.assertEqual(published, self.payloads[:3] + self.payloads[6:],
+                         msg="drain() should only return payloads that were acknowledged")
+        self.assertEqual([payload for _, payload in self.outbox.peek(10)], self.payloads[3:6],
+                         msg="drain() should keep unacknowledged payloads in the outbox")
+
+    def test_drain_drops_connection_on_ack_timeout(self):
+        reporter = self._reporter(acks=[False])
+        reporter._state = STATE_CONNECTED
+        reporter._client.disconnect = MagicMock()
+        self.outbox.append(self.payloads[:3])
+
+        reporter.drain(force=True)
+        reporter._client.disconnect.assert_called_once_with()
+        self.assertEqual(reporter._state, STATE_BACKOFF,
+                         msg="drain() should back off before reconnecting when a message is not acknowledged")
+        reporter._on_disconnect(reporter._client, None, 0)
+        self.assertEqual(reporter._state, STATE_BACKOFF,
+                         msg="A connection dropped for an unacknowledged message should stay in backoff")
+
+    def test_drain_resumes_after_acknowledgements_are_lost(self):
+        broker = MqttBrokerStandIn(drop_ack_rate=1.0)
+        self.config_hash.update({
+            "port": broker.start(),
+            "tls": False,
+            "max_batch_size": 1,
+            "max_inflight_batches": 2,
+            "ack_timeout_seconds": 0.2,
+            "drain_retry_seconds": 0.05,
+            "reconnect_min_delay_seconds": 0.05,
+            "reconnect_max_delay_seconds": 0.1,
+        })
+        reporter = AwsIotReporter(self.config_hash, self.logger, self.outbox)
+        try:
+            self.outbox.append(self.payloads[:2])
+            self.assertEqual(reporter.drain(force=True), [],
+                             msg="drain() should not return messages the broker did not acknowledge")
+
+            # the lost messages fill every inflight slot; publishing must recover once the broker acknowledges again
+            broker.drop_ack_rate = 0.0
+            self.outbox.append(self.payloads[2:])
+            deadline = time.monotonic() + 10
+            while len(self.outbox) and time.monotonic() < deadline:
+                reporter.drain(force=True)
+                time.sleep(0.01)
+            self.assertEqual(len(self.outbox), 0,
+                             msg="drain() should deliver readings again after acknowledgements were lost")
+        finally:
+            reporter.stop(5)
+            broker.stop()
+
+    def test_drain_records_instrumentation(self):
+        instrumentation = Instrumentation(300, self.logger)
+        reporter = self._reporter(acks=[True, False, True], instrumentation=instrumentation)
+        self.outbox.append(self.payloads)
+
+        reporter.drain(force=True)
+        histograms = instrumentation.get_stage_histograms()
+        self.assertEqual((histograms[STAGE_PUBLISH]['count'], histograms[STAGE_PUBACK]['count']), (3, 2),
+                         msg="drain() should time each publish and each acknowledgement")
+        self.assertEqual({thermometer_id: counts[FAILURE_PUBLISH]
+                          for thermometer_id, counts in instrumentation.get_failure_counts().items()},
+                         {'3': 1, '4': 1, '5': 1},
+                         msg="drain() should count a publish error for each reading in an unacknowledged message")
+
+    def test_drain_replays_backlog_in_large_batches(self):
+        reporter = self._reporter(acks=[False] + [True] * 10)
+        self.outbox.append(self.payloads)
+        reporter.drain(force=True)
+        self.assertTrue(reporter._draining_backlog, msg="A failed publish should leave a backlog to replay")
+
+        reporter._next_drain_attempt = 0
+        reporter._client.publish.reset_mock()
+        reporter.drain()
+        self.assertEqual([len(m["readings"]) for m in self._published_messages(reporter)], [3],
+                         msg="drain() should replay the backlog in drain_batch_size batches")
+        self.assertFalse(reporter._draining_backlog, msg="The backlog should be cleared once the outbox is empty")
+
+    def test_drain_defers_while_disconnected(self):
+        reporter = self._reporter()
+        reporter._connected.clear()
+        self.outbox.append(self.payloads)
+
+        self.assertEqual(reporter.drain(force=True), [], msg="drain() should not publish while disconnected")
+        self.assertEqual(len(self.outbox), len(self.payloads), msg="drain() should keep payloads while disconnected")
+        self.assertGreater(reporter.seconds_until_flush(), 0, msg="drain() should wait before retrying")
+
+    def test_drain_publishes_schema_once_for_compact_encoding(self):
+        self.config_hash["payload_encoding"] = "compact"
+        reporter = self._reporter()
+        self.outbox.append([dict(p, timestamp=1500000000) for p in self.payloads[:3]])
+        reporter.drain(force=True)
+        self.outbox.append([dict(p, timestamp=1500000030) for p in self.payloads[:3]])
+        reporter.drain(force=True)
+
+        topics = [c[0][0] for c in reporter._client.publish.call_args_list]
+        self.assertEqual(topics, ["temperature/schema", "temperature", "temperature"],
+                         msg="drain() should publish the schema once, ahead of the first compact batch")
+
+    def test_drain_encodes_every_batch_against_the_published_schema(self):
+        self.config_hash["payload_encoding"] = "compact"
+        self.config_hash["max_batch_size"] = 1
+        reporter = self._reporter()
+        payloads = [dict(p, timestamp=1500000000) for p in self.payloads[:3]]
+        self.outbox.append(payloads)
+        reporter.drain(force=True)
+
+        messages = [c[1]['payload'] for c in reporter._client.publish.call_args_list]
+        schema = json.loads(messages[0])
+        self.assertEqual([decode_compact_payload(message, schema)[0]["thermometer_id"] for message in messages[1:]],
+                         [p["thermometer_id"] for p in payloads],
+                         msg="drain() should encode every batch against the schema it publishes, even batches "
+                             "encoded before later sensors were added to it")
+
+    def test_plain_tcp_needs_no_certificates(self):
+        config_hash = {"host": "localhost", "port": 1883, "topic_name": "temperature", "tls": False}
+        reporter = AwsIotReporter(config_hash, self.logger, self.outbox)
+        reporter._client.connect = MagicMock()
+        reporter._client.tls_set_context = MagicMock()
+        reporter._connect()
+        reporter._client.tls_set_context.assert_not_called()
+        reporter._client.connect.assert_called_once_with("localhost", 1883, keepalive=60)
+
+    def test_on_disconnect_clears_connection(self):
+        reporter = self._reporter()
+        reporter._state = STATE_CONNECTED
+        reporter._on_disconnect(reporter._client, None, 1)
+        self.assertFalse(reporter._connected.is_set(), msg="An unexpected disconnect should mark the reporter as "
+                                                           "disconnected")
+        self.assertEqual(reporter._state, STATE_BACKOFF,
+                         msg="An unexpected disconnect should back off before reconnecting")
+
+    def test_on_connect_refused_backs_off_without_raising(self):
+        reporter = self._reporter()
+        reporter._connected.clear()
+        reporter._state = STATE_CONNECTING
+        reporter._on_connect(reporter._client, None, {}, 5)
+        self.assertEqual(reporter._state, STATE_BACKOFF, msg="A refused connection should back off")
+        self.assertGreater(reporter._next_connect_attempt, 0, msg="A refused connection should schedule a reconnect")
+
+    def test_on_connect_resets_backoff(self):
+        reporter = self._reporter()
+        reporter._connected.clear()
+        reporter._state = STATE_CONNECTING
+        reporter._reconnect_attempts = 4
+        reporter._on_connect(reporter._client, None, {}, 0)
+        self.assertTrue(reporter._connected.is_set(), msg="A successful connection should mark the reporter connected")
+        self.assertEqual(reporter._reconnect_attempts, 0, msg="A successful connection should reset the backoff")
+
+    def test_reconnect_delay_backs_off_exponentially_with_jitter(self):
+        self.config_hash["reconnect_min_delay_seconds"] = 1
+        self.config_hash["reconnect_max_delay_seconds"] = 30
+        reporter = self._reporter()
+        for attempt, expected_delay in [(0, 1), (3, 8), (10, 30)]:
+            delay = reporter._get_reconnect_delay_seconds(attempt)
+            self.assertTrue(expected_delay / 2 <= delay <= expected_delay,
+                            msg="The reconnect delay should be between half and all of the capped exponential delay")
+
+    def test_connect_failure_backs_off(self):
+        reporter = self._reporter()
+        reporter._create_ssl_context = MagicMock()
+        reporter._client.tls_set_context = MagicMock()
+        reporter._client.connect = MagicMock(side_effect=OSError("connection refused"))
+        reporter._connect()
+        reporter._state = STATE_BACKOFF
+        reporter._connect()
+
+        self.assertEqual(reporter._state, STATE_BACKOFF, msg="A failed connection attempt should back off")
+        self.assertEqual(reporter._reconnect_attempts, 2, msg="Each failed connection attempt should be counted")
+        reporter._create_ssl_context.assert_called_once_with()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,30 +1,184 @@
-import datetime
+import signal
 import unittest
+from unittest.mock import MagicMock
 from tests.test_brew_thermometer import TestBrewThermometer
 from brew_thermometer.brew_thermometer_app import BrewThermometerApp
+from brew_thermometer.configuration import READ_MODE_SEQUENTIAL
+from brew_thermometer.thermometer_reader import ThermometerReader
+from brew_thermometer.read_scheduler import ReadScheduler
+from brew_thermometer.reading_history import ReadingHistory
+from brew_thermometer.adaptive_sampler import AdaptiveSampler
+from brew_thermometer.configuration import Configuration
+from brew_thermometer.instrumentation import Instrumentation, FAILURE_CRC
 
 
 class TestBrewThermometerApp(TestBrewThermometer):
     def setUp(self):
         super()
-        self.read_interval_seconds = 30
         self.app = BrewThermometerApp()
-        self.app.read_interval_seconds = self.read_interval_seconds
 
-    def test__should_read_thermometer_detects_it_should_read(self):
-        # should read if last_read_time is None
-        self.assertTrue(self.app._should_read_thermometer(None),
-                        msg="_should_read_thermometer() should return True if last_read_time is None")
+    def _mock_thermometers(self, temps):
+        self.app._thermometers = {}
+        self.app._read_scheduler = ReadScheduler()
+        for thermometer_id, temp in iter(temps.items()):
+            thermometer = MagicMock()
+            thermometer.get_temperature_c = MagicMock(return_value=temp)
+            self.app._thermometers[thermometer_id] = {
+                'thermometer': thermometer,
+                'description': thermometer_id,
+                'last_reported': None,
+                'last_read_duration_seconds': None,
+                'history': ReadingHistory(10)
+            }
+            self.app._read_scheduler.add(thermometer_id, 30)
 
-        # should read if the last_read_time is more than the read_interval_seconds value ago
-        stale_last_read_time = datetime.datetime.now() - datetime.timedelta(seconds=self.read_interval_seconds + 10)
-        self.assertTrue(self.app._should_read_thermometer(stale_last_read_time),
-                        msg="_should_read_thermometer() should return True if last_read_time is more than "
-                            "app.read_interval_seconds ago")
+        self.app._thermometer_reader = ThermometerReader(
+            {thermometer_id: info['thermometer'] for thermometer_id, info in iter(self.app._thermometers.items())},
+            READ_MODE_SEQUENTIAL,
+            1,
+            self.app._logger
+        )
 
-    def test__should_read_thermometer_detects_it_should_not_read(self):
-        self.assertFalse(self.app._should_read_thermometer(datetime.datetime.now()))
+    def test__try_read_thermometers_returns_read_values(self):
+        self._mock_thermometers({'a': 18.062, 'b': None})
+        self.assertEqual(self.app._try_read_thermometers(['a', 'b']), {'a': 18.062},
+                         msg="_try_read_thermometers() should return the temperatures of thermometers that were read")
 
+    def test__try_read_thermometers_records_read_duration(self):
+        self._mock_thermometers({'a': 18.062, 'b': None})
+        self.app._try_read_thermometers(['a', 'b'])
+        for thermometer_info in self.app._thermometers.values():
+            self.assertIsNotNone(thermometer_info['last_read_duration_seconds'],
+                                 msg="_try_read_thermometers() should record how long each read took")
+
+    def test__try_read_thermometers_records_history(self):
+        self._mock_thermometers({'a': 18.062, 'b': None})
+        self.app._try_read_thermometers(['a', 'b'])
+        self.assertEqual(self.app.get_reading_history('a').get_latest()[1], 18.062,
+                         msg="_try_read_thermometers() should record each read temperature in its history")
+        self.assertEqual(len(self.app.get_reading_history('b')), 0,
+                         msg="_try_read_thermometers() should not record failed reads in the history")
+
+    def test__schedule_next_reads(self):
+        self._mock_thermometers({'a': 18.062, 'b': None})
+        due_ids = self.app._read_scheduler.pop_due()
+        self.app._schedule_next_reads(due_ids, ['a'])
+
+        self.assertGreater(self.app._read_scheduler._schedules['a']['due'],
+                           self.app._read_scheduler._schedules['b']['due'],
+                           msg="_schedule_next_reads() should schedule stored thermometers on their read interval "
+                               "and retry the others after loop_interval_seconds")
+
+    def test__schedule_next_reads_adapts_read_interval(self):
+        self._mock_thermometers({'a': 18.062})
+        self.app._adaptive_sampler = AdaptiveSampler()
+        self.app._adaptive_sampler.configure('a', 10, 600)
+        for index in range(10):
+            self.app.get_reading_history('a').append(1000.0 + index * 30, 18.0 + 0.1 * index)
+        due_ids = self.app._read_scheduler.pop_due()
+        self.app._schedule_next_reads(due_ids, ['a'])
+
+        self.assertLess(self.app._read_scheduler.get_interval('a'), 30,
+                        msg="_schedule_next_reads() should shorten the read interval of an adaptive thermometer whose "
+                            "temperature is moving")
+
+    def test__schedule_next_reads_waits_out_quarantine(self):
+        self._mock_thermometers({'a': None})
+        self.app._thermometer_reader.get_quarantine_remaining_seconds = MagicMock(return_value=60)
+        due_ids = self.app._read_scheduler.pop_due()
+        self.app._schedule_next_reads(due_ids, [])
+
+        self.assertGreaterEqual(self.app._read_scheduler.seconds_until_next_due(), 59,
+                                msg="_schedule_next_reads() should not retry a quarantined thermometer before its "
+                                    "quarantine ends")
+
+    def test__queue_read_temperatures(self):
+        self._mock_thermometers({'a': 18.062, 'b': 17.5})
+        self.assertEqual(sorted(self.app._queue_read_temperatures({'a': 18.062, 'b': 17.5})), ['a', 'b'],
+                         msg="_queue_read_temperatures() should return the IDs of the thermometers queued")
+        self.assertEqual([payload['thermometer_id'] for payload in self.app._reading_queue.get_all(0)], ['a', 'b'],
+                         msg="_queue_read_temperatures() should hand a payload for each reading to the publisher")
+
+    def test__queue_read_temperatures_includes_window_summaries(self):
+        self._mock_thermometers({'a': 18.062})
+        self.app._queue_read_temperatures({'a': 18.5}, {'a': {'temperature_degrees_celsius': 18.5, 'sample_count': 3}})
+        self.assertEqual(self.app._reading_queue.get_all(0)[0]['sample_count'], 3,
+                         msg="_queue_read_temperatures() should add window summaries to the payloads")
+
+    def test__get_seconds_until_wakeup_waits_for_discovery(self):
+        self._mock_thermometers({'a': 18.062})
+        self.app._read_scheduler.reschedule(self.app._read_scheduler.pop_due()[0])
+        self.app._device_index = MagicMock()
+        self.app._device_index.seconds_until_next_check = MagicMock(return_value=4.0)
+        self.assertEqual(self.app._get_seconds_until_wakeup(), 4.0,
+                         msg="_get_seconds_until_wakeup() should wake up for the next discovery check if it comes "
+                             "before the next read")
+
+    def test__update_discovered_thermometers(self):
+        self._mock_thermometers({'28-0000075eddab': 18.062})
+        self.app._instrumentation = Instrumentation(300, self.app._logger)
+        self.app._deadband_filter.configure('28-0000075eddab', 0.5, None)
+        self.app._reading_aggregator.configure('28-0000075eddab', 60)
+        self.app._adaptive_sampler.configure('28-0000075eddab', 10, 60)
+        self.app._instrumentation.count_failure('28-0000075eddab', FAILURE_CRC)
+        self.app._config = Configuration({'thermometers': [{'id': '28-0000075eddac', 'description': 'Mash tun'}]})
+        self.app._device_index = MagicMock()
+        self.app._device_index.refresh = MagicMock(return_value=(['28-0000075eddac'], ['28-0000075eddab']))
+        self.app._device_index.get_bus_master_name = MagicMock(return_value='w1_bus_master1')
+        self.app._update_discovered_thermometers()
+
+        self.assertEqual(list(self.app._thermometers), ['28-0000075eddac'],
+                         msg="_update_discovered_thermometers() should track added thermometers and drop removed ones")
+        self.assertEqual(self.app._thermometers['28-0000075eddac']['description'], 'Mash tun',
+                         msg="_update_discovered_thermometers() should apply the configured settings of added "
+                             "thermometers")
+        self.assertEqual(self.app._read_scheduler.pop_due(), ['28-0000075eddac'],
+                         msg="_update_discovered_thermometers() should schedule added thermometers and unschedule "
+                             "removed ones")
+        self.assertEqual(self.app._thermometer_reader.get_bus_master_name('28-0000075eddac'), 'w1_bus_master1',
+                         msg="_update_discovered_thermometers() should read added thermometers on their bus master")
+        self.assertEqual((self.app._deadband_filter.get_stats().keys(), self.app._adaptive_sampler.get_stats().keys(),
+                          self.app._instrumentation.get_failure_counts().keys()),
+                         ({'28-0000075eddac'}, set(), set()),
+                         msg="_update_discovered_thermometers() should drop the state kept for removed thermometers")
+        self.assertEqual(self.app._reading_aggregator.add({'28-0000075eddab': 18.5}), ({'28-0000075eddab': 18.5}, {}),
+                         msg="_update_discovered_thermometers() should stop aggregating removed thermometers")
+
+    def test_run_shuts_down_once_stopped(self):
+        self._mock_thermometers({'a': 18.062})
+        self.app._archive = MagicMock()
+        self.app.run_once = MagicMock(side_effect=self.app.stop)
+        previous_handler = signal.getsignal(signal.SIGTERM)
+        try:
+            self.app.run()
+        finally:
+            signal.signal(signal.SIGTERM, previous_handler)
+
+        self.app.run_once.assert_called_once_with()
+        self.app._archive.close.assert_called_once_with()
+
+    def test__record_reported_temps(self):
+        self._mock_thermometers({'a': 18.062, 'b': 19.5})
+        self.app._record_reported_temps(['a', 'unplugged'])
+        snapshot = self.app._get_metrics_snapshot()
+        self.assertIn('last_reported_timestamp', snapshot['thermometers']['a'],
+                      msg="_record_reported_temps() should record when a thermometer's reading was acknowledged")
+        self.assertNotIn('last_reported_timestamp', snapshot['thermometers']['b'],
+                         msg="_record_reported_temps() should only record the thermometers whose readings were "
+                             "acknowledged")
+
+    def test__get_metrics_snapshot(self):
+        self._mock_thermometers({'a': 18.062, 'b': None})
+        self.app._try_read_thermometers(['a', 'b'])
+        snapshot = self.app._get_metrics_snapshot()
+        self.assertEqual(snapshot['thermometers']['a']['temperature_degrees_celsius'], 18.062,
+                         msg="_get_metrics_snapshot() should include the latest reading of each thermometer")
+        self.assertNotIn('temperature_degrees_celsius', snapshot['thermometers']['b'],
+                         msg="_get_metrics_snapshot() should not include a reading for thermometers never read")
+        self.assertEqual(snapshot['buses']['unknown']['reads'], 2,
+                         msg="_get_metrics_snapshot() should include the read stats of each bus")
+        self.assertEqual(snapshot['histograms']['read_duration_seconds']['count'], 2,
+                         msg="_get_metrics_snapshot() should include the read duration histogram")
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,49 @@
+import os
+import tempfile
+import unittest
+from logging import getLogger, NullHandler
+from brew_thermometer.bus_master import BusMaster, BULK_READ_TRIGGER
+
+
+class TestBusMaster(unittest.TestCase):
+    def setUp(self):
+        self.logger = getLogger('test_logger')
+        self.logger.addHandler(NullHandler())
+        self.devices_root = tempfile.TemporaryDirectory()
+        self.master_name = 'w1_bus_master1'
+        self.master_dir = os.path.join(self.devices_root.name, self.master_name)
+        os.mkdir(self.master_dir)
+
+    def tearDown(self):
+        self.devices_root.cleanup()
+
+    def test_trigger_bulk_read_writes_trigger(self):
+        bulk_read_path = os.path.join(self.master_dir, 'therm_bulk_read')
+        open(bulk_read_path, 'w').close()
+        bus_master = BusMaster(self.master_name, self.logger, self.devices_root.name)
+
+        self.assertTrue(bus_master.trigger_bulk_read(),
+                        msg="trigger_bulk_read() should return True if the conversion was triggered")
+        with open(bulk_read_path, 'rb') as bulk_read:
+            self.assertEqual(bulk_read.read(), BULK_READ_TRIGGER,
+                             msg="trigger_bulk_read() should write the trigger to therm_bulk_read")
+
+    def test_trigger_bulk_read_unsupported(self):
+        bus_master = BusMaster(self.master_name, self.logger, self.devices_root.name)
+        self.assertFalse(bus_master.trigger_bulk_read(),
+                         msg="trigger_bulk_read() should return False if the master has no therm_bulk_read attribute")
+
+    def test_get_bus_master_name(self):
+        device_id = '28-0000075eddab'
+        os.mkdir(os.path.join(self.master_dir, device_id))
+        os.symlink(os.path.join(self.master_dir, device_id), os.path.join(self.devices_root.name, device_id))
+        self.assertEqual(BusMaster.get_bus_master_name(device_id, self.devices_root.name), self.master_name,
+                         msg="get_bus_master_name() should return the master the device's sysfs entry links into")
+
+    def test_get_bus_master_name_unknown_device(self):
+        self.assertIsNone(BusMaster.get_bus_master_name('28-0000075eddab', self.devices_root.name),
+                          msg="get_bus_master_name() should return None if the device is not attached to a master")
+
+
+if __name__ == '__main__':
+    unittest.main()
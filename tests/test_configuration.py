@@ -1,8 +1,16 @@
 from os import environ
 import unittest
+from unittest.mock import MagicMock
 from tests.test_brew_thermometer import TestBrewThermometer
-from brew_thermometer.configuration import Configuration, DEFAULT_READ_INTERVAL_SECONDS, DEFAULT_LOOP_INTERVAL_SECONDS, BREW_THERMOMETER_DEV_FLAG
+from brew_thermometer.configuration import Configuration, DEFAULT_READ_INTERVAL_SECONDS, DEFAULT_LOOP_INTERVAL_SECONDS, BREW_THERMOMETER_DEV_FLAG, \
+    DEFAULT_READ_MODE, DEFAULT_READ_WORKER_COUNT
+from brew_thermometer.outbox import IN_MEMORY_PATH
 from brew_thermometer.logging import DEFAULT_LOG_LEVEL_STR
+from brew_thermometer.adaptive_sampler import DEFAULT_SLOPE_THRESHOLD_DEGREES_C_PER_HOUR, \
+    DEFAULT_NOISE_THRESHOLD_DEGREES_C
+from brew_thermometer.gateway import GATEWAY_MODE_OFF, GATEWAY_MODE_CLIENT
+from brew_thermometer.reading_archive import DEFAULT_SEGMENT_SECONDS, DEFAULT_INDEX_BUCKET_SECONDS
+from brew_thermometer.thermometer import READ_ATTRIBUTE_W1_SLAVE
 
 
 class TestConfiguration(TestBrewThermometer):
@@ -12,10 +20,21 @@ class TestConfiguration(TestBrewThermometer):
             'log_level': 'info',
             'read_interval_seconds': 20,
             'loop_interval_seconds': 1,
+            'read_mode': 'concurrent',
+            'read_worker_count': 4,
             'thermometers': [
                 {
                     'id': 'foobarbaz',
                     'description': 'Foo bar baz',
+                    'resolution': 9,
+                    'read_attribute': 'temperature',
+                    'read_interval_seconds': 5,
+                    'deadband_degrees_celsius': 0.25,
+                    'heartbeat_seconds': 600,
+                    'aggregation_window_seconds': 300,
+                    'min_read_interval_seconds': 10,
+                    'max_read_interval_seconds': 600,
+                    'adaptive_slope_threshold_degrees_c_per_hour': 1.0,
                 },
                 {
                     'id': 'foobarbaz2',
@@ -68,11 +87,149 @@ class TestConfiguration(TestBrewThermometer):
                              "brew_thermometer.configuration.DEFAULT_LOOP_INTERVAL_SECONDS if loop_interval_seconds "
                              "isn't specified in the conf hash")
 
+    def test_get_read_mode(self):
+        self.assertEqual(Configuration(self.conf_hash).get_read_mode(), self.conf_hash['read_mode'],
+                         msg="get_read_mode() should read the correct read_mode from the conf hash")
+
+    def test_get_read_mode_default(self):
+        self.assertEqual(Configuration({}).get_read_mode(), DEFAULT_READ_MODE,
+                         msg="get_read_mode() should return brew_thermometer.configuration.DEFAULT_READ_MODE if "
+                             "read_mode isn't specified in the conf hash")
+
+    def test_get_read_mode_invalid(self):
+        self.assertEqual(Configuration({'read_mode': 'sideways'}).get_read_mode(), DEFAULT_READ_MODE,
+                         msg="get_read_mode() should return brew_thermometer.configuration.DEFAULT_READ_MODE if "
+                             "read_mode is not a valid read mode")
+
+    def test_get_read_worker_count(self):
+        self.assertEqual(Configuration(self.conf_hash).get_read_worker_count(), self.conf_hash['read_worker_count'],
+                         msg="get_read_worker_count() should read the correct read_worker_count from the conf hash")
+
+    def test_get_read_worker_count_invalid(self):
+        self.assertEqual(Configuration({'read_worker_count': 0}).get_read_worker_count(), DEFAULT_READ_WORKER_COUNT,
+                         msg="get_read_worker_count() should return "
+                             "brew_thermometer.configuration.DEFAULT_READ_WORKER_COUNT if read_worker_count is less "
+                             "than 1")
+
+    def test_get_outbox_path(self):
+        self.assertEqual(Configuration({'outbox_path': '/tmp/outbox'}).get_outbox_path(), '/tmp/outbox',
+                         msg="get_outbox_path() should read the correct outbox_path from the conf hash")
+
+    def test_get_outbox_path_developer_mode_default(self):
+        environ[BREW_THERMOMETER_DEV_FLAG] = '1'
+        self.assertEqual(Configuration({}).get_outbox_path(), IN_MEMORY_PATH,
+                         msg="get_outbox_path() should keep the outbox in memory in developer mode if outbox_path "
+                             "isn't specified in the conf hash")
+
     def test_get_thermometer_configs_none_provided(self):
         self.assertEqual(Configuration({}).get_thermometer_configs(), [],
                          msg="If no thermometers are provided in the conf hash, get_thermometer_configs() should "
                              "return an empty list")
 
+    def test_get_devices_root(self):
+        self.assertEqual(Configuration(self.conf_hash).get_devices_root(), '/sys/bus/w1/devices',
+                         msg="get_devices_root() should default to the kernel's 1-Wire devices directory")
+        self.assertEqual(Configuration({'devices_root': '/tmp/w1'}).get_devices_root(), '/tmp/w1',
+                         msg="get_devices_root() should return the devices_root from the conf hash")
+
+    def test_get_metrics_port(self):
+        self.assertIsNone(Configuration(self.conf_hash).get_metrics_port(),
+                          msg="get_metrics_port() should return None if metrics_port is not specified")
+        self.assertEqual(Configuration({'metrics_port': '9464'}).get_metrics_port(), 9464,
+                         msg="get_metrics_port() should return the metrics_port from the conf hash")
+        self.assertIsNone(Configuration({'metrics_port': 70000}).get_metrics_port(),
+                          msg="get_metrics_port() should return None for an invalid metrics_port")
+
+    def test__parse_int_logs_invalid_value(self):
+        config = Configuration({'read_worker_count': 'many'})
+        with self.assertLogs('brew_thermometer.configuration', level='WARNING') as logs:
+            self.assertEqual(config.get_read_worker_count(), DEFAULT_READ_WORKER_COUNT,
+                             msg="_parse_int() should return the default for a value that is not an integer")
+        self.assertIn("Invalid value for 'read_worker_count': many", logs.output[0],
+                      msg="_parse_int() should log which value was invalid")
+
+    def test_get_read_timeout_seconds(self):
+        self.assertIsNone(Configuration(self.conf_hash).get_read_timeout_seconds(),
+                          msg="get_read_timeout_seconds() should return None if read_timeout_seconds isn't specified")
+        self.assertEqual(Configuration({'read_timeout_seconds': 2.5}).get_read_timeout_seconds(), 2.5,
+                         msg="get_read_timeout_seconds() should read read_timeout_seconds from the conf hash")
+        self.assertIsNone(Configuration({'read_timeout_seconds': -1}).get_read_timeout_seconds(),
+                          msg="get_read_timeout_seconds() should return None for a non-positive read_timeout_seconds")
+
+    def test_get_quarantine_max_seconds_is_at_least_initial(self):
+        config = Configuration({'quarantine_initial_seconds': 60, 'quarantine_max_seconds': 30})
+        self.assertEqual(config.get_quarantine_max_seconds(), 60,
+                         msg="get_quarantine_max_seconds() should not be less than quarantine_initial_seconds")
+
+    def test_archive(self):
+        config = Configuration({'archive_path': '/tmp/archive', 'archive_segment_seconds': 10 ** 9,
+                                'archive_index_bucket_seconds': 0})
+        self.assertEqual(config.get_archive_path(), '/tmp/archive',
+                         msg="get_archive_path() should read archive_path from the conf hash")
+        self.assertEqual(config.get_archive_segment_seconds(), DEFAULT_SEGMENT_SECONDS,
+                         msg="get_archive_segment_seconds() should default for a span too long for a segment")
+        self.assertEqual(config.get_archive_index_bucket_seconds(), DEFAULT_INDEX_BUCKET_SECONDS,
+                         msg="get_archive_index_bucket_seconds() should default for a bucket under a second")
+        self.assertIsNone(Configuration({}).get_archive_path(),
+                          msg="get_archive_path() should return None if the archive is not configured")
+
+    def test_get_gateway_mode(self):
+        self.assertEqual(Configuration({'gateway_mode': 'client'}).get_gateway_mode(), GATEWAY_MODE_CLIENT,
+                         msg="get_gateway_mode() should read gateway_mode from the conf hash")
+        self.assertEqual(Configuration({'gateway_mode': 'relay'}).get_gateway_mode(), GATEWAY_MODE_OFF,
+                         msg="get_gateway_mode() should default to off for an invalid mode")
+        self.assertEqual(Configuration({}).get_gateway_mode(), GATEWAY_MODE_OFF,
+                         msg="get_gateway_mode() should default to off")
+
+    def test_get_sink_configs(self):
+        sinks = [
+            {'name': 'log', 'type': 'file', 'path': '/tmp/readings.csv'},
+            {'name': 'dashboard', 'type': 'mqtt', 'host': 'localhost', 'port': 1883, 'topic_name': 'temperature'},
+            {'name': 'log', 'type': 'file', 'path': '/tmp/other.csv'},
+            {'name': 'pager', 'type': 'sms'},
+            {'name': 'nowhere', 'type': 'file'},
+        ]
+        self.assertEqual([sink['name'] for sink in Configuration({'sinks': sinks}).get_sink_configs()],
+                         ['log', 'dashboard'],
+                         msg="get_sink_configs() should return valid sinks and skip those with a duplicate name, an "
+                             "unknown type or missing settings")
+        self.assertEqual(Configuration({}).get_sink_configs(), [],
+                         msg="get_sink_configs() should return an empty list if no sinks are configured")
+
+    def test_get_publish_queue_policy_blocks_only_without_sinks(self):
+        sinks = [{'name': 'log', 'type': 'file', 'path': '/tmp/readings.csv'}]
+        self.assertEqual(Configuration({'publish_queue_policy': 'block'}).get_publish_queue_policy(), 'block',
+                         msg="get_publish_queue_policy() should let the publish queue block while it is the only sink")
+        self.assertEqual(Configuration({'publish_queue_policy': 'block', 'sinks': sinks}).get_publish_queue_policy(),
+                         'drop_oldest',
+                         msg="get_publish_queue_policy() should drop the oldest reading instead of blocking while other "
+                             "sinks are configured")
+
+    def test_discovery(self):
+        self.assertFalse(Configuration(self.conf_hash).is_discovery_enabled(),
+                         msg="is_discovery_enabled() should default to False")
+        config = Configuration({'discovery': True, 'discovery_interval_seconds': 30})
+        self.assertTrue(config.is_discovery_enabled(), msg="is_discovery_enabled() should read discovery from the conf hash")
+        self.assertEqual(config.get_discovery_interval_seconds(), 30,
+                         msg="get_discovery_interval_seconds() should read discovery_interval_seconds from the conf hash")
+
+    def test_get_thermometer_config(self):
+        config = Configuration(self.conf_hash)
+        self.assertEqual(config.get_thermometer_config('foobarbaz').description, 'Foo bar baz',
+                         msg="get_thermometer_config() should return the configured settings of a listed thermometer")
+        default_config = config.get_thermometer_config('28-0000075eddab')
+        self.assertEqual((default_config.id, default_config.read_interval_seconds), ('28-0000075eddab', 20),
+                         msg="get_thermometer_config() should return the default settings of an unlisted thermometer")
+
+    def test_get_thermometer_config_parses_entries_once(self):
+        config = Configuration({'thermometers': [{'id': 'foobarbaz', 'resolution': 13}]})
+        config._logger = MagicMock()
+        for _ in range(3):
+            config.get_thermometer_config('foobarbaz')
+            config.get_thermometer_config('28-0000075eddab')
+        self.assertEqual(config._logger.warning.call_count, 1,
+                         msg="get_thermometer_config() should parse and validate the thermometer entries only once")
+
     def test_get_thermometer_configs_returns_correct_count(self):
         therm_conf_count = len(Configuration(self.conf_hash).get_thermometer_configs())
         self.assertEqual(therm_conf_count, len(self.conf_hash['thermometers']),
@@ -99,6 +256,77 @@ class TestConfiguration(TestBrewThermometer):
                              "the conf hash or have an empty string if a description was not provided for the "
                              "thermometer")
 
+    def test_get_thermometer_configs_returns_thermometers_with_specified_resolutions(self):
+        therm_confs = Configuration(self.conf_hash).get_thermometer_configs()
+        self.assertEqual([t_conf.resolution for t_conf in therm_confs], [9, None],
+                         msg="get_thermometer_configs() should read the resolution for each thermometer in the conf "
+                             "hash or have None if a resolution was not provided for the thermometer")
+
+    def test_get_thermometer_configs_ignores_invalid_resolution(self):
+        conf_hash = {'thermometers': [{'id': 'foobarbaz', 'resolution': 8}]}
+        self.assertIsNone(Configuration(conf_hash).get_thermometer_configs()[0].resolution,
+                          msg="get_thermometer_configs() should have None for an invalid resolution")
+
+    def test_get_thermometer_configs_returns_thermometers_with_specified_read_attributes(self):
+        therm_confs = Configuration(self.conf_hash).get_thermometer_configs()
+        self.assertEqual([t_conf.read_attribute for t_conf in therm_confs], ['temperature', READ_ATTRIBUTE_W1_SLAVE],
+                         msg="get_thermometer_configs() should read the read_attribute for each thermometer in the "
+                             "conf hash or default to w1_slave if one was not provided for the thermometer")
+
+    def test_get_thermometer_configs_returns_thermometers_with_specified_read_intervals(self):
+        therm_confs = Configuration(self.conf_hash).get_thermometer_configs()
+        self.assertEqual([t_conf.read_interval_seconds for t_conf in therm_confs],
+                         [5, self.conf_hash['read_interval_seconds']],
+                         msg="get_thermometer_configs() should read the read_interval_seconds for each thermometer in "
+                             "the conf hash or default to the top level read_interval_seconds")
+
+    def test_get_thermometer_configs_ignores_invalid_read_interval(self):
+        conf_hash = {'thermometers': [{'id': 'foobarbaz', 'read_interval_seconds': 0}]}
+        self.assertEqual(Configuration(conf_hash).get_thermometer_configs()[0].read_interval_seconds,
+                         DEFAULT_READ_INTERVAL_SECONDS,
+                         msg="get_thermometer_configs() should default an invalid read_interval_seconds")
+
+    def test_get_thermometer_configs_returns_thermometers_with_specified_deadbands(self):
+        therm_confs = Configuration(self.conf_hash).get_thermometer_configs()
+        self.assertEqual([(t_conf.deadband_degrees_celsius, t_conf.heartbeat_seconds) for t_conf in therm_confs],
+                         [(0.25, 600), (None, None)],
+                         msg="get_thermometer_configs() should read the deadband_degrees_celsius and heartbeat_seconds "
+                             "for each thermometer in the conf hash or leave them unset")
+
+    def test_get_thermometer_configs_returns_thermometers_with_specified_aggregation_windows(self):
+        therm_confs = Configuration(self.conf_hash).get_thermometer_configs()
+        self.assertEqual([t_conf.aggregation_window_seconds for t_conf in therm_confs], [300, None],
+                         msg="get_thermometer_configs() should read the aggregation_window_seconds for each thermometer "
+                             "in the conf hash or leave it unset")
+
+    def test_get_thermometer_configs_returns_thermometers_with_specified_read_interval_bounds(self):
+        therm_confs = Configuration(self.conf_hash).get_thermometer_configs()
+        self.assertEqual([(t_conf.min_read_interval_seconds, t_conf.max_read_interval_seconds,
+                           t_conf.adaptive_slope_threshold_degrees_c_per_hour,
+                           t_conf.adaptive_noise_threshold_degrees_c) for t_conf in therm_confs],
+                         [(10, 600, 1.0, DEFAULT_NOISE_THRESHOLD_DEGREES_C),
+                          (None, None, DEFAULT_SLOPE_THRESHOLD_DEGREES_C_PER_HOUR, DEFAULT_NOISE_THRESHOLD_DEGREES_C)],
+                         msg="get_thermometer_configs() should read the read interval bounds and adaptive thresholds "
+                             "for each thermometer in the conf hash or default them")
+
+    def test_get_thermometer_configs_ignores_invalid_read_interval_bounds(self):
+        conf_hash = {'thermometers': [{'id': 'foobarbaz', 'min_read_interval_seconds': 600,
+                                       'max_read_interval_seconds': 10},
+                                      {'id': 'foobarbaz2', 'min_read_interval_seconds': 10}]}
+        therm_confs = Configuration(conf_hash).get_thermometer_configs()
+        self.assertEqual([(t_conf.min_read_interval_seconds, t_conf.max_read_interval_seconds)
+                          for t_conf in therm_confs],
+                         [(None, None), (None, None)],
+                         msg="get_thermometer_configs() should read at a fixed interval unless both bounds are given "
+                             "with the min below the max")
+
+    def test_get_thermometer_configs_ignores_invalid_deadband(self):
+        conf_hash = {'thermometers': [{'id': 'foobarbaz', 'deadband_degrees_celsius': -1, 'heartbeat_seconds': 'x'}]}
+        therm_conf = Configuration(conf_hash).get_thermometer_configs()[0]
+        self.assertEqual((therm_conf.deadband_degrees_celsius, therm_conf.heartbeat_seconds), (None, None),
+                         msg="get_thermometer_configs() should ignore an invalid deadband_degrees_celsius or "
+                             "heartbeat_seconds")
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,55 @@
+import unittest
+from brew_thermometer.deadband_filter import DeadbandFilter
+from tests.test_read_scheduler import FakeClock
+
+
+class TestDeadbandFilter(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.filter = DeadbandFilter(self.clock)
+        self.filter.configure('a', 0.5, 60)
+
+    def test_first_reading_is_published(self):
+        self.assertEqual(self.filter.filter({'a': 18.0}), {'a': 18.0},
+                         msg="filter() should publish a thermometer's first reading")
+
+    def test_small_changes_are_suppressed(self):
+        self.filter.filter({'a': 18.0})
+        self.assertEqual(self.filter.filter({'a': 18.4}), {},
+                         msg="filter() should suppress readings within the deadband of the last published value")
+
+    def test_large_changes_are_published(self):
+        self.filter.filter({'a': 18.0})
+        self.filter.filter({'a': 18.4})
+        self.assertEqual(self.filter.filter({'a': 17.4}), {'a': 17.4},
+                         msg="filter() should publish readings that moved more than the deadband")
+
+    def test_deadband_is_relative_to_last_published_value(self):
+        self.filter.filter({'a': 18.0})
+        self.filter.filter({'a': 18.4})
+        self.assertEqual(self.filter.filter({'a': 18.6}), {'a': 18.6},
+                         msg="filter() should compare readings to the last published value, so slow drifts are "
+                             "still published")
+
+    def test_heartbeat_publishes_unchanged_readings(self):
+        self.filter.filter({'a': 18.0})
+        self.clock.now += 60
+        self.assertEqual(self.filter.filter({'a': 18.0}), {'a': 18.0},
+                         msg="filter() should publish an unchanged reading once the heartbeat interval has passed")
+
+    def test_thermometers_without_deadband_publish_everything(self):
+        self.filter.configure('b', None, None)
+        self.filter.filter({'b': 18.0})
+        self.assertEqual(self.filter.filter({'b': 18.0, 'c': 19.0}), {'b': 18.0, 'c': 19.0},
+                         msg="filter() should publish every reading of thermometers without a deadband")
+
+    def test_get_stats(self):
+        self.filter.filter({'a': 18.0})
+        self.filter.filter({'a': 18.1})
+        self.filter.filter({'a': 18.2})
+        self.assertEqual(self.filter.get_stats(), {'a': {'published': 1, 'suppressed': 2}},
+                         msg="get_stats() should count published and suppressed readings per thermometer")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+import os
+import shutil
+import tempfile
+import unittest
+from logging import getLogger, NullHandler
+from brew_thermometer.device_index import DeviceIndex, MASTER_SLAVES_ATTRIBUTE
+from tests.test_read_scheduler import FakeClock
+
+
+class TestDeviceIndex(unittest.TestCase):
+    def setUp(self):
+        self.logger = getLogger('test_logger')
+        self.logger.addHandler(NullHandler())
+        self.devices_root = tempfile.TemporaryDirectory()
+        self.clock = FakeClock()
+        self._set_slaves('w1_bus_master1', ['28-0000075eddab', '28-0000075eddac'])
+        self.index = DeviceIndex(self.logger, 10, self.devices_root.name, self.clock)
+
+    def tearDown(self):
+        self.devices_root.cleanup()
+
+    def _set_slaves(self, master_name, device_ids):
+        master_dir = os.path.join(self.devices_root.name, master_name)
+        os.makedirs(master_dir, exist_ok=True)
+        with open(os.path.join(master_dir, MASTER_SLAVES_ATTRIBUTE), 'w') as slaves_file:
+            slaves_file.write(''.join(device_id + '\n' for device_id in device_ids) or 'not found.\n')
+
+    def test_refresh_discovers_thermometers(self):
+        self.assertEqual(self.index.refresh(), (['28-0000075eddab', '28-0000075eddac'], []),
+                         msg="refresh() should return the thermometers found on the bus masters as added")
+        self.assertEqual(self.index.get_bus_master_name('28-0000075eddab'), 'w1_bus_master1',
+                         msg="get_bus_master_name() should return the bus master a thermometer was found on")
+
+    def test_refresh_ignores_other_devices(self):
+        self._set_slaves('w1_bus_master2', ['3a-00000004e3b1'])
+        self.index.refresh()
+        self.assertEqual(self.index.get_device_ids(), ['28-0000075eddab', '28-0000075eddac'],
+                         msg="refresh() should only index DS18B20 thermometers")
+
+    def test_refresh_picks_up_added_and_removed_thermometers(self):
+        self.index.refresh()
+        self._set_slaves('w1_bus_master1', ['28-0000075eddac', '28-0000075eddad'])
+        self.clock.now += 10
+        self.assertEqual(self.index.refresh(), (['28-0000075eddad'], ['28-0000075eddab']),
+                         msg="refresh() should return the thermometers plugged in and removed since the last refresh")
+
+    def test_refresh_waits_for_the_check_interval(self):
+        self.index.refresh()
+        self._set_slaves('w1_bus_master1', [])
+        self.clock.now += 5
+        self.assertEqual(self.index.refresh(), ([], []),
+                         msg="refresh() should not check the bus masters again before the check interval has passed")
+        self.assertEqual(self.index.refresh(force=True), ([], ['28-0000075eddab', '28-0000075eddac']),
+                         msg="refresh(force=True) should check the bus masters regardless of the check interval")
+
+    def test_seconds_until_next_check(self):
+        self.assertEqual(self.index.seconds_until_next_check(), 0,
+                         msg="seconds_until_next_check() should be due before the first refresh")
+        self.index.refresh()
+        self.clock.now += 4
+        self.assertEqual(self.index.seconds_until_next_check(), 6,
+                         msg="seconds_until_next_check() should count down to the end of the check interval")
+
+    def test_refresh_rescans_when_a_bus_master_disappears(self):
+        self.index.refresh()
+        shutil.rmtree(os.path.join(self.devices_root.name, 'w1_bus_master1'))
+        self._set_slaves('w1_bus_master2', ['28-0000075eddab'])
+        self.assertEqual(self.index.refresh(force=True), ([], ['28-0000075eddac']),
+                         msg="refresh() should find thermometers moved to another bus master")
+        self.assertEqual(self.index.get_bus_master_name('28-0000075eddab'), 'w1_bus_master2',
+                         msg="refresh() should update the bus master of a moved thermometer")
+
+
+if __name__ == '__main__':
+    unittest.main()
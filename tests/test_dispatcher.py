@@ -0,0 +1,82 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+from logging import getLogger, NullHandler
+from unittest.mock import MagicMock
+from brew_thermometer.dispatcher import ReadingDispatcher, create_sink
+from brew_thermometer.outbox import Outbox, IN_MEMORY_PATH
+from brew_thermometer.publisher import Publisher, ReadingQueue, QUEUE_POLICY_DROP_OLDEST
+
+
+def payload(thermometer_id, temp):
+    return {"thermometer_id": thermometer_id, "temperature_degrees_celsius": temp, "timestamp": time.time()}
+
+
+class TestReadingDispatcher(unittest.TestCase):
+    def setUp(self):
+        self.logger = getLogger('test_logger')
+        self.logger.addHandler(NullHandler())
+        self.dispatcher = ReadingDispatcher(self.logger)
+
+    def _add_sink(self, name, queue_size, drain):
+        reporter = MagicMock()
+        reporter.seconds_until_flush = MagicMock(return_value=None)
+        reporter.get_connection_stats = MagicMock(return_value={'state': 'connected', 'connected': True})
+        outbox = Outbox(IN_MEMORY_PATH, 100, 0, self.logger)
+        reporter.drain = MagicMock(side_effect=lambda: drain(outbox))
+        reading_queue = ReadingQueue(queue_size, QUEUE_POLICY_DROP_OLDEST)
+        self.dispatcher.add_sink(name, reading_queue, Publisher(reading_queue, outbox, reporter, None, self.logger,
+                                                                name))
+        return outbox
+
+    def test_put_queues_readings_for_every_sink(self):
+        self._add_sink('a', 10, lambda outbox: [])
+        self._add_sink('b', 1, lambda outbox: [])
+        self.assertEqual(self.dispatcher.put(payload('x', 1.0)), [], msg="put() should queue a reading for every sink")
+        self.assertEqual(self.dispatcher.put(payload('x', 2.0)), ['b'],
+                         msg="put() should return the sinks that had to drop a reading")
+        self.assertEqual({name: stats['queue_depth'] for name, stats in self.dispatcher.get_stats().items()},
+                         {'a': 2, 'b': 1}, msg="each sink should queue readings under its own bounds")
+
+    def test_a_stalled_sink_does_not_hold_up_the_others(self):
+        release_stalled_sink = threading.Event()
+        delivered = threading.Event()
+
+        def stall(outbox):
+            release_stalled_sink.wait(5)
+            return []
+
+        def deliver(outbox):
+            rows = outbox.peek(10)
+            outbox.remove([reading_id for reading_id, _ in rows])
+            if rows:
+                delivered.set()
+            return [payload_hash for _, payload_hash in rows]
+
+        self._add_sink('stalled', 10, stall)
+        self._add_sink('healthy', 10, deliver)
+        self.dispatcher.start()
+        try:
+            self.dispatcher.put(payload('x', 1.0))
+            self.assertTrue(delivered.wait(5), msg="a sink should deliver readings while another sink is stalled")
+            self.assertEqual(self.dispatcher.get_stats()['healthy']['published'], 1,
+                             msg="get_stats() should count the readings each sink delivered")
+        finally:
+            release_stalled_sink.set()
+            self.dispatcher.stop(5)
+
+    def test_create_sink_never_blocks_the_read_loop(self):
+        with tempfile.TemporaryDirectory() as output_dir:
+            reading_queue, publisher = create_sink({
+                'name': 'log', 'type': 'file', 'path': os.path.join(output_dir, 'readings.csv'),
+                'publish_queue_size': 1, 'publish_queue_policy': 'block',
+            }, self.logger)
+            reading_queue.put(payload('x', 1.0))
+            self.assertFalse(reading_queue.put(payload('x', 2.0)),
+                             msg="a sink configured to block should drop its oldest reading instead")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+import os
+import tempfile
+import unittest
+from logging import getLogger, NullHandler
+from brew_thermometer.file_reporter import FileReporter, FILE_FORMAT_LINE_PROTOCOL
+from brew_thermometer.outbox import Outbox, IN_MEMORY_PATH
+
+
+class TestFileReporter(unittest.TestCase):
+    def setUp(self):
+        self.logger = getLogger('test_logger')
+        self.logger.addHandler(NullHandler())
+        self.output_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.output_dir.name, 'readings.csv')
+        self.config_hash = {"path": self.path, "max_batch_size": 2, "max_linger_seconds": 60}
+        self.outbox = Outbox(IN_MEMORY_PATH, 1000, 0, self.logger)
+        self.payloads = [
+            {"thermometer_id": "28-0000075eddab", "description": "Fermenter, A", "temperature_degrees_celsius": 18.062,
+             "timestamp": 1700000000.5},
+            {"thermometer_id": "28-0000075eddac", "description": "", "temperature_degrees_celsius": -1.25,
+             "timestamp": 1700000001.0},
+        ]
+
+    def tearDown(self):
+        self.outbox.close()
+        self.output_dir.cleanup()
+
+    def _read_output(self):
+        with open(self.path) as output_file:
+            return output_file.read()
+
+    def test_drain_appends_csv(self):
+        reporter = FileReporter(self.config_hash, self.logger, self.outbox)
+        self.outbox.append(self.payloads)
+        self.assertEqual(reporter.drain(), self.payloads, msg="drain() should return the payloads written to the file")
+        self.outbox.append(self.payloads[:1])
+        reporter.drain(force=True)
+        self.assertEqual(self._read_output(),
+                         'timestamp,thermometer_id,description,temperature_degrees_celsius\n'
+                         '1700000000.5,28-0000075eddab,"Fermenter, A",18.062\n'
+                         '1700000001.0,28-0000075eddac,,-1.25\n'
+                         '1700000000.5,28-0000075eddab,"Fermenter, A",18.062\n',
+                         msg="drain() should append readings as CSV, with a header only at the top of the file")
+        self.assertEqual(len(self.outbox), 0, msg="drain() should remove written readings from the outbox")
+
+    def test_drain_appends_line_protocol(self):
+        self.config_hash["format"] = FILE_FORMAT_LINE_PROTOCOL
+        reporter = FileReporter(self.config_hash, self.logger, self.outbox)
+        self.outbox.append([dict(self.payloads[0], sample_count=3, stddev_degrees_celsius=0.5), self.payloads[1]])
+        reporter.drain()
+        self.assertEqual(self._read_output().splitlines(), [
+            'temperature,thermometer_id=28-0000075eddab,description=Fermenter\\,\\ A '
+            'temperature_degrees_celsius=18.062,stddev_degrees_celsius=0.5,sample_count=3i 1700000000500000000',
+            'temperature,thermometer_id=28-0000075eddac temperature_degrees_celsius=-1.25 1700000001000000000',
+        ], msg="drain() should append readings in line protocol, escaping tag values and omitting empty ones")
+
+    def test_drain_holds_partial_batch_until_linger_expires(self):
+        reporter = FileReporter(self.config_hash, self.logger, self.outbox)
+        self.outbox.append(self.payloads[:1])
+        self.assertEqual(reporter.drain(), [], msg="drain() should hold back a partial batch")
+        self.assertGreater(reporter.seconds_until_flush(), 0,
+                           msg="seconds_until_flush() should wait out the linger time of a partial batch")
+        self.config_hash["max_linger_seconds"] = 0
+        self.assertEqual(FileReporter(self.config_hash, self.logger, self.outbox).drain(), self.payloads[:1],
+                         msg="drain() should write a partial batch once its linger time has passed")
+
+    def test_drain_keeps_readings_it_cannot_write(self):
+        self.config_hash["path"] = os.path.join(self.output_dir.name, 'missing', 'readings.csv')
+        reporter = FileReporter(self.config_hash, self.logger, self.outbox)
+        self.outbox.append(self.payloads)
+        self.assertEqual(reporter.drain(), [], msg="drain() should return nothing if the file cannot be written")
+        self.assertEqual(len(self.outbox), 2, msg="drain() should keep readings it could not write in the outbox")
+        self.assertFalse(reporter.get_connection_stats()['connected'],
+                         msg="get_connection_stats() should report a sink that cannot write as not connected")
+        self.assertGreater(reporter.seconds_until_flush(), 0,
+                           msg="seconds_until_flush() should wait before retrying a failed write")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+import json
+import os
+import socket
+import tempfile
+import unittest
+from logging import getLogger, NullHandler
+from brew_thermometer.gateway import GatewayServer, get_gateway_address
+from tests.test_read_scheduler import FakeClock
+
+
+class TestGatewayServer(unittest.TestCase):
+    def setUp(self):
+        self.logger = getLogger('test_logger')
+        self.logger.addHandler(NullHandler())
+        self.socket_dir = tempfile.TemporaryDirectory()
+        self.socket_path = os.path.join(self.socket_dir.name, 'gateway.sock')
+        self.received = []
+        self.server = GatewayServer({"transport": "unix", "socket_path": self.socket_path}, self.logger,
+                                    self.received.extend)
+        self.server.start()
+        self.client = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.client.bind('')
+        self.client.settimeout(5)
+        self.client.connect(self.socket_path)
+
+    def tearDown(self):
+        self.client.close()
+        self.server.stop(timeout=5)
+        self.socket_dir.cleanup()
+
+    def test_receives_and_acknowledges_batches(self):
+        payloads = [{"thermometer_id": "28-0000075eddab", "temperature_degrees_celsius": 18.062, "timestamp": 1.0}]
+        self.client.send(json.dumps({"batch": 7, "readings": payloads}).encode('utf-8'))
+        self.assertEqual(json.loads(self.client.recv(1024)), {"ack": 7},
+                         msg="the gateway should acknowledge each batch with its batch number")
+        self.assertEqual(self.received, payloads, msg="the gateway should hand the received readings to on_payloads")
+        self.assertEqual(self.server.get_stats(),
+                         {'clients': 1, 'batches_received': 1, 'readings_received': 1, 'malformed_messages': 0},
+                         msg="get_stats() should count the clients, batches and readings received")
+
+    def test_ignores_malformed_messages(self):
+        self.client.send(b'not json')
+        self.client.send(json.dumps({"batch": 8, "readings": [{"temperature_degrees_celsius": 18.0}]}).encode('utf-8'))
+        self.client.send(json.dumps({"batch": 9, "readings": []}).encode('utf-8'))
+        self.assertEqual(json.loads(self.client.recv(1024)), {"ack": 9},
+                         msg="the gateway should only acknowledge well formed batches")
+        self.assertEqual(self.server.get_stats()['malformed_messages'], 2,
+                         msg="get_stats() should count the malformed messages ignored")
+
+    def test_forgets_clients_that_stop_sending(self):
+        clock = FakeClock()
+        self.server._clock = clock
+        self.client.send(json.dumps({"batch": 1, "readings": []}).encode('utf-8'))
+        self.client.recv(1024)
+        # a client that reconnects binds to a new address
+        self.client.close()
+        self.client = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.client.bind('')
+        self.client.settimeout(5)
+        self.client.connect(self.socket_path)
+        clock.now += 200
+        self.client.send(json.dumps({"batch": 2, "readings": []}).encode('utf-8'))
+        self.client.recv(1024)
+        self.assertEqual(self.server.get_stats()['clients'], 2,
+                         msg="get_stats() should count every client that sent a batch recently")
+
+        clock.now += 200
+        self.assertEqual(self.server.get_stats()['clients'], 1,
+                         msg="get_stats() should not count clients that have not sent a batch for "
+                             "client_expiry_seconds")
+        self.assertEqual(len(self.server._clients), 1, msg="the gateway should forget the addresses of expired clients")
+
+    def test_stop_removes_the_socket(self):
+        self.server.stop(timeout=5)
+        self.assertFalse(os.path.exists(self.socket_path), msg="stop() should remove the gateway's socket")
+
+
+class TestGetGatewayAddress(unittest.TestCase):
+    def setUp(self):
+        self.logger = getLogger('test_logger')
+        self.logger.addHandler(NullHandler())
+
+    def test_get_gateway_address(self):
+        self.assertEqual(get_gateway_address({"transport": "udp", "host": "192.168.1.5", "port": 9000}, self.logger),
+                         (socket.AF_INET, ("192.168.1.5", 9000)),
+                         msg="get_gateway_address() should return the host and port of a UDP gateway")
+        self.assertEqual(get_gateway_address({"transport": "carrier pigeon", "socket_path": "/tmp/g.sock"},
+                                             self.logger),
+                         (socket.AF_UNIX, "/tmp/g.sock"),
+                         msg="get_gateway_address() should default to a Unix socket for an invalid transport")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+import os
+import tempfile
+import unittest
+from logging import getLogger, NullHandler
+from unittest.mock import MagicMock, patch
+from brew_thermometer.gateway import GatewayServer
+from brew_thermometer.gateway_reporter import GatewayReporter, STATE_GATEWAY, STATE_FALLBACK
+from brew_thermometer.outbox import Outbox, IN_MEMORY_PATH
+
+
+class TestGatewayReporter(unittest.TestCase):
+    def setUp(self):
+        self.logger = getLogger('test_logger')
+        self.logger.addHandler(NullHandler())
+        self.socket_dir = tempfile.TemporaryDirectory()
+        self.config_hash = {
+            "transport": "unix",
+            "socket_path": os.path.join(self.socket_dir.name, 'gateway.sock'),
+            "max_batch_size": 2,
+            "max_linger_seconds": 60,
+            "ack_timeout_seconds": 1,
+            "retry_seconds": 0,
+        }
+        self.received = []
+        self.server = GatewayServer(self.config_hash, self.logger, self.received.extend)
+        self.outbox = Outbox(IN_MEMORY_PATH, 1000, 0, self.logger)
+        self.fallback = MagicMock()
+        self.fallback.drain = MagicMock(return_value=[])
+        self.reporter = GatewayReporter(self.config_hash, self.logger, self.outbox, lambda: self.fallback)
+        self.payloads = [
+            {"thermometer_id": "28-0000075eddab", "temperature_degrees_celsius": 18.062, "timestamp": 1.0},
+            {"thermometer_id": "28-0000075eddac", "temperature_degrees_celsius": 19.5, "timestamp": 1.0},
+            {"thermometer_id": "28-0000075eddab", "temperature_degrees_celsius": 18.125, "timestamp": 2.0},
+        ]
+
+    def tearDown(self):
+        self.reporter.stop()
+        self.server.stop(timeout=5)
+        self.outbox.close()
+        self.socket_dir.cleanup()
+
+    def test_drain_sends_batches_to_the_gateway(self):
+        self.server.start()
+        self.outbox.append(self.payloads)
+        self.assertEqual(self.reporter.drain(), self.payloads[:2],
+                         msg="drain() should send full batches and return the readings the gateway acknowledged")
+        self.assertEqual(len(self.outbox), 1, msg="drain() should hold back a partial batch until it has lingered")
+        self.assertEqual(self.reporter.drain(force=True), self.payloads[2:],
+                         msg="drain(force=True) should also send a partial batch")
+        self.assertEqual(self.received, self.payloads, msg="the gateway should receive every reading once")
+        self.assertEqual(self.reporter.get_connection_stats()['state'], STATE_GATEWAY,
+                         msg="get_connection_stats() should report readings going through the gateway")
+
+    def test_drain_falls_back_while_the_gateway_is_unreachable(self):
+        self.outbox.append(self.payloads[:2])
+        self.reporter.drain()
+        self.fallback.drain.assert_called_once_with(False)
+        self.assertEqual(len(self.outbox), 2,
+                         msg="drain() should leave readings the gateway did not acknowledge to the fallback reporter")
+        self.assertEqual(self.reporter.get_connection_stats()['state'], STATE_FALLBACK,
+                         msg="get_connection_stats() should report publishing directly while the gateway is down")
+
+        self.server.start()
+        self.assertEqual(self.reporter.drain(), self.payloads[:2],
+                         msg="drain() should send the backlog to the gateway once it can be reached again")
+        self.fallback.stop.assert_called_once_with()
+        self.assertEqual(self.reporter.get_connection_stats()['gateway_fallbacks'], 1,
+                         msg="get_connection_stats() should count the times the reporter fell back")
+
+    def test_send_batch_times_out_once_the_deadline_passes_between_waits(self):
+        gateway_socket = MagicMock()
+        gateway_socket.recv = MagicMock(return_value=b'{"ack": 0}')
+        self.reporter._get_socket = MagicMock(return_value=gateway_socket)
+        # the deadline passes while the stale acknowledgement is being read
+        with patch('brew_thermometer.gateway_reporter.monotonic', side_effect=[0.0, 0.5, 1.5, 1.5]), \
+                self.assertLogs(self.logger, 'WARNING') as logs:
+            self.assertEqual(self.reporter._send_batch([(1, self.payloads[0])]), [],
+                             msg="_send_batch() should return no rows once the acknowledgement deadline has passed")
+
+        gateway_socket.settimeout.assert_called_once_with(0.5)
+        self.assertIn("did not acknowledge", logs.output[0],
+                      msg="_send_batch() should report a timeout rather than a failed send once the deadline passes")
+
+
+if __name__ == '__main__':
+    unittest.main()
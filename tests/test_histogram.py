@@ -0,0 +1,18 @@
+import unittest
+from brew_thermometer.histogram import Histogram
+
+
+class TestHistogram(unittest.TestCase):
+    def test_get_snapshot_returns_cumulative_counts(self):
+        histogram = Histogram((0.1, 1.0, 10.0))
+        for value in (0.05, 0.1, 0.5, 5.0, 50.0):
+            histogram.observe(value)
+
+        self.assertEqual(histogram.get_snapshot(),
+                         {'buckets': [(0.1, 2), (1.0, 3), (10.0, 4)], 'count': 5, 'sum': 55.65},
+                         msg="get_snapshot() should return the cumulative count at or below each bucket bound, the "
+                             "total count and the sum")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,45 @@
+import unittest
+from logging import getLogger, NullHandler
+from unittest.mock import patch
+from brew_thermometer.instrumentation import Instrumentation, NULL_INSTRUMENTATION, STAGE_PUBLISH, FAILURE_IO
+from tests.test_read_scheduler import FakeClock
+
+
+class TestInstrumentation(unittest.TestCase):
+    def setUp(self):
+        self.logger = getLogger('test_logger')
+        self.logger.addHandler(NullHandler())
+        self.clock = FakeClock()
+        self.instrumentation = Instrumentation(60, self.logger, self.clock)
+
+    def test_end_stage_records_timing(self):
+        started = self.instrumentation.start_stage()
+        self.instrumentation.end_stage(STAGE_PUBLISH, started)
+        self.assertEqual(self.instrumentation.get_stage_histograms()[STAGE_PUBLISH]['count'], 1,
+                         msg="end_stage() should record the stage's timing in its histogram")
+
+    def test_count_failure(self):
+        self.instrumentation.count_failure('a', FAILURE_IO)
+        self.instrumentation.count_failure('a', FAILURE_IO)
+        self.assertEqual(self.instrumentation.get_failure_counts()['a'][FAILURE_IO], 2,
+                         msg="count_failure() should count failures per thermometer and kind")
+
+    def test_log_summary_if_due(self):
+        self.instrumentation.end_stage(STAGE_PUBLISH, self.instrumentation.start_stage())
+        with patch.object(self.instrumentation._logger, 'info') as info:
+            self.instrumentation.log_summary_if_due()
+            self.assertFalse(info.called, msg="log_summary_if_due() should not log before the interval has passed")
+
+            self.clock.now += 60
+            self.instrumentation.log_summary_if_due()
+            self.assertTrue(info.called, msg="log_summary_if_due() should log once the interval has passed")
+
+    def test_null_instrumentation_records_nothing(self):
+        NULL_INSTRUMENTATION.end_stage(STAGE_PUBLISH, NULL_INSTRUMENTATION.start_stage())
+        NULL_INSTRUMENTATION.count_failure('a', FAILURE_IO)
+        self.assertEqual((NULL_INSTRUMENTATION.get_stage_histograms(), NULL_INSTRUMENTATION.get_failure_counts()),
+                         ({}, {}), msg="NULL_INSTRUMENTATION should record nothing")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,7 @@
 import unittest
 import logging
-from brew_thermometer.logging import _get_log_level
+from logging.handlers import QueueHandler
+from brew_thermometer.logging import get_logger, _get_log_level, PACKAGE_LOGGER_NAME
 
 
 class TestLogging(unittest.TestCase):
@@ -24,5 +25,19 @@ class TestLogging(unittest.TestCase):
         self.assertEqual(_get_log_level('critical'), logging.CRITICAL,
                          msg="_get_log_level() should return logging.CRITICAL if provided 'critical'")
 
+    def test_get_logger_sets_level(self):
+        logger = get_logger('error', 'brew_thermometer.test_get_logger_sets_level', developer_mode=True)
+        self.assertEqual(logger.level, logging.ERROR, msg="get_logger() should set the logger to the configured level")
+
+    def test_get_logger_shares_one_queue_handler(self):
+        get_logger('info', 'brew_thermometer.test_a', developer_mode=True)
+        get_logger('info', 'brew_thermometer.test_b', developer_mode=True)
+        package_handlers = logging.getLogger(PACKAGE_LOGGER_NAME).handlers
+        self.assertEqual(len([handler for handler in package_handlers if isinstance(handler, QueueHandler)]), 1,
+                         msg="get_logger() should set up a single queue handler however many times it is called")
+        self.assertEqual(logging.getLogger('brew_thermometer.test_a').handlers, [],
+                         msg="get_logger() should not attach handlers to each logger it returns")
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,85 @@
+import json
+import logging
+import unittest
+from urllib.error import HTTPError
+from urllib.request import urlopen
+from brew_thermometer.histogram import Histogram
+from brew_thermometer.metrics_server import MetricsServer, render_prometheus
+
+
+SNAPSHOT = {
+    'thermometers': {
+        '28-0000075eddab': {
+            'description': 'Fermenter "A"',
+            'temperature_degrees_celsius': 18.5,
+            'published': 3,
+            'min': None,
+        },
+    },
+    'buses': {'w1_bus_master1': {'thermometers': 1, 'reads': 4, 'failures': 1}},
+    'sinks': {'dashboard': {'outbox_lag_seconds': 1.5}},
+    'publisher': {'queue_depth': 2},
+    'connection': {'connected': True},
+    'histograms': {'read_duration_seconds': Histogram((0.1, 1.0)).get_snapshot()},
+}
+
+
+class TestMetricsServer(unittest.TestCase):
+    def setUp(self):
+        self.server = MetricsServer('127.0.0.1', 0, logging.getLogger(__name__))
+        self.server.start()
+        self.server.update(SNAPSHOT)
+
+    def tearDown(self):
+        self.server.stop()
+
+    def _get(self, path):
+        with urlopen('http://127.0.0.1:{}{}'.format(self.server.get_port(), path), timeout=5) as response:
+            return response.headers['Content-Type'], response.read().decode('utf-8')
+
+    def test_serves_prometheus_metrics(self):
+        content_type, body = self._get('/metrics')
+        self.assertTrue(content_type.startswith('text/plain'), msg="/metrics should be served as plain text")
+        self.assertIn('brew_thermometer_temperature_degrees_celsius{thermometer="28-0000075eddab",'
+                      'description="Fermenter \\"A\\""} 18.5', body.splitlines(),
+                      msg="/metrics should export the latest temperature of each thermometer")
+
+    def test_serves_json_metrics(self):
+        _, body = self._get('/metrics.json')
+        self.assertEqual(json.loads(body)['thermometers']['28-0000075eddab']['temperature_degrees_celsius'], 18.5,
+                         msg="/metrics.json should serve the snapshot as JSON")
+
+    def test_serves_latest_snapshot(self):
+        self._get('/metrics')
+        self.server.update({'thermometers': {'a': {'temperature_degrees_celsius': 20.0}}})
+        _, body = self._get('/metrics')
+        self.assertIn('brew_thermometer_temperature_degrees_celsius{thermometer="a",description=""} 20.0',
+                      body.splitlines(), msg="/metrics should serve the latest snapshot")
+
+    def test_unknown_path(self):
+        with self.assertRaises(HTTPError, msg="unknown paths should be answered with an error") as context:
+            self._get('/foo')
+        self.assertEqual(context.exception.code, 404, msg="unknown paths should be answered with a 404")
+
+
+class TestRenderPrometheus(unittest.TestCase):
+    def test_render_prometheus(self):
+        lines = render_prometheus(SNAPSHOT).splitlines()
+        self.assertIn('# TYPE brew_thermometer_readings_published_total counter', lines,
+                      msg="render_prometheus() should declare the type of each metric")
+        self.assertIn('brew_thermometer_publish_queue_depth 2', lines,
+                      msg="render_prometheus() should export daemon-wide metrics")
+        self.assertIn('brew_thermometer_bus_read_failures_total{bus="w1_bus_master1"} 1', lines,
+                      msg="render_prometheus() should export per-bus metrics labelled with the bus master")
+        self.assertIn('brew_thermometer_sink_lag_seconds{sink="dashboard"} 1.5', lines,
+                      msg="render_prometheus() should export per-sink metrics labelled with the sink name")
+        self.assertIn('brew_thermometer_broker_connected 1', lines,
+                      msg="render_prometheus() should export booleans as 0 or 1")
+        self.assertIn('brew_thermometer_read_duration_seconds_bucket{le="+Inf"} 0', lines,
+                      msg="render_prometheus() should export histograms")
+        self.assertFalse([line for line in lines if 'recent_min' in line],
+                         msg="render_prometheus() should skip metrics without a value")
+
+
+if __name__ == '__main__':
+    unittest.main()
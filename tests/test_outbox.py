@@ -0,0 +1,68 @@
+import os
+import tempfile
+import unittest
+from logging import getLogger, NullHandler
+from brew_thermometer.outbox import Outbox, IN_MEMORY_PATH
+
+
+class TestOutbox(unittest.TestCase):
+    def setUp(self):
+        self.logger = getLogger('test_logger')
+        self.logger.addHandler(NullHandler())
+        self.payloads = [{"thermometer_id": str(i), "temperature_degrees_celsius": float(i)} for i in range(5)]
+
+    def test_peek_returns_oldest_first(self):
+        outbox = Outbox(IN_MEMORY_PATH, 100, 0, self.logger)
+        outbox.append(self.payloads)
+        self.assertEqual([payload for _, payload in outbox.peek(3)], self.payloads[:3],
+                         msg="peek() should return the oldest payloads first")
+        self.assertEqual(len(outbox), len(self.payloads), msg="peek() should not remove payloads")
+
+    def test_remove(self):
+        outbox = Outbox(IN_MEMORY_PATH, 100, 0, self.logger)
+        outbox.append(self.payloads)
+        outbox.remove([reading_id for reading_id, _ in outbox.peek(2)])
+        self.assertEqual([payload for _, payload in outbox.peek(10)], self.payloads[2:],
+                         msg="remove() should remove the given readings")
+        self.assertEqual(len(outbox), 3, msg="remove() should update the outbox's length")
+
+    def test_evicts_oldest_past_max_readings(self):
+        outbox = Outbox(IN_MEMORY_PATH, 3, 0, self.logger)
+        outbox.append(self.payloads)
+        self.assertEqual([payload for _, payload in outbox.peek(10)], self.payloads[2:],
+                         msg="append() should evict the oldest readings past max_readings")
+
+    def test_evicts_readings_past_max_age(self):
+        outbox = Outbox(IN_MEMORY_PATH, 100, 60, self.logger)
+        outbox.append(self.payloads[:2])
+        outbox._db.execute("UPDATE readings SET created = created - 120")
+        outbox.append(self.payloads[2:])
+        self.assertEqual([payload for _, payload in outbox.peek(10)], self.payloads[2:],
+                         msg="append() should evict readings older than max_age_seconds")
+        self.assertEqual(len(outbox), 3, msg="Evicting readings should update the outbox's length")
+
+    def test_skips_age_eviction_while_oldest_reading_is_fresh(self):
+        outbox = Outbox(IN_MEMORY_PATH, 100, 60, self.logger)
+        outbox.append(self.payloads[:2])
+        statements = []
+        outbox._db.set_trace_callback(statements.append)
+        outbox.append(self.payloads[2:])
+        self.assertFalse([statement for statement in statements if statement.startswith("DELETE")],
+                         msg="append() should only look at the oldest reading while it is within max_age_seconds")
+
+    def test_persists_across_instances(self):
+        with tempfile.TemporaryDirectory() as data_dir:
+            db_path = os.path.join(data_dir, 'outbox.sqlite3')
+            outbox = Outbox(db_path, 100, 0, self.logger)
+            outbox.append(self.payloads)
+            outbox.close()
+
+            outbox = Outbox(db_path, 100, 0, self.logger)
+            self.assertEqual([payload for _, payload in outbox.peek(10)], self.payloads,
+                             msg="Unpublished readings should survive a restart")
+            self.assertEqual(len(outbox), len(self.payloads), msg="The outbox's length should survive a restart")
+            outbox.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
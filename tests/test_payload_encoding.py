@@ -0,0 +1,87 @@
+import json
+import unittest
+from brew_thermometer.payload_encoding import JsonPayloadEncoder, CompactPayloadEncoder, decode_compact_payload, \
+    create_payload_encoder, PAYLOAD_ENCODING_COMPACT, PAYLOAD_ENCODING_JSON
+
+
+class TestPayloadEncoding(unittest.TestCase):
+    def setUp(self):
+        self.payloads = []
+        for i in range(24):
+            self.payloads.append({
+                "thermometer_id": "28-00000000000{}".format(i % 3),
+                "description": "Fermenter {}".format(i % 3),
+                "temperature_degrees_celsius": round(18.0625 - i * 0.125 * (i % 3), 2),
+                "timestamp": 1500000000 + 30 * (i // 3),
+            })
+
+    def test_json_encoder_publishes_bare_payload_without_batching(self):
+        encoder = JsonPayloadEncoder(1)
+        self.assertEqual(json.loads(encoder.encode(self.payloads[:1])), self.payloads[0],
+                         msg="encode() should publish a lone payload bare if batching is disabled")
+
+    def test_json_encoder_wraps_batches(self):
+        encoder = JsonPayloadEncoder(10)
+        self.assertEqual(json.loads(encoder.encode(self.payloads[:3])), {"readings": self.payloads[:3]},
+                         msg="encode() should wrap a batch of payloads in a readings list")
+
+    def test_compact_encoder_round_trips(self):
+        for delta_encoding in (False, True):
+            encoder = CompactPayloadEncoder(delta_encoding)
+            encoded = encoder.encode(self.payloads)
+            decoded = decode_compact_payload(encoded, json.loads(encoder.get_schema_message()))
+            self.assertEqual(decoded, self.payloads,
+                             msg="decode_compact_payload() should return the payloads that were encoded")
+
+    def test_compact_encoder_round_trips_negative_temperatures(self):
+        payloads = [dict(self.payloads[0], temperature_degrees_celsius=-1.25),
+                    dict(self.payloads[0], temperature_degrees_celsius=-3.5, timestamp=1499999990)]
+        encoder = CompactPayloadEncoder(True)
+        decoded = decode_compact_payload(encoder.encode(payloads), json.loads(encoder.get_schema_message()))
+        self.assertEqual(decoded, payloads, msg="The compact encoding should handle negative values and deltas")
+
+    def test_compact_encoder_round_trips_window_summaries(self):
+        summary = {"temperature_degrees_celsius": 18.25, "min_degrees_celsius": 17.94, "max_degrees_celsius": 18.5,
+                   "stddev_degrees_celsius": 0.12, "sample_count": 10, "window_start": 1500000000 - 300,
+                   "window_seconds": 300}
+        payloads = [dict(self.payloads[0], **summary), self.payloads[1],
+                    dict(self.payloads[3], **dict(summary, min_degrees_celsius=18.0, sample_count=9))]
+        for delta_encoding in (False, True):
+            encoder = CompactPayloadEncoder(delta_encoding)
+            encoded = encoder.encode(payloads)
+            schema = json.loads(encoder.get_schema_message())
+            self.assertEqual([sensor.get("window_summary", False) for sensor in schema["sensors"]], [True, False],
+                             msg="The schema should flag the sensors whose records carry window summaries")
+            self.assertEqual(decode_compact_payload(encoded, schema), payloads,
+                             msg="decode_compact_payload() should return the window summaries that were encoded")
+
+    def test_compact_encoder_is_smaller_than_json(self):
+        json_size = len(JsonPayloadEncoder(100).encode(self.payloads))
+        compact_size = len(CompactPayloadEncoder(False).encode(self.payloads))
+        delta_size = len(CompactPayloadEncoder(True).encode(self.payloads))
+        self.assertLess(compact_size * 10, json_size, msg="The compact encoding should be far smaller than JSON")
+        self.assertLess(delta_size, compact_size, msg="Delta encoding should make batches smaller still")
+
+    def test_compact_encoder_schema_version_changes_with_sensors(self):
+        encoder = CompactPayloadEncoder(True)
+        encoder.encode(self.payloads[:1])
+        first_version = encoder.get_schema_version()
+        encoder.encode(self.payloads[:2])
+        self.assertNotEqual(encoder.get_schema_version(), first_version,
+                            msg="The schema version should change when a new sensor is seen")
+
+    def test_decode_rejects_mismatched_schema(self):
+        encoder = CompactPayloadEncoder(True)
+        encoded = encoder.encode(self.payloads[:1])
+        schema = json.loads(encoder.get_schema_message())
+        schema["schema_version"] += 1
+        with self.assertRaises(ValueError):
+            decode_compact_payload(encoded, schema)
+
+    def test_create_payload_encoder(self):
+        self.assertIsInstance(create_payload_encoder(PAYLOAD_ENCODING_COMPACT, 10, True), CompactPayloadEncoder)
+        self.assertIsInstance(create_payload_encoder(PAYLOAD_ENCODING_JSON, 10, True), JsonPayloadEncoder)
+
+
+if __name__ == '__main__':
+    unittest.main()
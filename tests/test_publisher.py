@@ -0,0 +1,108 @@
+import threading
+import time
+import unittest
+from logging import getLogger, NullHandler
+from unittest.mock import MagicMock
+from brew_thermometer.outbox import Outbox, IN_MEMORY_PATH
+from brew_thermometer.publisher import Publisher, ReadingQueue, QUEUE_POLICY_DROP_OLDEST, QUEUE_POLICY_COALESCE, \
+    QUEUE_POLICY_BLOCK
+
+
+def payload(thermometer_id, temp):
+    return {"thermometer_id": thermometer_id, "temperature_degrees_celsius": temp, "timestamp": time.time()}
+
+
+class TestReadingQueue(unittest.TestCase):
+    def test_get_all_returns_queued_payloads_in_order(self):
+        queue = ReadingQueue(10, QUEUE_POLICY_DROP_OLDEST)
+        payloads = [payload(str(i), float(i)) for i in range(3)]
+        for p in payloads:
+            queue.put(p)
+        self.assertEqual(queue.get_all(0), payloads, msg="get_all() should return every queued payload in order")
+        self.assertEqual(len(queue), 0, msg="get_all() should empty the queue")
+
+    def test_drop_oldest(self):
+        queue = ReadingQueue(2, QUEUE_POLICY_DROP_OLDEST)
+        queue.put(payload('a', 1.0))
+        queue.put(payload('b', 2.0))
+        self.assertFalse(queue.put(payload('c', 3.0)), msg="put() should return False if a reading was dropped")
+        self.assertEqual([p['thermometer_id'] for p in queue.get_all(0)], ['b', 'c'],
+                         msg="put() should drop the oldest reading when the queue is full")
+        self.assertEqual(queue.dropped, 1, msg="Dropped readings should be counted")
+
+    def test_coalesce(self):
+        queue = ReadingQueue(2, QUEUE_POLICY_COALESCE)
+        queue.put(payload('a', 1.0))
+        queue.put(payload('b', 2.0))
+        self.assertTrue(queue.put(payload('a', 3.0)), msg="put() should not drop a reading it could coalesce")
+        self.assertEqual([(p['thermometer_id'], p['temperature_degrees_celsius']) for p in queue.get_all(0)],
+                         [('a', 3.0), ('b', 2.0)],
+                         msg="put() should replace a queued reading from the same thermometer")
+        self.assertEqual(queue.coalesced, 1, msg="Coalesced readings should be counted")
+
+    def test_coalesce_only_when_full(self):
+        queue = ReadingQueue(3, QUEUE_POLICY_COALESCE)
+        queue.put(payload('a', 1.0))
+        queue.put(payload('a', 2.0))
+        self.assertEqual([p['temperature_degrees_celsius'] for p in queue.get_all(0)], [1.0, 2.0],
+                         msg="put() should keep every reading while the queue has room")
+        self.assertEqual(queue.coalesced, 0, msg="No readings should be coalesced while the queue has room")
+
+    def test_block(self):
+        queue = ReadingQueue(1, QUEUE_POLICY_BLOCK)
+        queue.put(payload('a', 1.0))
+        putter = threading.Thread(target=queue.put, args=(payload('b', 2.0),))
+        putter.start()
+        putter.join(0.1)
+        self.assertTrue(putter.is_alive(), msg="put() should block while the queue is full")
+
+        self.assertEqual([p['thermometer_id'] for p in queue.get_all(0)], ['a'])
+        putter.join(5)
+        self.assertEqual([p['thermometer_id'] for p in queue.get_all(0)], ['b'],
+                         msg="put() should queue the reading once there is room")
+
+
+class TestPublisher(unittest.TestCase):
+    def setUp(self):
+        self.logger = getLogger('test_logger')
+        self.logger.addHandler(NullHandler())
+        self.queue = ReadingQueue(10, QUEUE_POLICY_DROP_OLDEST)
+        self.outbox = Outbox(IN_MEMORY_PATH, 100, 0, self.logger)
+        self.reporter = MagicMock()
+        self.reporter.seconds_until_flush = MagicMock(return_value=None)
+        self.reported_ids = []
+        self.publisher = Publisher(self.queue, self.outbox, self.reporter, self.reported_ids.extend, self.logger)
+
+    def test_publish_once_stores_queued_readings_and_reports_published(self):
+        self.queue.put(payload('a', 1.0))
+        self.queue.put(payload('b', 2.0))
+        self.reporter.drain = MagicMock(side_effect=lambda: [p for _, p in self.outbox.peek(1)])
+
+        self.publisher.publish_once(0)
+        self.assertEqual(len(self.outbox), 2, msg="publish_once() should move queued readings into the outbox")
+        self.assertEqual(self.reported_ids, ['a'], msg="publish_once() should report the IDs of published readings")
+        self.assertEqual(self.publisher.get_stats()['published'], 1,
+                         msg="publish_once() should record the read to acknowledgement latency of published readings")
+
+    def test_publish_once_without_on_reported(self):
+        publisher = Publisher(self.queue, self.outbox, self.reporter, None, self.logger)
+        self.queue.put(payload('a', 1.0))
+        self.reporter.drain = MagicMock(side_effect=lambda: [p for _, p in self.outbox.peek(1)])
+
+        publisher.publish_once(0)
+        self.assertEqual(publisher.get_stats()['published'], 1,
+                         msg="publish_once() should publish readings when there is no on_reported to tell")
+
+    def test_publishes_on_its_own_thread(self):
+        published = threading.Event()
+        self.reporter.drain = MagicMock(side_effect=lambda: [p for _, p in self.outbox.peek(10)])
+        self.publisher._on_reported = lambda ids: published.set()
+
+        self.publisher.start()
+        self.queue.put(payload('a', 1.0))
+        self.assertTrue(published.wait(5), msg="The publisher thread should publish queued readings")
+        self.publisher.stop(5)
+
+
+if __name__ == '__main__':
+    unittest.main()
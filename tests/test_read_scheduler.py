@@ -0,0 +1,96 @@
+import unittest
+from brew_thermometer.read_scheduler import ReadScheduler
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestReadScheduler(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.scheduler = ReadScheduler(self.clock)
+
+    def test_added_thermometers_are_due_immediately(self):
+        self.scheduler.add('a', 30)
+        self.scheduler.add('b', 10)
+        self.assertEqual(sorted(self.scheduler.pop_due()), ['a', 'b'],
+                         msg="pop_due() should return newly added thermometers")
+
+    def test_pop_due_does_not_return_thermometers_twice(self):
+        self.scheduler.add('a', 30)
+        self.scheduler.pop_due()
+        self.assertEqual(self.scheduler.pop_due(), [],
+                         msg="pop_due() should not return a thermometer again until it is rescheduled")
+
+    def test_per_thermometer_intervals(self):
+        self.scheduler.add('a', 30)
+        self.scheduler.add('b', 10)
+        for thermometer_id in self.scheduler.pop_due():
+            self.scheduler.reschedule(thermometer_id)
+
+        self.assertEqual(self.scheduler.seconds_until_next_due(), 10,
+                         msg="seconds_until_next_due() should return the time until the soonest deadline")
+        self.clock.now += 10
+        self.assertEqual(self.scheduler.pop_due(), ['b'], msg="pop_due() should only return thermometers that are due")
+
+    def test_reschedule_stays_on_grid(self):
+        self.scheduler.add('a', 30)
+        self.scheduler.pop_due()
+        self.clock.now += 2.5  # time spent reading and reporting
+        self.scheduler.reschedule('a')
+
+        self.assertEqual(self.scheduler.seconds_until_next_due(), 27.5,
+                         msg="reschedule() should not let time spent reading push back the next deadline")
+
+    def test_reschedule_skips_missed_deadlines(self):
+        self.scheduler.add('a', 30)
+        self.scheduler.pop_due()
+        self.clock.now += 65
+        self.assertEqual(self.scheduler.reschedule('a'), 2,
+                         msg="reschedule() should return the number of deadlines that were missed")
+        self.assertEqual(self.scheduler.seconds_until_next_due(), 25,
+                         msg="reschedule() should schedule the next read on the next grid slot that has not passed")
+        self.assertEqual(self.scheduler.get_lateness_stats()['missed_deadlines'], 2,
+                         msg="get_lateness_stats() should count missed deadlines")
+
+    def test_retry_does_not_move_grid(self):
+        self.scheduler.add('a', 30)
+        self.scheduler.pop_due()
+        self.scheduler.retry('a', 1)
+        self.clock.now += 1
+        self.assertEqual(self.scheduler.pop_due(), ['a'], msg="retry() should schedule the thermometer after the delay")
+        self.scheduler.reschedule('a')
+        self.assertEqual(self.scheduler.seconds_until_next_due(), 29,
+                         msg="The read after a retry should still be due on the thermometer's grid")
+
+    def test_records_lateness(self):
+        self.scheduler.add('a', 30)
+        self.clock.now += 0.25
+        self.scheduler.pop_due()
+        stats = self.scheduler.get_lateness_stats()
+        self.assertEqual((stats['count'], stats['last_seconds'], stats['max_seconds']), (1, 0.25, 0.25),
+                         msg="pop_due() should record how late each read was relative to its deadline")
+
+    def test_set_interval_pulls_in_pending_deadline(self):
+        self.scheduler.add('a', 30)
+        self.scheduler.pop_due()
+        self.scheduler.reschedule('a')
+        self.scheduler.set_interval('a', 10)
+        self.assertEqual(self.scheduler.seconds_until_next_due(), 10,
+                         msg="set_interval() should pull in the pending deadline if the interval got shorter")
+
+    def test_remove(self):
+        self.scheduler.add('a', 30)
+        self.scheduler.remove('a')
+        self.assertEqual(self.scheduler.pop_due(), [], msg="pop_due() should not return removed thermometers")
+        self.assertIsNone(self.scheduler.seconds_until_next_due(),
+                          msg="seconds_until_next_due() should return None if nothing is scheduled")
+
+
+if __name__ == '__main__':
+    unittest.main()
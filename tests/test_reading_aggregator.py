@@ -0,0 +1,56 @@
+import unittest
+from brew_thermometer.reading_aggregator import ReadingAggregator
+from tests.test_read_scheduler import FakeClock
+
+
+class TestReadingAggregator(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.aggregator = ReadingAggregator(self.clock)
+        self.aggregator.configure('a', 60)
+
+    def test_unaggregated_readings_pass_through(self):
+        self.assertEqual(self.aggregator.add({'a': 18.0, 'b': 19.0}), ({'b': 19.0}, {}),
+                         msg="add() should pass readings of thermometers without a window straight through")
+
+    def test_window_is_summarized_once_it_ends(self):
+        self.clock.now = 1020.0
+        for temp in (18.0, 19.0, 20.0, 21.0):
+            self.aggregator.add({'a': temp})
+            self.clock.now += 10
+        self.assertEqual(self.aggregator.add({}), ({}, {}),
+                         msg="add() should not summarize a window before it has ended")
+
+        self.clock.now += 20
+        _, summaries = self.aggregator.add({})
+        self.assertEqual(summaries, {'a': {
+            'temperature_degrees_celsius': 19.5,
+            'min_degrees_celsius': 18.0,
+            'max_degrees_celsius': 21.0,
+            'stddev_degrees_celsius': 1.118033988749895,
+            'sample_count': 4,
+            'window_start': 1020.0,
+            'window_seconds': 60,
+        }}, msg="add() should summarize each window that has ended")
+
+    def test_windows_are_aligned(self):
+        self.clock.now = 1030.0
+        self.aggregator.add({'a': 18.0})
+        self.clock.now = 1080.0
+        _, summaries = self.aggregator.add({'a': 19.0})
+        self.assertEqual(summaries['a']['window_start'], 1020.0,
+                         msg="add() should align windows to multiples of their length")
+        self.assertEqual(summaries['a']['sample_count'], 1,
+                         msg="add() should count a sample taken after a window ended towards the next window")
+
+    def test_empty_windows_are_not_summarized(self):
+        self.aggregator.add({'a': 18.0})
+        self.clock.now += 60
+        self.aggregator.add({})
+        self.clock.now += 60
+        self.assertEqual(self.aggregator.add({}), ({}, {}),
+                         msg="add() should not summarize windows without samples")
+
+
+if __name__ == '__main__':
+    unittest.main()
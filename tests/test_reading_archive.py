@@ -0,0 +1,114 @@
+import mmap
+import os
+import tempfile
+import unittest
+from logging import getLogger, NullHandler
+from brew_thermometer.reading_archive import ReadingArchive, RECORD
+from tests.test_read_scheduler import FakeClock
+
+
+START = 1700000400
+
+
+class TestReadingArchive(unittest.TestCase):
+    def setUp(self):
+        self.logger = getLogger('test_logger')
+        self.logger.addHandler(NullHandler())
+        self.archive_dir = tempfile.TemporaryDirectory()
+        self.clock = FakeClock()
+        self.archive = self._open_archive()
+
+    def tearDown(self):
+        self.archive.close()
+        self.archive_dir.cleanup()
+
+    def _open_archive(self):
+        return ReadingArchive(self.archive_dir.name, self.logger, segment_seconds=3600, retention_seconds=4 * 3600,
+                              flush_interval_seconds=60, index_bucket_seconds=300, segment_max_records=10000,
+                              clock=self.clock)
+
+    def _append_hours(self, hours, interval_seconds=10):
+        for elapsed in range(0, hours * 3600, interval_seconds):
+            self.archive.append({'a': 18.0 + elapsed % 600 / 100.0, 'b': 20.5}, START + elapsed)
+
+    def _list_segments(self):
+        return sorted(name for name in os.listdir(self.archive_dir.name) if name.endswith('.bin'))
+
+    def test_query(self):
+        self._append_hours(2)
+        self.assertEqual(self.archive.query('a', START + 3590, START + 3620),
+                         [(START + 3590.0, 23.9), (START + 3600.0, 18.0), (START + 3610.0, 18.1)],
+                         msg="query() should return a thermometer's readings in the time range across segments, "
+                             "including readings not yet flushed")
+        self.assertEqual(self.archive.query('c', START, START + 3600), [],
+                         msg="query() should return no readings for a thermometer never archived")
+
+    def test_query_downsampled_uses_indexes(self):
+        self._append_hours(3)
+        from_indexes = self.archive.query_downsampled('a', START, START + 2 * 3600, 600)
+        # 200 seconds is not a multiple of the index bucket, so these buckets are summarized from the records
+        from_records = self.archive.query_downsampled('a', START, START + 2 * 3600, 200)
+        self.assertEqual(from_indexes[0], (START, 20.95, 18.0, 23.9, 60),
+                         msg="query_downsampled() should return the mean, min, max and count of each bucket")
+        self.assertEqual(len(from_indexes), 12, msg="query_downsampled() should return each bucket in the range")
+        self.assertEqual(sum(bucket[4] for bucket in from_indexes), sum(bucket[4] for bucket in from_records),
+                         msg="query_downsampled() should summarize the same readings from indexes as from records")
+
+    def test_segments_roll_and_expire(self):
+        self._append_hours(6, interval_seconds=60)
+        self.assertEqual(len(self._list_segments()), 5,
+                         msg="the archive should start a segment per segment_seconds and delete those past retention")
+        self.assertEqual(self.archive.query('a', START, START + 3600), [],
+                         msg="query() should not return readings from deleted segments")
+
+    def test_reopen(self):
+        self._append_hours(2)
+        self.archive.close()
+        self.archive = self._open_archive()
+        self.assertEqual(len(self.archive.query('b', START, START + 2 * 3600)), 720,
+                         msg="a reopened archive should hold the readings archived before it was closed")
+        self.archive.append({'b': 21.0}, START + 2 * 3600 - 5)
+        self.assertEqual(self.archive.query('b', START + 2 * 3600 - 10, START + 2 * 3600)[-1],
+                         (START + 2 * 3600 - 5.0, 21.0),
+                         msg="a reopened archive should keep appending to its newest segment")
+
+    def test_append_flushes_whole_pages(self):
+        records_per_page = mmap.PAGESIZE // RECORD.size
+        for elapsed in range(records_per_page + 10):
+            self.archive.append({'a': 18.0}, START + elapsed / 10)
+        self.clock.now += 60
+        self.archive.append({'a': 18.0}, START + (records_per_page + 10) / 10)
+        self.assertEqual(self.archive.get_stats()['bytes'], mmap.PAGESIZE,
+                         msg="append() should write only whole pages of buffered readings once the flush interval "
+                             "has passed")
+        self.assertEqual(self.archive.get_stats()['records'], records_per_page + 11,
+                         msg="get_stats() should count the readings still buffered")
+
+    def test_append_writes_a_partial_page_once_its_oldest_reading_has_waited(self):
+        self.archive.append({'a': 18.0, 'b': 20.5}, START)
+        self.clock.now += 60
+        self.archive.append({'a': 18.0, 'b': 20.5}, START + 60)
+        self.assertEqual(self.archive.get_stats()['bytes'], 0,
+                         msg="append() should hold back a partial page of recent readings")
+        self.clock.now += 300
+        self.archive.append({'a': 18.0, 'b': 20.5}, START + 360)
+        self.assertEqual(self.archive.get_stats()['bytes'], 6 * RECORD.size,
+                         msg="append() should write a partial page once its oldest reading has waited "
+                             "MAX_PENDING_FLUSH_INTERVALS flush intervals")
+
+    def test_close_writes_buffered_readings(self):
+        self.archive.append({'a': 18.0}, START)
+        self.archive.close()
+        self.archive = self._open_archive()
+        self.assertEqual(self.archive.query('a', START, START + 1), [(START + 0.0, 18.0)],
+                         msg="close() should write the readings still buffered")
+
+    def test_append_keeps_time_order_when_the_clock_steps_back(self):
+        self.archive.append({'a': 18.0}, START + 100)
+        self.archive.append({'a': 18.5}, START + 50)
+        self.assertEqual(self.archive.query('a', START, START + 200), [(START + 100.0, 18.0), (START + 100.0, 18.5)],
+                         msg="append() should archive a reading timestamped before the previous one at that one's time")
+
+
+if __name__ == '__main__':
+    unittest.main()
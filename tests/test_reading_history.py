@@ -0,0 +1,74 @@
+import unittest
+from brew_thermometer.reading_history import ReadingHistory
+
+
+class TestReadingHistory(unittest.TestCase):
+    def setUp(self):
+        self.history = ReadingHistory(4, ewma_alpha=0.5)
+
+    def _append_all(self, values, start=1000.0, step_seconds=60.0):
+        for i, value in enumerate(values):
+            self.history.append(start + i * step_seconds, value)
+
+    def test_empty_history(self):
+        self.assertIsNone(self.history.get_latest(), msg="get_latest() should return None without readings")
+        self.assertEqual(self.history.get_stats(),
+                         {'count': 0, 'min': None, 'max': None, 'mean': None, 'ewma': None,
+                          'slope_degrees_c_per_hour': None},
+                         msg="get_stats() should return empty statistics without readings")
+
+    def test_get_latest(self):
+        self._append_all([18.0, 18.5])
+        self.assertEqual(self.history.get_latest(), (1060.0, 18.5),
+                         msg="get_latest() should return the most recent reading")
+
+    def test_capacity_is_bounded(self):
+        self._append_all([1.0, 2.0, 3.0, 4.0, 5.0, 6.0])
+        self.assertEqual([value for _, value in self.history.get_readings()], [3.0, 4.0, 5.0, 6.0],
+                         msg="the history should evict its oldest readings once full")
+
+    def test_get_readings_since(self):
+        self._append_all([1.0, 2.0, 3.0])
+        self.assertEqual(self.history.get_readings(since=1060.0), [(1060.0, 2.0), (1120.0, 3.0)],
+                         msg="get_readings() should only return readings taken at or after since")
+
+    def test_get_readings_since_after_wrapping(self):
+        self._append_all([1.0, 2.0, 3.0, 4.0, 5.0, 6.0])
+        self.assertEqual(self.history.get_readings(since=1200.0), [(1240.0, 5.0), (1300.0, 6.0)],
+                         msg="get_readings() should find the readings taken since a timestamp once the buffer wraps")
+
+    def test_rolling_min_max_mean_follow_the_window(self):
+        self._append_all([10.0, 1.0, 5.0, 6.0, 7.0, 8.0])
+        stats = self.history.get_stats()
+        self.assertEqual((stats['min'], stats['max'], stats['mean']), (5.0, 8.0, 6.5),
+                         msg="get_stats() should compute min, max and mean over the buffered readings only")
+
+    def test_ewma(self):
+        self._append_all([10.0, 20.0, 20.0])
+        self.assertEqual(self.history.get_stats()['ewma'], 17.5,
+                         msg="get_stats() should compute an exponentially weighted moving average")
+
+    def test_slope(self):
+        self._append_all([18.0, 18.1, 18.2, 18.3, 18.4, 18.5, 18.6, 18.7, 18.8])
+        self.assertAlmostEqual(self.history.get_slope_degrees_c_per_hour(), 6.0, places=6,
+                               msg="get_slope_degrees_c_per_hour() should return the trend in degrees per hour")
+
+    def test_slope_needs_two_readings(self):
+        self._append_all([18.0])
+        self.assertIsNone(self.history.get_slope_degrees_c_per_hour(),
+                          msg="get_slope_degrees_c_per_hour() should return None with a single reading")
+
+    def test_stats_stay_accurate_over_long_uptimes(self):
+        history = ReadingHistory(8)
+        start = 10 ** 7
+        for i in range(10000):
+            history.append(start + i * 30.0, 20.0 + (i % 8) * 0.5)
+        stats = history.get_stats()
+        self.assertAlmostEqual(stats['mean'], 21.75, places=9,
+                               msg="rolling statistics should not drift after many evictions")
+        self.assertEqual((stats['min'], stats['max']), (20.0, 23.5),
+                         msg="rolling min and max should not drift after many evictions")
+
+
+if __name__ == '__main__':
+    unittest.main()
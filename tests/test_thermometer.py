@@ -1,6 +1,9 @@
+import os
+import tempfile
 import unittest
 from unittest.mock import MagicMock
-from brew_thermometer.thermometer import Thermometer
+from brew_thermometer.thermometer import Thermometer, READ_ATTRIBUTE_TEMPERATURE
+from brew_thermometer.instrumentation import Instrumentation, STAGE_READ_DEVICE, STAGE_PARSE
 from logging import getLogger, NullHandler
 
 
@@ -12,39 +15,39 @@ class TestThermometer(unittest.TestCase):
         self.thermometer = Thermometer(self.device_id, self.logger)
 
     def test__parse_temperature_temp_was_read(self):
-        device_data = """21 01 4b 46 7f ff 0c 10 1e : crc=1e YES
+        device_data = b"""21 01 4b 46 7f ff 0c 10 1e : crc=1e YES
                          21 01 4b 46 7f ff 0c 10 1e t=18062"""
         read_temp, _ = self.thermometer._parse_temperature(device_data)
         self.assertTrue(read_temp, msg="First return tuple value should denote temperature was read")
 
     def test__parse_temperature_temp_was_not_read(self):
-        device_data = """21 01 4b 46 7f ff 0c 10 1e : crc=1e NO
+        device_data = b"""21 01 4b 46 7f ff 0c 10 1e : crc=1e NO
                          21 01 4b 46 7f ff 0c 10 1e t=18062"""
         read_temp, _ = self.thermometer._parse_temperature(device_data)
         self.assertFalse(read_temp, msg="First return tuple response should denote temperature was not read")
 
     def test__parse_temperature_returns_none_for_garbage_input(self):
-        device_data = "foo"
+        device_data = b"foo"
         read_temp, _ = self.thermometer._parse_temperature(device_data)
         self.assertFalse(read_temp, msg="First return tuple value should be False if garbage is supplied for input")
 
     def test__parse_temperature_returns_correct_value(self):
         temp = 18062
-        device_data = """21 01 4b 46 7f ff 0c 10 1e : crc=1e YES
-                         21 01 4b 46 7f ff 0c 10 1e t={0}""".format(temp)
+        device_data = b"""21 01 4b 46 7f ff 0c 10 1e : crc=1e YES
+                         21 01 4b 46 7f ff 0c 10 1e t=%d""" % temp
         _, read_temp = self.thermometer._parse_temperature(device_data)
         self.assertEqual(read_temp, temp, msg="Second return tuple value should be the temperature data value")
 
     def test_get_temperature_returns_read_temperature_value(self):
         temp = 18062
-        device_data = """21 01 4b 46 7f ff 0c 10 1e : crc=1e YES
-                         21 01 4b 46 7f ff 0c 10 1e t={0}""".format(temp)
+        device_data = b"""21 01 4b 46 7f ff 0c 10 1e : crc=1e YES
+                         21 01 4b 46 7f ff 0c 10 1e t=%d""" % temp
         t = Thermometer('28-021564dcdaff', self.logger)
         t._read_device_data = MagicMock(return_value=device_data)
         self.assertEqual(t.get_temperature(), temp, msg="Should return the temperature if it was read")
 
     def test_get_temperature_returns_none_if_temp_was_not_read(self):
-        device_data = """21 01 4b 46 7f ff 0c 10 1e : crc=1e NO
+        device_data = b"""21 01 4b 46 7f ff 0c 10 1e : crc=1e NO
                          21 01 4b 46 7f ff 0c 10 1e t=18062"""
         t = Thermometer('28-021564dcdaff', self.logger)
         t._read_device_data = MagicMock(return_value=device_data)
@@ -52,15 +55,15 @@ class TestThermometer(unittest.TestCase):
 
     def test_get_temperature_c_returns_temp_in_c_if_read(self):
         temp = 18062
-        device_data = """21 01 4b 46 7f ff 0c 10 1e : crc=1e YES
-                         21 01 4b 46 7f ff 0c 10 1e t={0}""".format(temp)
+        device_data = b"""21 01 4b 46 7f ff 0c 10 1e : crc=1e YES
+                         21 01 4b 46 7f ff 0c 10 1e t=%d""" % temp
         t = Thermometer('28-021564dcdaff', self.logger)
         t._read_device_data = MagicMock(return_value=device_data)
         self.assertEqual(t.get_temperature_c(), float(temp) / 1000.0,
                          msg="Should return the temperature in degrees Celsius if it was read")
 
     def test_get_temperature_c_returns_none_if_temp_was_not_read(self):
-        device_data = """21 01 4b 46 7f ff 0c 10 1e : crc=1e NO
+        device_data = b"""21 01 4b 46 7f ff 0c 10 1e : crc=1e NO
                          21 01 4b 46 7f ff 0c 10 1e t=18062"""
         t = Thermometer('28-021564dcdaff', self.logger)
         t._read_device_data = MagicMock(return_value=device_data)
@@ -71,5 +74,107 @@ class TestThermometer(unittest.TestCase):
                          '/sys/bus/w1/devices/{}/w1_slave'.format(self.device_id),
                          msg="Should return the correct path for the device")
 
+    def test__get_device_path_for_attribute(self):
+        self.assertEqual(self.thermometer._get_device_path(self.device_id, READ_ATTRIBUTE_TEMPERATURE),
+                         '/sys/bus/w1/devices/{}/temperature'.format(self.device_id),
+                         msg="Should return the correct path for the given attribute of the device")
+
+    def test__get_device_path_under_devices_root(self):
+        self.assertEqual(self.thermometer._get_device_path(self.device_id, devices_root='/tmp/w1'),
+                         '/tmp/w1/{}/w1_slave'.format(self.device_id),
+                         msg="Should return the path of the device under the given devices root")
+
+    def test_get_temperature_from_temperature_attribute(self):
+        temp = 18062
+        t = Thermometer('28-021564dcdaff', self.logger, read_attribute=READ_ATTRIBUTE_TEMPERATURE)
+        t._read_device_data = MagicMock(return_value=b"%d\n" % temp)
+        self.assertEqual(t.get_temperature(), temp,
+                         msg="Should return the temperature read from the temperature attribute")
+
+    def test_get_temperature_from_temperature_attribute_returns_none_for_garbage_input(self):
+        t = Thermometer('28-021564dcdaff', self.logger, read_attribute=READ_ATTRIBUTE_TEMPERATURE)
+        t._read_device_data = MagicMock(return_value=b"foo")
+        self.assertEqual(t.get_temperature(), None,
+                         msg="Should return None if the temperature attribute does not hold an integer")
+
+    def test_apply_resolution_writes_resolution(self):
+        with tempfile.TemporaryDirectory() as device_dir:
+            t = Thermometer('28-021564dcdaff', self.logger, resolution=9)
+            t._resolution_path = os.path.join(device_dir, 'resolution')
+            self.assertTrue(t.apply_resolution(), msg="Should return True if the resolution was written")
+            with open(t._resolution_path) as r:
+                self.assertEqual(r.read().strip(), '9', msg="Should write the configured resolution to the device")
+
+    def test_apply_resolution_without_resolution(self):
+        self.assertTrue(self.thermometer.apply_resolution(),
+                        msg="Should return True without touching the device if no resolution is configured")
+
+    def test__parse_temperature_returns_negative_value(self):
+        temp = -1250
+        device_data = b"""e4 ff 4b 46 7f ff 0c 10 0b : crc=0b YES
+                         e4 ff 4b 46 7f ff 0c 10 0b t=%d""" % temp
+        self.assertEqual(self.thermometer._parse_temperature(device_data), (True, temp),
+                         msg="Should read temperatures below freezing")
+
+    def test__parse_temperature_returns_none_if_temp_value_is_missing(self):
+        device_data = b"""21 01 4b 46 7f ff 0c 10 1e : crc=1e YES
+                         21 01 4b 46 7f ff 0c 10 1e"""
+        self.assertEqual(self.thermometer._parse_temperature(device_data), (False, None),
+                         msg="Should not read a temperature if there is no t= value")
+
+    def test_get_temperature_reads_device_once(self):
+        device_data = b"""21 01 4b 46 7f ff 0c 10 1e : crc=1e YES
+                         21 01 4b 46 7f ff 0c 10 1e t=18062"""
+        t = Thermometer('28-021564dcdaff', self.logger)
+        t._read_device_data = MagicMock(return_value=device_data)
+        t.get_temperature()
+        t._read_device_data.assert_called_once_with()
+
+    def test_get_temperature_c_returns_zero(self):
+        device_data = b"""00 00 4b 46 7f ff 0c 10 1e : crc=1e YES
+                         00 00 4b 46 7f ff 0c 10 1e t=0"""
+        t = Thermometer('28-021564dcdaff', self.logger)
+        t._read_device_data = MagicMock(return_value=device_data)
+        self.assertEqual(t.get_temperature_c(), 0.0, msg="Should return 0.0 rather than None for a 0 degree reading")
+
+    def test__read_device_data_rereads_open_descriptor(self):
+        with tempfile.TemporaryDirectory() as device_dir:
+            t = Thermometer('28-021564dcdaff', self.logger)
+            t._device_path = os.path.join(device_dir, 'w1_slave')
+            with open(t._device_path, 'wb') as d:
+                d.write(b'first')
+            self.assertEqual(t._read_device_data(), b'first', msg="Should return the data read from the device")
+            fd = t._fd
+
+            with open(t._device_path, 'r+b') as d:
+                d.write(b'again')
+            self.assertEqual(t._read_device_data(), b'again', msg="Should re-read the device from the start")
+            self.assertEqual(t._fd, fd, msg="Should keep the device descriptor open between reads")
+            t.close()
+
+    def test__read_device_data_returns_none_on_error(self):
+        self.assertIsNone(self.thermometer._read_device_data(),
+                          msg="Should return None if the device could not be read")
+        self.assertIsNone(self.thermometer._fd, msg="Should not hold a descriptor for a device that failed to read")
+
+    def test_get_temperature_records_instrumentation(self):
+        instrumentation = Instrumentation(300, self.logger)
+        t = Thermometer('28-021564dcdaff', self.logger, instrumentation=instrumentation)
+        t._read_device_data = MagicMock(return_value=b"""21 01 4b 46 7f ff 0c 10 1e : crc=1e NO
+                         21 01 4b 46 7f ff 0c 10 1e t=18062""")
+        t.get_temperature()
+        t._parse_temperature(b"foo")
+        del t._read_device_data
+        t._device_path = '/nonexistent/w1_slave'
+        t.get_temperature()
+
+        histograms = instrumentation.get_stage_histograms()
+        self.assertEqual((histograms[STAGE_READ_DEVICE]['count'], histograms[STAGE_PARSE]['count']), (2, 1),
+                         msg="get_temperature() should time reading the device and parsing its data")
+        self.assertEqual(instrumentation.get_failure_counts()['28-021564dcdaff'],
+                         {'crc_failures': 1, 'parse_failures': 1, 'io_errors': 1, 'publish_errors': 0},
+                         msg="Should count CRC failures, parse failures and IO errors")
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,201 @@
+import threading
+import unittest
+from logging import getLogger, NullHandler
+from unittest.mock import MagicMock, DEFAULT
+from brew_thermometer.configuration import READ_MODE_SEQUENTIAL, READ_MODE_CONCURRENT, READ_MODE_PER_BUS, \
+    READ_MODE_BULK
+from brew_thermometer.thermometer_reader import ThermometerReader, UNKNOWN_BUS
+from tests.test_read_scheduler import FakeClock
+
+
+class TestThermometerReader(unittest.TestCase):
+    def setUp(self):
+        self.logger = getLogger('test_logger')
+        self.logger.addHandler(NullHandler())
+        self.temps = {'28-00000000000{}'.format(i): float(i) for i in range(4)}
+        self.thermometers = {}
+        for thermometer_id, temp in iter(self.temps.items()):
+            self.thermometers[thermometer_id] = MagicMock()
+            self.thermometers[thermometer_id].get_temperature_c = MagicMock(return_value=temp)
+
+    def test_read_sequential(self):
+        reader = ThermometerReader(self.thermometers, READ_MODE_SEQUENTIAL, 1, self.logger)
+        results = reader.read(list(self.temps.keys()))
+        self.assertEqual({thermometer_id: temp for thermometer_id, (temp, _) in results.items()}, self.temps,
+                         msg="read() should return the temperature read from each thermometer")
+
+    def test_read_records_duration(self):
+        reader = ThermometerReader(self.thermometers, READ_MODE_SEQUENTIAL, 1, self.logger)
+        for _, duration_seconds in reader.read(list(self.temps.keys())).values():
+            self.assertGreaterEqual(duration_seconds, 0, msg="read() should return how long each read took")
+
+    def test_read_concurrent(self):
+        barrier = threading.Barrier(len(self.thermometers), timeout=5)
+
+        def wait_for_all_reads():
+            # every read blocks until all of them are in flight, so this only completes if the reads run concurrently
+            barrier.wait()
+            return DEFAULT
+
+        for thermometer in self.thermometers.values():
+            thermometer.get_temperature_c.side_effect = wait_for_all_reads
+
+        reader = ThermometerReader(self.thermometers, READ_MODE_CONCURRENT, len(self.thermometers), self.logger)
+        results = reader.read(list(self.temps.keys()))
+        self.assertEqual({thermometer_id: temp for thermometer_id, (temp, _) in results.items()}, self.temps,
+                         msg="read() should read all thermometers at once in concurrent read mode")
+
+    def _assign_buses(self, reader, bus_count):
+        reader._thermometer_bus_masters = {
+            thermometer_id: 'w1_bus_master{}'.format(1 + i % bus_count)
+            for i, thermometer_id in enumerate(self.thermometers)
+        }
+
+    def test_read_per_bus_serializes_reads_on_a_bus(self):
+        lock = threading.Lock()
+        in_flight = {'w1_bus_master1': 0, 'w1_bus_master2': 0}
+        max_in_flight = dict(in_flight)
+        barrier = threading.Barrier(2, timeout=5)
+        reader = ThermometerReader(self.thermometers, READ_MODE_PER_BUS, len(self.thermometers), self.logger)
+        self._assign_buses(reader, 2)
+
+        def read_on_bus(master_name):
+            def read():
+                with lock:
+                    first_on_bus = max_in_flight[master_name] == 0
+                    in_flight[master_name] += 1
+                    max_in_flight[master_name] = max(max_in_flight[master_name], in_flight[master_name])
+                if first_on_bus:
+                    # the first read on each bus blocks until the other bus is being read too, so this only completes
+                    # if the buses are read in parallel
+                    barrier.wait()
+                with lock:
+                    in_flight[master_name] -= 1
+                return DEFAULT
+            return read
+
+        for thermometer_id, thermometer in iter(self.thermometers.items()):
+            thermometer.get_temperature_c.side_effect = read_on_bus(reader.get_bus_master_name(thermometer_id))
+
+        results = reader.read(list(self.temps.keys()))
+        self.assertEqual({thermometer_id: temp for thermometer_id, (temp, _) in results.items()}, self.temps,
+                         msg="read() should read every thermometer in per_bus read mode")
+        self.assertEqual(max_in_flight, {'w1_bus_master1': 1, 'w1_bus_master2': 1},
+                         msg="read() should never read two thermometers on the same bus at once in per_bus read mode")
+
+    def test_get_bus_stats(self):
+        self.thermometers['28-000000000000'].get_temperature_c.return_value = None
+        reader = ThermometerReader(self.thermometers, READ_MODE_SEQUENTIAL, 1, self.logger)
+        self._assign_buses(reader, 2)
+        reader.read(list(self.temps.keys()))
+        reader.read(list(self.temps.keys()))
+
+        bus_stats = reader.get_bus_stats()
+        self.assertEqual(sorted(bus_stats), ['w1_bus_master1', 'w1_bus_master2'],
+                         msg="get_bus_stats() should keep stats for each bus master")
+        self.assertEqual((bus_stats['w1_bus_master1']['thermometers'], bus_stats['w1_bus_master1']['reads'],
+                          bus_stats['w1_bus_master1']['failures']), (2, 4, 2),
+                         msg="get_bus_stats() should count the thermometers, reads and failed reads on each bus")
+        self.assertEqual(bus_stats['w1_bus_master2']['failures'], 0,
+                         msg="get_bus_stats() should count failures against the bus they happened on")
+
+    def test_get_bus_stats_unknown_bus(self):
+        reader = ThermometerReader(self.thermometers, READ_MODE_SEQUENTIAL, 1, self.logger)
+        self.assertEqual(reader.get_bus_stats()[UNKNOWN_BUS]['thermometers'], len(self.thermometers),
+                         msg="get_bus_stats() should group thermometers whose bus master is unknown together")
+
+    def test_read_bulk_triggers_one_conversion_per_bus(self):
+        reader = ThermometerReader(self.thermometers, READ_MODE_BULK, 1, self.logger)
+        bus_masters = {'w1_bus_master1': MagicMock(), 'w1_bus_master2': MagicMock()}
+        for bus_master in bus_masters.values():
+            bus_master.trigger_bulk_read = MagicMock(return_value=True)
+        reader._bus_masters = bus_masters
+        self._assign_buses(reader, 2)
+
+        results = reader.read(list(self.temps.keys()))
+        for bus_master in bus_masters.values():
+            bus_master.trigger_bulk_read.assert_called_once_with()
+        self.assertEqual({thermometer_id: temp for thermometer_id, (temp, _) in results.items()}, self.temps,
+                         msg="read() should harvest every thermometer after triggering the bulk conversions")
+
+    def test_read_bulk_falls_back_to_per_device_reads(self):
+        reader = ThermometerReader(self.thermometers, READ_MODE_BULK, 1, self.logger)
+        bus_master = MagicMock()
+        bus_master.trigger_bulk_read = MagicMock(return_value=False)
+        reader._bus_masters = {'w1_bus_master1': bus_master}
+        reader._thermometer_bus_masters = {thermometer_id: 'w1_bus_master1' for thermometer_id in self.thermometers}
+
+        results = reader.read(list(self.temps.keys()))
+        self.assertEqual({thermometer_id: temp for thermometer_id, (temp, _) in results.items()}, self.temps,
+                         msg="read() should fall back to per-device reads if the bus does not support bulk reads")
+
+
+class TestThermometerReaderTimeouts(unittest.TestCase):
+    def setUp(self):
+        self.logger = getLogger('test_logger')
+        self.logger.addHandler(NullHandler())
+        self.clock = FakeClock()
+        self.release_hung_read = threading.Event()
+        self.thermometers = {'healthy': MagicMock(), 'hung': MagicMock()}
+        self.thermometers['healthy'].get_temperature_c = MagicMock(return_value=18.062)
+        self.thermometers['hung'].get_temperature_c = MagicMock(side_effect=self._hang)
+        self.reader = ThermometerReader(self.thermometers, READ_MODE_SEQUENTIAL, 1, self.logger,
+                                        read_timeout_seconds=0.05, quarantine_initial_seconds=10,
+                                        quarantine_max_seconds=30, clock=self.clock)
+
+    def tearDown(self):
+        self.release_hung_read.set()
+
+    def _hang(self):
+        self.release_hung_read.wait(5)
+        return 17.5
+
+    def test_timed_out_read_does_not_hold_up_others(self):
+        results = self.reader.read(['hung', 'healthy'])
+        self.assertEqual(results['hung'][0], None, msg="read() should give up on a read that takes too long")
+        self.assertEqual(results['healthy'][0], 18.062, msg="read() should still read the other thermometers")
+
+    def test_timed_out_thermometer_is_quarantined(self):
+        self.reader.read(['hung', 'healthy'])
+        self.assertEqual(self.reader.get_quarantine_remaining_seconds('hung'), 10,
+                         msg="a thermometer whose read timed out should be quarantined")
+        self.assertEqual(list(self.reader.read(['hung', 'healthy'])), ['healthy'],
+                         msg="read() should skip quarantined thermometers")
+        self.assertEqual(self.reader.get_timeout_stats()['hung']['timeouts'], 1,
+                         msg="get_timeout_stats() should count each thermometer's timeouts")
+
+    def test_quarantine_backs_off_exponentially(self):
+        quarantine_seconds = []
+        for _ in range(4):
+            self.reader.read(['hung'])
+            quarantine_seconds.append(self.reader.get_quarantine_remaining_seconds('hung'))
+            # let the abandoned read return, so the next read is a fresh one that times out again
+            self.release_hung_read.set()
+            self.reader._hung_reads['hung'].result(timeout=5)
+            self.release_hung_read = threading.Event()
+            self.clock.now += quarantine_seconds[-1]
+        self.assertEqual(quarantine_seconds, [10, 20, 30, 30],
+                         msg="each consecutive timeout should double the quarantine, up to quarantine_max_seconds")
+
+    def test_still_hung_read_does_not_escalate_quarantine(self):
+        self.reader.read(['hung'])
+        self.clock.now += 10
+        self.reader.read(['hung'])
+        self.assertEqual(self.reader.get_quarantine_remaining_seconds('hung'), 10,
+                         msg="a read skipped because the previous one is still hung should not double the quarantine")
+        self.assertEqual(self.reader.get_timeout_stats()['hung']['timeouts'], 1,
+                         msg="a read skipped because the previous one is still hung should not count as a timeout")
+
+    def test_quarantine_resets_once_reads_succeed(self):
+        self.reader.read(['hung'])
+        self.release_hung_read.set()
+        self.reader._hung_reads['hung'].result(timeout=5)
+        self.clock.now += 10
+        self.assertEqual(self.reader.read(['hung'])['hung'][0], 17.5,
+                         msg="read() should try a thermometer again once its quarantine is over")
+        self.assertEqual(self.reader.get_timeout_stats()['hung']['consecutive_timeouts'], 0,
+                         msg="a successful read should reset the thermometer's consecutive timeouts")
+
+
+if __name__ == '__main__':
+    unittest.main()